@@ -0,0 +1,148 @@
+import json
+import platform
+import statistics
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+# format of the results file, bumped whenever its layout changes
+BENCHMARK_RESULTS_VERSION = 1
+# a benchmark is a regression when its median time exceeds the baseline median by more than this fraction
+DEFAULT_TOLERANCE = 0.1
+
+
+@dataclass
+class BenchmarkResult:
+    """Wall times of the repeated runs of a benchmark, in seconds."""
+    name: str
+    times: list[float]
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    @property
+    def best(self) -> float:
+        return min(self.times)
+
+
+@dataclass
+class BenchmarkComparison:
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline > 0 else float('inf')
+
+    def is_regression(self, tolerance: float = DEFAULT_TOLERANCE) -> bool:
+        return self.ratio > 1 + tolerance
+
+
+def measure(function: Callable[[], object], repeats: int = 5, warmup: int = 1) -> list[float]:
+    """Measures wall times of repeated calls of a function. The warm-up calls are not measured, so that lazily
+    built tables and caches do not distort the first measurement.
+
+    :param function: function without arguments, inputs are prepared beforehand
+    :param repeats: number of measured calls
+    :param warmup: number of calls before the measured ones
+    :return: wall time of every measured call in seconds
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(
+        benchmarks: dict[str, Callable[[], object]],
+        repeats: int = 5,
+        warmup: int = 1,
+        progress: Callable[[BenchmarkResult], None] | None = None,
+) -> list[BenchmarkResult]:
+    """Measures every benchmark by `measure`.
+
+    :param benchmarks: functions without arguments by unique names
+    :param repeats: number of measured calls of a benchmark
+    :param warmup: number of calls of a benchmark before the measured ones
+    :param progress: called with the result of every finished benchmark
+    :return: results in the order of the benchmarks
+    """
+    results = []
+    for name, function in benchmarks.items():
+        result = BenchmarkResult(name, measure(function, repeats, warmup))
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return results
+
+
+def get_environment() -> dict:
+    """Description of the machine and the versions the benchmarks were run with."""
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def save_results(path_to_file: Path, results: list[BenchmarkResult], environment: dict | None = None) -> None:
+    """Saves results as JSON: the environment and, by benchmark name, the measured times with their median and
+    best time."""
+    path_to_file.parent.mkdir(parents=True, exist_ok=True)
+    content = {
+        'version': BENCHMARK_RESULTS_VERSION,
+        'environment': get_environment() if environment is None else environment,
+        'results': {
+            result.name: {'median': result.median, 'best': result.best, 'times': result.times}
+            for result in results
+        },
+    }
+    path_to_file.write_text(json.dumps(content, indent=2))
+
+
+def load_results(path_to_file: Path) -> list[BenchmarkResult]:
+    content = json.loads(path_to_file.read_text())
+    if content.get('version') != BENCHMARK_RESULTS_VERSION:
+        raise ValueError(f"Unsupported version {content.get('version')} of benchmark results {path_to_file}")
+    return [BenchmarkResult(name, result['times']) for name, result in content['results'].items()]
+
+
+def compare_with_baseline(
+        results: list[BenchmarkResult],
+        baseline: list[BenchmarkResult],
+) -> list[BenchmarkComparison]:
+    """Compares median times of the benchmarks measured in both runs, benchmarks of only one run are skipped.
+
+    :param results: current results
+    :param baseline: results of the reference run, e.g. of the deployed version
+    :return: comparisons in the order of the current results
+    """
+    baseline_medians = {result.name: result.median for result in baseline}
+    return [
+        BenchmarkComparison(result.name, baseline_medians[result.name], result.median)
+        for result in results
+        if result.name in baseline_medians
+    ]
+
+
+def format_comparisons(comparisons: list[BenchmarkComparison], tolerance: float = DEFAULT_TOLERANCE) -> str:
+    lines = [f"{'benchmark':<48}{'baseline [ms]':>15}{'current [ms]':>14}{'ratio':>8}"]
+    for comparison in comparisons:
+        lines.append(
+            f"{comparison.name:<48}{comparison.baseline * 1e3:>15.3f}{comparison.current * 1e3:>14.3f}"
+            f"{comparison.ratio:>8.2f}{'  REGRESSION' if comparison.is_regression(tolerance) else ''}"
+        )
+    return '\n'.join(lines)
+
@@ -0,0 +1,158 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+# bumped whenever the layout of cached arrays changes, so that stale caches are rebuilt
+CACHE_FORMAT_VERSION = 2
+
+
+def get_file_fingerprint(file_path: Path, content_hash: bool = False) -> str:
+    """Identifies a version of a file, either by its size and modification time or by a hash of its content.
+
+    :param file_path: path to the file
+    :param content_hash: whether to hash the content instead of using file metadata
+    :return: fingerprint of the file
+    """
+    if content_hash:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+    stat = file_path.stat()
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+def get_cache_path(file_path: Path) -> Path:
+    return file_path.with_name(file_path.name + '.npz')
+
+
+def load_cached_arrays(file_path: Path, fingerprint: str) -> dict[str, np.ndarray] | None:
+    """Loads arrays cached for a file, if the cache exists and was made from the same version of the file.
+
+    :param file_path: path to the source file
+    :param fingerprint: fingerprint of the source file
+    :return: cached arrays or `None`
+    """
+    cache_path = get_cache_path(file_path)
+    if not cache_path.exists():
+        return None
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            arrays = dict(cache)
+    except (OSError, ValueError):
+        return None
+    if str(arrays.pop('_fingerprint', '')) != fingerprint or \
+            int(arrays.pop('_version', -1)) != CACHE_FORMAT_VERSION:
+        return None
+    return arrays
+
+
+def save_cached_arrays(file_path: Path, fingerprint: str, **arrays: np.ndarray) -> None:
+    """Saves arrays made from a file next to it. The cache is written to a temporary file first, so that
+    an interrupted write does not leave a broken cache behind."""
+    cache_path = get_cache_path(file_path)
+    temporary_path = cache_path.with_name(cache_path.name + '.tmp')
+    with temporary_path.open('wb') as cache_file:
+        np.savez(cache_file, _fingerprint=fingerprint, _version=CACHE_FORMAT_VERSION, **arrays)
+    os.replace(temporary_path, cache_path)
+
+
+# size of a result cache, beyond which the least recently used entries are removed
+DEFAULT_RESULT_CACHE_MAX_BYTES = 256 * 2 ** 20
+# fraction of the maximal size a full cache is shrunk to, so that it is not pruned on every write
+_RESULT_CACHE_PRUNED_FRACTION = 0.9
+
+
+def get_content_key(*parts: str | bytes | np.ndarray) -> str:
+    """Hash of the content of strings and arrays, e.g. of all inputs of a result, as a key of a `ResultCache`."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part).tobytes()
+        elif isinstance(part, str):
+            part = part.encode()
+        # the length separates the parts, so that different splits of the same bytes get different keys
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of results on disk, an `.npy` file per key. Keys are hashes of all inputs of a
+    result (see `get_content_key`), so entries never go stale and are only removed to keep the cache within its
+    size: the least recently used ones first, by their modification times, which are updated on every hit.
+
+    Entries are written to a temporary file and renamed, so processes may share a cache directory.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_RESULT_CACHE_MAX_BYTES) -> None:
+        """
+        :param directory: directory of the cache files, created when it does not exist
+        :param max_bytes: maximal total size of the cache files
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._size = None  # total size of the cache files, scanned on the first write
+        directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self._get_path(key)
+        try:
+            array = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> None:
+        path = self._get_path(key)
+        temporary_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with temporary_path.open('wb') as cache_file:
+            np.save(cache_file, array, allow_pickle=False)
+        os.replace(temporary_path, path)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += path.stat().st_size
+        if self._size > self._max_bytes:
+            self.prune()
+
+    def prune(self, max_bytes: int | None = None) -> int:
+        """Removes the least recently used entries until the cache fits into a size.
+
+        :param max_bytes: size to fit into, a fraction of the maximal size of the cache by default
+        :return: number of removed entries
+        """
+        if max_bytes is None:
+            max_bytes = int(self._max_bytes * _RESULT_CACHE_PRUNED_FRACTION)
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if self._size <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._directory.glob('*.npy'))
+
+    def _scan(self) -> list[tuple[Path, int, int]]:
+        """Path, size and modification time of every entry."""
+        entries = []
+        for path in self._directory.glob('*.npy'):
+            try:
+                stat = path.stat()
+                entries.append((path, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                pass  # removed by another process
+        return entries
+
+    def _get_path(self, key: str) -> Path:
+        return self._directory.joinpath(f'{key}.npy')
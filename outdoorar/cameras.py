@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+from outdoorar import profiling, rendering
+from outdoorar.cache import get_file_fingerprint, load_cached_arrays, save_cached_arrays
+from outdoorar.constants import CAMERAS_DIR
+from outdoorar.rendering import Projections
+
+DEFAULT_CAMERAS_FILE = CAMERAS_DIR.joinpath('cameras.sfm')
+
+
+@dataclass
+class CameraRig:
+    """Cameras of a Meshroom SfM file as contiguous arrays, a row per view in the order of the file. Views
+    without a pose (not reconstructed) are kept with `posed` set to `False` and `nan` rotations and centers, so
+    that image names and sizes of all the views are available."""
+    names: np.ndarray  # image names in upper case, as in `ground_truth.get_views`
+    pose_ids: np.ndarray
+    posed: np.ndarray
+    intrinsics_index: np.ndarray  # row of `intrinsics` of every view, -1 for unknown intrinsics
+    intrinsics: np.ndarray  # a `k x 3 x 4` array of intrinsic matrices
+    rotations: np.ndarray  # a `p x 3 x 3` array of rotations, world to camera
+    centers: np.ndarray  # a `p x 3` matrix of camera centers
+    image_sizes: np.ndarray  # a `p x 2` matrix of image widths and heights
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def extrinsics(self) -> np.ndarray:
+        return rendering.get_extrinsic_matrices(self.rotations, self.centers)
+
+    @property
+    def camera_intrinsics(self) -> np.ndarray:
+        """Intrinsic matrix of every view, a `p x 3 x 4` array, `nan` for unknown intrinsics."""
+        camera_intrinsics = np.full((len(self), 3, 4), np.nan)
+        known = self.intrinsics_index >= 0
+        camera_intrinsics[known] = self.intrinsics[self.intrinsics_index[known]]
+        return camera_intrinsics
+
+    def project(self, points: np.ndarray, near: float = 0.) -> Projections:
+        """Projects points into the images of all the views, see `rendering.project_points`. Points are never in
+        the frustum of views without a pose."""
+        projections = rendering.project_points(
+            points, self.camera_intrinsics, self.extrinsics, self.image_sizes, near
+        )
+        projections.in_frustum &= self.posed[:, np.newaxis]
+        return projections
+
+    @classmethod
+    def from_sfm(cls, cameras: dict) -> CameraRig:
+        """Parses the content of an SfM file. The string fields of all the views are converted at once."""
+        views = cameras['views']
+        intrinsics = cameras.get('intrinsics', [])
+        intrinsics_rows = {intrinsic['intrinsicId']: row for row, intrinsic in enumerate(intrinsics)}
+        transforms = {pose_obj['poseId']: pose_obj['pose']['transform'] for pose_obj in cameras.get('poses', [])}
+
+        focal_lengths = np.array([intrinsic['pxFocalLength'] for intrinsic in intrinsics], dtype=np.float64)
+        principal_points = np.array(
+            [intrinsic['principalPoint'] for intrinsic in intrinsics], dtype=np.float64
+        ).reshape(-1, 2)
+        intrinsic_matrices = np.zeros((len(intrinsics), 3, 4))
+        intrinsic_matrices[:, 0, 0] = focal_lengths
+        intrinsic_matrices[:, 1, 1] = focal_lengths
+        intrinsic_matrices[:, :2, 2] = principal_points
+        intrinsic_matrices[:, 2, 2] = 1
+
+        intrinsics_index = np.array([intrinsics_rows.get(view['intrinsicId'], -1) for view in views], dtype=np.int64)
+        posed = np.array([view['poseId'] in transforms for view in views], dtype=bool) & (intrinsics_index >= 0)
+        rotations = np.full((len(views), 3, 3), np.nan)
+        centers = np.full((len(views), 3), np.nan)
+        posed_transforms = [transforms[view['poseId']] for view, is_posed in zip(views, posed) if is_posed]
+        # rotations are stored column by column
+        rotations[posed] = np.array(
+            [transform['rotation'] for transform in posed_transforms], dtype=np.float64
+        ).reshape(-1, 3, 3).transpose(0, 2, 1)
+        centers[posed] = np.array([transform['center'] for transform in posed_transforms], dtype=np.float64)
+
+        return cls(
+            names=np.array([view['path'][view['path'].rfind('/') + 1:].upper() for view in views], dtype=str),
+            pose_ids=np.array([view['poseId'] for view in views], dtype=str),
+            posed=posed,
+            intrinsics_index=intrinsics_index,
+            intrinsics=intrinsic_matrices,
+            rotations=rotations,
+            centers=centers,
+            image_sizes=np.array(
+                [[view['width'], view['height']] for view in views], dtype=np.int64
+            ).reshape(-1, 2),
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> CameraRig:
+        return cls(**{field.name: arrays[field.name] for field in fields(cls)})
+
+
+def load_camera_rig(cameras_sfm: Path = DEFAULT_CAMERAS_FILE, use_cache: bool = False) -> CameraRig:
+    """Reads the cameras of an SfM file. With `use_cache` the parsed arrays are cached in an `.npz` file next to
+    the SfM file, which is used as long as the hash of the SfM file content does not change. Loading the cache is
+    not faster than parsing a file of a few hundred views, so it is off by default.
+
+    :param cameras_sfm: path to the SfM file
+    :param use_cache: whether to load and save parsed arrays in a cache file
+    :return: the cameras
+    """
+    with profiling.timer('io.cameras'):
+        fingerprint = get_file_fingerprint(cameras_sfm, content_hash=True) if use_cache else None
+        cached_arrays = load_cached_arrays(cameras_sfm, fingerprint) if use_cache else None
+        if cached_arrays is not None:
+            return CameraRig.from_arrays(cached_arrays)
+
+        camera_rig = CameraRig.from_sfm(json.loads(cameras_sfm.read_bytes()))
+        if use_cache:
+            try:
+                save_cached_arrays(cameras_sfm, fingerprint, **camera_rig.to_arrays())
+            except OSError:
+                pass  # e.g. read-only directory, the cache is only an optimization
+        return camera_rig
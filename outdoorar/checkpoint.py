@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_FILE_NAME = 'manifest.json'
+_JOB_SUFFIX = '.npz'
+
+
+def get_parameters_fingerprint(**parameters) -> dict:
+    """JSON-compatible parameters of a run, with arrays replaced by hashes of their content."""
+    def fingerprint(value):
+        if isinstance(value, np.ndarray):
+            return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        if isinstance(value, dict):
+            return {str(key): fingerprint(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [fingerprint(item) for item in value]
+        return value
+
+    return fingerprint(parameters)
+
+
+class JobManifest:
+    """Checkpoints of a long run split into jobs. The manifest records the parameters of the run and every
+    finished job is saved to its own file right away, so a restarted run loads the finished jobs and computes only
+    the rest. A job is finished once its file exists, files are written to a temporary file and renamed.
+    """
+
+    def __init__(self, directory: Path, parameters: dict, resume: bool = True) -> None:
+        """
+        :param directory: directory of the checkpoints of the run
+        :param parameters: JSON-compatible parameters of the run, e.g. from `get_parameters_fingerprint`
+        :param resume: whether to keep checkpoints of a previous run with the same parameters
+        :raises ValueError: when the directory holds checkpoints of a run with other parameters
+        """
+        self._directory = directory
+        manifest_path = directory.joinpath(MANIFEST_FILE_NAME)
+        if not resume:
+            self.clear()
+        if manifest_path.exists():
+            stored_parameters = json.loads(manifest_path.read_text())['parameters']
+            if stored_parameters != json.loads(json.dumps(parameters)):
+                raise ValueError(f"Checkpoints in {directory} are of a run with other parameters, remove them first")
+        else:
+            directory.mkdir(parents=True, exist_ok=True)
+            _write_atomically(manifest_path, json.dumps({'parameters': parameters}, indent=2).encode())
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def completed(self) -> set[str]:
+        return {path.stem for path in self._directory.glob('*' + _JOB_SUFFIX)}
+
+    def save_job(self, job_id: str, **arrays: np.ndarray) -> None:
+        temporary_path = self._get_job_path(job_id).with_suffix('.tmp')
+        with temporary_path.open('wb') as job_file:
+            np.savez(job_file, **arrays)
+        os.replace(temporary_path, self._get_job_path(job_id))
+
+    def load_job(self, job_id: str) -> dict[str, np.ndarray]:
+        with np.load(self._get_job_path(job_id), allow_pickle=False) as job_file:
+            return dict(job_file)
+
+    def clear(self) -> None:
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _get_job_path(self, job_id: str) -> Path:
+        return self._directory.joinpath(job_id + _JOB_SUFFIX)
+
+
+def _write_atomically(path: Path, content: bytes) -> None:
+    temporary_path = path.with_name(path.name + '.tmp')
+    temporary_path.write_bytes(content)
+    os.replace(temporary_path, path)
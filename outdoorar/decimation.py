@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import heapq
+
+import numpy as np
+
+from outdoorar import profiling
+from outdoorar.geometry import Geometry
+
+# weight of the planes that keep boundary edges in place, relative to the planes of the faces
+DEFAULT_BOUNDARY_WEIGHT = 1000.
+# a collapse is rejected when the normal of a face turns by more than the angle of this cosine
+_MIN_NORMAL_COSINE = 0.2
+# the optimal position of a collapsed edge is solved for only when the quadric is well conditioned, otherwise the
+# best of the edge end points and midpoint is taken
+_MIN_QUADRIC_CONDITION = 1e-6
+
+
+def decimate(geometry: Geometry, target_faces: int, boundary_weight: float = DEFAULT_BOUNDARY_WEIGHT) -> Geometry:
+    """Simplifies a triangle mesh by quadric edge collapse (Garland and Heckbert, Surface Simplification Using
+    Quadric Error Metrics, 1997), as the quadric edge collapse decimation of MeshLab.
+
+    Every vertex keeps the sum of the quadrics of the planes of its faces, weighted by the face areas, and edges are
+    collapsed in the order of the error of the merged vertex at its optimal position, until at most `target_faces`
+    faces are left. A collapse is skipped when it would make the mesh non-manifold or flip a face. Vertices at the
+    same position are welded first, unused vertices are dropped, and so are vertex attributes other than the
+    coordinates.
+
+    :param geometry: a triangle mesh
+    :param target_faces: maximal number of faces of the simplified mesh
+    :param boundary_weight: weight of the planes through boundary edges, perpendicular to their faces, which keep
+        the boundaries of open meshes in place
+    :return: the simplified mesh, with fewer faces than `target_faces` only when no more edges can be collapsed
+    """
+    with profiling.timer('decimation.decimate'):
+        positions, faces = _weld(np.asarray(geometry.vertices)[:, :3], np.asarray(geometry.faces).reshape(-1, 3))
+        decimator = _Decimator(positions, faces, boundary_weight)
+        decimator.collapse_edges(target_faces)
+        positions, faces = decimator.get_mesh()
+        return Geometry(geometry.name, positions, faces=faces.astype(np.asarray(geometry.faces).dtype))
+
+
+def _weld(vertices: np.ndarray, faces: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Merges vertices at the same position, drops unused vertices and faces degenerated by the merge."""
+    used = np.unique(faces)
+    positions, inverse = np.unique(vertices[used].astype(np.float64), axis=0, return_inverse=True)
+    vertex_map = np.zeros(len(vertices), dtype=np.int64)
+    vertex_map[used] = inverse.reshape(-1)
+    faces = vertex_map[faces]
+    degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+    return positions, faces[~degenerate]
+
+
+def _get_plane_quadrics(normals: np.ndarray, points: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Quadrics `w * p p^T` of planes `p = (n, -n . x)` given by unit normals `n` and points `x`."""
+    planes = np.concatenate((normals, -np.einsum('ij,ij->i', normals, points)[:, np.newaxis]), axis=1)
+    return weights[:, np.newaxis, np.newaxis] * planes[:, :, np.newaxis] * planes[:, np.newaxis, :]
+
+
+class _Decimator:
+    """State of an edge collapse: the faces of every vertex and a heap of candidate collapses. Heap entries are
+    not removed when their vertices change, they are skipped once the version of either vertex differs."""
+
+    def __init__(self, positions: np.ndarray, faces: np.ndarray, boundary_weight: float) -> None:
+        self.positions = positions.copy()
+        self.faces = faces.copy()
+        self.face_alive = np.ones(len(faces), dtype=bool)
+        self.faces_count = len(faces)
+        self.vertex_faces = [set() for _ in range(len(positions))]
+        for face, vertices in enumerate(faces.tolist()):
+            for vertex in vertices:
+                self.vertex_faces[vertex].add(face)
+        self.versions = np.zeros(len(positions), dtype=np.int64)
+        self.quadrics = self._get_quadrics(boundary_weight)
+
+        edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        edges = np.unique(edges, axis=0)
+        self.heap = []
+        self._push_collapses(edges[:, 0], edges[:, 1])
+
+    def _get_quadrics(self, boundary_weight: float) -> np.ndarray:
+        corners = self.positions[self.faces]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        double_areas = np.linalg.norm(normals, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normals = np.nan_to_num(normals / double_areas[:, np.newaxis])
+        face_quadrics = _get_plane_quadrics(normals, corners[:, 0], double_areas / 2)
+        quadrics = np.zeros((len(self.positions), 4, 4))
+        for corner in range(3):
+            np.add.at(quadrics, self.faces[:, corner], face_quadrics)
+
+        # planes through the boundary edges, the edges of a single face, perpendicular to the face
+        face_edges = self.faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        _, inverse, counts = np.unique(np.sort(face_edges, axis=1), axis=0, return_inverse=True, return_counts=True)
+        boundary = np.flatnonzero(counts[inverse.reshape(-1)] == 1)
+        if len(boundary) > 0:
+            starts, ends = self.positions[face_edges[boundary, 0]], self.positions[face_edges[boundary, 1]]
+            edge_normals = np.cross(ends - starts, normals[boundary // 3])
+            lengths = np.linalg.norm(edge_normals, axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                edge_normals = np.nan_to_num(edge_normals / lengths[:, np.newaxis])
+            edge_quadrics = _get_plane_quadrics(
+                edge_normals, starts, boundary_weight * np.sum((ends - starts) ** 2, axis=1)
+            )
+            np.add.at(quadrics, face_edges[boundary, 0], edge_quadrics)
+            np.add.at(quadrics, face_edges[boundary, 1], edge_quadrics)
+        return quadrics
+
+    def _push_collapses(self, starts: np.ndarray, ends: np.ndarray) -> None:
+        """Adds the collapses of edges to the heap, each with its error and the position of the merged vertex."""
+        if len(starts) == 0:
+            return
+        quadrics = self.quadrics[starts] + self.quadrics[ends]
+        a, b = quadrics[:, :3, :3], -quadrics[:, :3, 3]
+        start_positions, end_positions = self.positions[starts], self.positions[ends]
+        midpoints = (start_positions + end_positions) / 2
+        # the end points, the midpoint and the optimal position, the midpoint again when there is none
+        candidates = np.stack((start_positions, end_positions, midpoints, midpoints), axis=1)
+        traces = np.trace(a, axis1=1, axis2=2)
+        solvable = np.linalg.det(a) > _MIN_QUADRIC_CONDITION * (traces / 3) ** 3
+        solvable &= traces > 0
+        if np.any(solvable):
+            candidates[solvable, 3] = np.linalg.solve(a[solvable], b[solvable, :, np.newaxis])[:, :, 0]
+        homogeneous = np.concatenate((candidates, np.ones((len(starts), 4, 1))), axis=2)
+        errors = np.einsum('kci,kij,kcj->kc', homogeneous, quadrics, homogeneous)
+        best = np.argmin(errors, axis=1)
+        rows = np.arange(len(starts))
+        targets = candidates[rows, best]
+        for error, start, end, target in zip(
+                errors[rows, best].tolist(), starts.tolist(), ends.tolist(), targets.tolist()
+        ):
+            heapq.heappush(self.heap, (error, start, end, int(self.versions[start]), int(self.versions[end]), target))
+
+    def collapse_edges(self, target_faces: int) -> None:
+        while self.faces_count > target_faces and self.heap:
+            _, start, end, start_version, end_version, target = heapq.heappop(self.heap)
+            if self.versions[start] != start_version or self.versions[end] != end_version:
+                continue
+            if self._collapse(start, end, np.array(target)):
+                profiling.count('decimation.collapses')
+            else:
+                profiling.count('decimation.rejected_collapses')
+
+    def _get_neighbors(self, vertex: int) -> set[int]:
+        neighbors = set(self.faces[list(self.vertex_faces[vertex])].reshape(-1).tolist())
+        neighbors.discard(vertex)
+        return neighbors
+
+    def _collapse(self, kept: int, removed: int, target: np.ndarray) -> bool:
+        """Merges vertex `removed` into vertex `kept` at `target`, unless that breaks the mesh."""
+        shared = self.vertex_faces[kept] & self.vertex_faces[removed]
+        # the link condition: the vertices adjacent to both are exactly those of the shared faces, otherwise the
+        # collapse pinches the surface into a non-manifold edge
+        if not shared or len(self._get_neighbors(kept) & self._get_neighbors(removed)) != len(shared):
+            return False
+
+        moved = np.array(sorted((self.vertex_faces[kept] | self.vertex_faces[removed]) - shared))
+        if len(moved) > 0:
+            corners = self.positions[self.faces[moved]]
+            new_corners = corners.copy()
+            new_corners[np.isin(self.faces[moved], (kept, removed))] = target
+            normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+            new_normals = np.cross(new_corners[:, 1] - new_corners[:, 0], new_corners[:, 2] - new_corners[:, 0])
+            cosines = np.einsum('ij,ij->i', normals, new_normals)
+            norms = np.linalg.norm(normals, axis=1) * np.linalg.norm(new_normals, axis=1)
+            if np.any(cosines <= _MIN_NORMAL_COSINE * norms):
+                return False
+
+        for face in shared:
+            self.face_alive[face] = False
+            for vertex in self.faces[face].tolist():
+                self.vertex_faces[vertex].discard(face)
+        self.faces_count -= len(shared)
+        for face in self.vertex_faces[removed]:
+            self.faces[face][self.faces[face] == removed] = kept
+            self.vertex_faces[kept].add(face)
+        self.vertex_faces[removed] = set()
+        self.versions[removed] += 1
+        self.versions[kept] += 1
+        self.positions[kept] = target
+        self.quadrics[kept] += self.quadrics[removed]
+
+        neighbors = np.array(sorted(self._get_neighbors(kept)), dtype=np.int64)
+        self._push_collapses(np.full(len(neighbors), kept), neighbors)
+        return True
+
+    def get_mesh(self) -> tuple[np.ndarray, np.ndarray]:
+        """Positions of the used vertices and the faces left, with vertices renumbered."""
+        faces = self.faces[self.face_alive]
+        used, inverse = np.unique(faces, return_inverse=True)
+        return self.positions[used], inverse.reshape(-1, 3)
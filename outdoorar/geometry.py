@@ -3,9 +3,9 @@ import numpy as np
 
 class Geometry:
     def __init__(self, name: str, vertices: list, faces: list = (), edges: list = ()) -> None:
-        self._vertices = np.array(vertices)
-        self._faces = np.array(faces)
-        self._edges = np.array(edges)
+        self._vertices = np.asarray(vertices)
+        self._faces = np.asarray(faces)
+        self._edges = np.asarray(edges)
         self._name = name or ''
 
     @property
@@ -1,14 +1,25 @@
+from __future__ import annotations
+
 import json
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from outdoorar.constants import RESOURCES_DIR, CAMERAS_DIR, ANNOTATIONS_DIR
+from outdoorar import profiling, rasterization
+from outdoorar.cache import ResultCache, get_content_key
+from outdoorar.cameras import DEFAULT_CAMERAS_FILE, CameraRig, load_camera_rig
+from outdoorar.checkpoint import JobManifest, get_parameters_fingerprint
+from outdoorar.constants import RESOURCES_DIR, CAMERAS_DIR, ANNOTATIONS_DIR, OUTPUT_DIR
+from outdoorar.geometry import Geometry
 from outdoorar.obj_reader import ObjFileReader
+from outdoorar.parallel import SharedArrays, attach_shared_arrays, get_workers_count, release_at_worker_exit
 from outdoorar.ply_reader import PlyFileReader
-from outdoorar.ray_casting import Triangle
-from outdoorar.rendering import get_image_coordinates, is_inside_image
+from outdoorar.ray_casting import BoundingVolumeHierarchy, RayCastingBackend, TriangleMesh, build_intersector
+from outdoorar.results import VisibilityResultsWriter, export_csv
 
 
 def get_cameras(cameras_sfm=CAMERAS_DIR.joinpath('cameras.sfm')):
@@ -92,48 +103,352 @@ def get_extrinsic_matrix(pose, camera_location):
     return extrinsic
 
 
-def calculate_z_buffer(direction_vectors, model_geometry, camera_location):
-    z_buffer = np.ones(direction_vectors.shape[:-1]) * np.infty
+def calculate_z_buffer(
+        direction_vectors,
+        model_geometry: Geometry | TriangleMesh | BoundingVolumeHierarchy,
+        camera_location,
+):
+    if isinstance(model_geometry, Geometry):
+        model_geometry = TriangleMesh.from_geometry(model_geometry)
+    z_buffer, _ = model_geometry.nearest_hit(camera_location, direction_vectors, 0)
+    return z_buffer
 
-    for face in model_geometry.faces:
-        triangle = Triangle(*[model_geometry.vertices[vertex_idx] for vertex_idx in face])
-        intersects, distance = triangle.does_ray_intersect(camera_location, direction_vectors, 0)
-        z_buffer = np.minimum(z_buffer, distance)
 
-    return z_buffer
+def calculate_occlusion(
+        direction_vectors,
+        model_geometry: Geometry | TriangleMesh | BoundingVolumeHierarchy,
+        camera_location,
+        distances,
+):
+    """Checks whether any face lies between the camera and the points given by `direction_vectors`. Unlike
+    `calculate_z_buffer`, the intersections of a ray are not searched for any more once one is found.
+
+    :param direction_vectors: vectors from the camera to the points
+    :param model_geometry: scene geometry
+    :param camera_location: camera center
+    :param distances: squared distances between the camera and the points
+    :return: a boolean ndarray, `True` for the occluded points
+    """
+    if isinstance(model_geometry, Geometry):
+        model_geometry = TriangleMesh.from_geometry(model_geometry)
+    return model_geometry.any_hit(camera_location, direction_vectors, distances, 0)
+
+
+def calculate_camera_visibility(camera_location, annotations, model_mesh, in_frustum: np.ndarray) -> np.ndarray:
+    """Calculates which annotations are visible from a camera. Only the points inside the view frustum are ray
+    cast, against the faces around the segments between them and the camera.
+
+    :param camera_location: camera center
+    :param annotations: an `n x 3` matrix of annotated points
+    :param model_mesh: scene geometry
+    :param in_frustum: which annotations are inside the view frustum, e.g. from `CameraRig.project`
+    :return: a vector of visibility flags, one per annotated point
+    """
+    profiling.count('ground_truth.poses')
+    profiling.count('ground_truth.points', len(annotations))
+    annotations_visible = np.array(in_frustum, dtype=bool)
+    profiling.count('ground_truth.points_culled', np.count_nonzero(~annotations_visible))
+    if not np.any(annotations_visible):
+        return annotations_visible.astype(int)
+
+    with profiling.timer('ground_truth.occlusion'):
+        direction_vectors = np.subtract(annotations[annotations_visible], camera_location)
+        distances = direction_vectors[:, 0] ** 2 + direction_vectors[:, 1] ** 2 + direction_vectors[:, 2] ** 2
+        pose_mesh = model_mesh.crop_to_segments(camera_location, direction_vectors)
+        profiling.count('ground_truth.faces_culled', len(model_mesh) - len(pose_mesh))
+        occluded = calculate_occlusion(direction_vectors, pose_mesh, camera_location, distances)
+    annotations_visible[annotations_visible] = np.logical_not(occluded)
+    return annotations_visible.astype(int)
+
+
+def calculate_depth_map_visibility(
+        model_geometry: Geometry,
+        intrinsic: np.ndarray,
+        extrinsic: np.ndarray,
+        image_size: np.ndarray,
+        pixels: np.ndarray,
+        depths: np.ndarray,
+        in_frustum: np.ndarray,
+        depth_map_scale: float = rasterization.DEFAULT_DEPTH_MAP_SCALE,
+        depth_bias: float = rasterization.DEFAULT_DEPTH_BIAS,
+        cull_back_faces: bool = False,
+) -> np.ndarray:
+    """Calculates which annotations are visible from a camera by a depth map of the scene, see
+    `rasterization.render_depth_map`. The cost depends on the mesh and the depth map resolution, the annotations
+    are only looked up in the depth map.
+
+    The visibility only approximates ray casting: occluders not covering the centre of a depth map pixel are
+    missed, and `depth_bias` trades false occlusion of points on sloped surfaces for false visibility of points just
+    behind a surface.
+
+    :param model_geometry: scene geometry
+    :param intrinsic: camera intrinsic matrix 3 x 4
+    :param extrinsic: camera extrinsic matrix 4 x 4
+    :param image_size: width and height of the image
+    :param pixels: an `n x 2` matrix of image coordinates of the annotations, e.g. from `CameraRig.project`
+    :param depths: depths of the annotations
+    :param in_frustum: which annotations are inside the view frustum
+    :param depth_map_scale: size of the depth map relative to the image
+    :param depth_bias: tolerance of the depth comparison, relative to the depth of the surface
+    :param cull_back_faces: whether to skip back faces, only for closed meshes
+    :return: a vector of visibility flags, one per annotated point
+    """
+    profiling.count('ground_truth.poses')
+    profiling.count('ground_truth.points', len(pixels))
+    profiling.count('ground_truth.points_culled', np.count_nonzero(~np.asarray(in_frustum, dtype=bool)))
+    if not np.any(in_frustum):
+        return np.zeros(len(pixels), dtype=int)
+
+    with profiling.timer('ground_truth.occlusion'):
+        depth_map = rasterization.render_depth_map(
+            model_geometry.vertices, model_geometry.faces, intrinsic, extrinsic, image_size, depth_map_scale,
+            cull_back_faces=cull_back_faces,
+        )
+        visible = rasterization.is_visible_in_depth_map(
+            depth_map, pixels, depths, in_frustum, depth_map_scale, depth_bias
+        )
+    return visible.astype(int)
+
+
+def calculate_visibility_matrix(
+        model_geometry: Geometry,
+        camera_rig: CameraRig,
+        annotations: np.ndarray,
+        backend: RayCastingBackend = RayCastingBackend.BVH,
+) -> np.ndarray:
+    """Calculates visibility of all annotations in all images in memory, e.g. to compare models, unlike
+    `calculate_visibility_from_full_geometry`, which stores the results of every pose.
+
+    :param model_geometry: scene geometry
+    :param camera_rig: the cameras
+    :param annotations: an `n x 3` matrix of annotated points
+    :param backend: ray casting backend
+    :return: a `views x n` matrix of visibility flags in the order of the views of `camera_rig`, zeros for views
+        without a pose
+    """
+    model_mesh = build_intersector(model_geometry, backend)
+    in_frustum = camera_rig.project(annotations).in_frustum
+    visibility = np.zeros((len(camera_rig), len(annotations)), dtype=int)
+    for view in np.flatnonzero(camera_rig.posed):
+        visibility[view] = calculate_camera_visibility(
+            camera_rig.centers[view], annotations, model_mesh, in_frustum[view]
+        )
+    return visibility
+
+
+# per-pose results of all runs, keyed by their inputs
+RESULT_CACHE_DIR = OUTPUT_DIR.joinpath('cache', 'ground_truth')
+# bumped whenever the calculation changes, so that results cached by earlier versions are not reused
+RESULT_CACHE_VERSION = 2
+
+
+def get_pose_cache_keys(scene_fingerprint: dict, camera_rig: CameraRig, views: list[int]) -> list[str]:
+    """Keys of the visibility of poses in a `ResultCache`: hashes of the scene and of the camera of the pose, so
+    that a pose is found again also among other cameras, e.g. when cameras are added to the SfM file.
+
+    :param scene_fingerprint: fingerprint of the mesh, annotations and algorithm parameters, see
+        `checkpoint.get_parameters_fingerprint`
+    :param camera_rig: the cameras
+    :param views: indices of the views of the poses
+    :return: a key per pose
+    """
+    scene = json.dumps({'version': RESULT_CACHE_VERSION, **scene_fingerprint}, sort_keys=True)
+    camera_intrinsics = camera_rig.camera_intrinsics
+    return [
+        get_content_key(
+            scene, camera_intrinsics[view], camera_rig.rotations[view], camera_rig.centers[view],
+            camera_rig.image_sizes[view],
+        )
+        for view in views
+    ]
+
+
+class VisibilityBackend(Enum):
+    RAY_CASTING = 1  # a ray per annotation, exact
+    DEPTH_MAP = 2  # a depth map per pose, see `calculate_depth_map_visibility`
+
+
+# state of a worker process of the pose pool, set once by `_init_pose_worker`
+_pose_worker_state = {}
+
+
+def _init_pose_worker(descriptors, backend, profile, trace, depth_map_options) -> None:
+    if profile:
+        profiling.enable(trace)
+    arrays = attach_shared_arrays(descriptors)
+    model_geometry = Geometry('', arrays['vertices'], faces=arrays['faces'])
+    _pose_worker_state['model_geometry'] = model_geometry
+    # depth maps are rendered from the geometry itself
+    if depth_map_options is None:
+        _pose_worker_state['model_mesh'] = build_intersector(model_geometry, backend)
+    _pose_worker_state['annotations'] = arrays['annotations']
+    _pose_worker_state['depth_map_options'] = depth_map_options
+    release_at_worker_exit(_pose_worker_state)
+
+
+def _calculate_camera_visibility_in_worker(camera_location, in_frustum) -> tuple[np.ndarray, dict | None]:
+    visibility = calculate_camera_visibility(
+        camera_location, _pose_worker_state['annotations'], _pose_worker_state['model_mesh'], in_frustum
+    )
+    # the statistics of the pose are merged into the profiler of the main process
+    profiler = profiling.get_profiler()
+    return visibility, None if profiler is None else profiler.snapshot(reset=True)
 
 
-def calculate_visibility_from_full_geometry(model_file_path, output_file_name=None):
+def _calculate_depth_map_visibility_in_worker(
+        intrinsic, extrinsic, image_size, pixels, depths, in_frustum,
+) -> tuple[np.ndarray, dict | None]:
+    visibility = calculate_depth_map_visibility(
+        _pose_worker_state['model_geometry'], intrinsic, extrinsic, image_size, pixels, depths, in_frustum,
+        **_pose_worker_state['depth_map_options'],
+    )
+    profiler = profiling.get_profiler()
+    return visibility, None if profiler is None else profiler.snapshot(reset=True)
+
+
+def calculate_visibility_from_full_geometry(
+        model_file_path,
+        output_file_name=None,
+        backend: RayCastingBackend = RayCastingBackend.BRUTE_FORCE,
+        workers: int | None = 1,
+        results_path: Path | None = None,
+        resume: bool = True,
+        cameras_sfm: Path = DEFAULT_CAMERAS_FILE,
+        visibility_backend: VisibilityBackend = VisibilityBackend.RAY_CASTING,
+        depth_map_scale: float = rasterization.DEFAULT_DEPTH_MAP_SCALE,
+        depth_bias: float = rasterization.DEFAULT_DEPTH_BIAS,
+        cull_back_faces: bool = False,
+        use_cache: bool = True,
+        cache_path: Path | None = None,
+):
+    """Calculates visibility of all annotations in all images and saves it in a CSV file. The visibility of every
+    pose is stored as soon as it is calculated (see `results.VisibilityResultsWriter`), so an interrupted run can be
+    resumed and continues with the poses that are not stored yet.
+
+    With `use_cache` the visibility of every pose is also kept in a `cache.ResultCache` shared by all runs, keyed by
+    the mesh, the annotations, the algorithm parameters and the camera of the pose. A repeated run, also with other
+    output files or with cameras added, only calculates the poses that are not cached.
+
+    The run is instrumented by `profiling`, the statistics of worker processes are merged into the enabled
+    profiler of the calling process.
+
+    :param model_file_path: path to the scene model
+    :param output_file_name: name of the CSV file in the resources directory
+    :param backend: ray casting backend
+    :param workers: number of processes the poses are distributed to, all CPU cores when `None`
+    :param results_path: directory of the per-pose results, in the output directory by default
+    :param resume: whether to skip the poses with stored results, results of other inputs are only replaced when
+        the result cache is used
+    :param cameras_sfm: path to the SfM file of the cameras
+    :param visibility_backend: whether visibility is decided by ray casting or by depth maps
+    :param depth_map_scale: size of the depth maps relative to the images, for the depth map backend
+    :param depth_bias: tolerance of the depth comparison, for the depth map backend
+    :param cull_back_faces: whether depth maps skip back faces, only for closed meshes
+    :param use_cache: whether to load and save the visibility of poses in the result cache
+    :param cache_path: directory of the result cache, `RESULT_CACHE_DIR` by default
+    """
     if output_file_name is None:
         output_file_name = f"{model_file_path.stem}.csv"
-
-    model_geometry = ObjFileReader(model_file_path).geometry
-    cameras = get_cameras()
-    views = get_views(cameras)
-    intrinsic = get_intrinsic_matrix(cameras)
-    annotations, annotations_info = get_annotations()
-
-    results_df = create_results_dataframe(views, annotations_info)
-
-    for pose_obj in tqdm(get_poses(cameras)):
-        pose = get_pose(pose_obj)
-        camera_location = get_camera_location(pose)
-
-        view = views[get_pose_id(pose_obj)]
-        img_name = view['imgName']
-        image_width, image_height = view['width'], view['height']
-
-        extrinsic = get_extrinsic_matrix(pose, camera_location)
-
-        annotations_coordinates = get_image_coordinates(annotations, intrinsic, extrinsic)
-        annotations_visible = is_inside_image(annotations_coordinates, image_width, image_height)
-        direction_vectors = np.subtract(annotations, camera_location)
-        distances = np.array([sum([vi ** 2 for vi in vector]) for vector in direction_vectors])
-
-        z_buffer = calculate_z_buffer(direction_vectors, model_geometry, camera_location)
-        results_df.loc[img_name] = np.logical_and(
-            z_buffer > distances,
-            annotations_visible,
-        ).astype(int)
-
-    results_df.to_csv(RESOURCES_DIR.joinpath(output_file_name))
+    if results_path is None:
+        results_path = OUTPUT_DIR.joinpath('ground_truth', Path(output_file_name).stem)
+    depth_map_options = None
+    if visibility_backend is VisibilityBackend.DEPTH_MAP:
+        depth_map_options = {
+            'depth_map_scale': depth_map_scale, 'depth_bias': depth_bias, 'cull_back_faces': cull_back_faces,
+        }
+
+    with profiling.timer('ground_truth.load_inputs'):
+        model_geometry = ObjFileReader(model_file_path, use_cache=True).geometry
+        camera_rig = load_camera_rig(cameras_sfm)
+        annotations, annotations_info = get_annotations()
+
+    # the stored rows are only reused for the same inputs, depth maps approximate the visibility by ray casting
+    scene_inputs = dict(
+        vertices=model_geometry.vertices,
+        faces=model_geometry.faces,
+        annotations=annotations,
+        **({} if depth_map_options is None else {'depth_map': depth_map_options}),
+    )
+    result_cache = ResultCache(RESULT_CACHE_DIR if cache_path is None else cache_path) if use_cache else None
+    run_parameters = get_parameters_fingerprint(**scene_inputs, cameras=camera_rig.to_arrays())
+    try:
+        JobManifest(results_path, run_parameters, resume)
+    except ValueError:
+        if result_cache is None:
+            raise
+        # the stored rows are of other inputs, e.g. fewer cameras, the poses they share are in the result cache
+        resume = False
+        JobManifest(results_path, run_parameters, resume)
+    with VisibilityResultsWriter(results_path, annotations_info, resume) as writer:
+        views = [
+            view for view in np.flatnonzero(camera_rig.posed) if camera_rig.names[view] not in writer.completed
+        ]
+        cache_keys = {}
+        if result_cache is not None:
+            with profiling.timer('ground_truth.load_cached_results'):
+                cache_keys = dict(zip(views, get_pose_cache_keys(
+                    get_parameters_fingerprint(**scene_inputs), camera_rig, views
+                )))
+                for view in views:
+                    visibility = result_cache.get(cache_keys[view])
+                    if visibility is not None:
+                        writer.append(camera_rig.names[view], visibility)
+            missing_views = [view for view in views if camera_rig.names[view] not in writer.completed]
+            profiling.count('ground_truth.cache_hits', len(views) - len(missing_views))
+            views = missing_views
+
+        def store_results(view: int, visibility: np.ndarray) -> None:
+            with profiling.timer('ground_truth.write_results'):
+                writer.append(camera_rig.names[view], visibility)
+                if result_cache is not None:
+                    result_cache.put(cache_keys[view], np.asarray(visibility, dtype=np.uint8))
+
+        workers = get_workers_count(workers)
+        with profiling.timer('ground_truth.projection'):
+            projections = camera_rig.project(annotations)
+        if depth_map_options is None:
+            task = _calculate_camera_visibility_in_worker
+            task_arguments = (camera_rig.centers[views], projections.in_frustum[views])
+        else:
+            task = _calculate_depth_map_visibility_in_worker
+            task_arguments = (
+                camera_rig.camera_intrinsics[views], camera_rig.extrinsics[views], camera_rig.image_sizes[views],
+                projections.pixels[views], projections.depths[views], projections.in_frustum[views],
+            )
+
+        if len(views) == 0:
+            pass
+        elif workers == 1:
+            if depth_map_options is None:
+                with profiling.timer('ground_truth.build_intersector'):
+                    model_mesh = build_intersector(model_geometry, backend)
+            for view, arguments in zip(tqdm(views), zip(*task_arguments)):
+                if depth_map_options is None:
+                    visibility = calculate_camera_visibility(arguments[0], annotations, model_mesh, arguments[1])
+                else:
+                    visibility = calculate_depth_map_visibility(model_geometry, *arguments, **depth_map_options)
+                store_results(view, visibility)
+        else:
+            profiler = profiling.get_profiler()
+            with SharedArrays(
+                vertices=model_geometry.vertices,
+                faces=model_geometry.faces,
+                annotations=annotations,
+            ) as shared_arrays, ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_pose_worker,
+                initargs=(
+                    shared_arrays.descriptors, backend,
+                    profiler is not None, profiler is not None and profiler.events is not None,
+                    depth_map_options,
+                ),
+            ) as executor:
+                chunksize = max(1, len(views) // (4 * workers))
+                results = executor.map(task, *task_arguments, chunksize=chunksize)
+                for view, (visibility, statistics) in zip(views, tqdm(results, total=len(views))):
+                    if statistics is not None:
+                        profiler.merge(statistics)
+                    store_results(view, visibility)
+
+    with profiling.timer('ground_truth.export_csv'):
+        export_csv(results_path, RESOURCES_DIR.joinpath(output_file_name), camera_rig.names)
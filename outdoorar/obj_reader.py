@@ -1,36 +1,100 @@
 from __future__ import annotations
 
+import re
 from pathlib import Path
 
+import numpy as np
+
+from outdoorar import profiling
+from outdoorar.cache import get_file_fingerprint, load_cached_arrays, save_cached_arrays
 from outdoorar.geometry import Geometry
 
+_GROUP_PATTERN = re.compile(rb'^g[ \t]+(\S+)', re.MULTILINE)
+_VERTEX_PATTERN = re.compile(rb'^v[ \t]([^\n]*)', re.MULTILINE)
+_FACE_PATTERN = re.compile(rb'^f[ \t]([^\n]*)', re.MULTILINE)
+# texture and normal indices of face vertices, e.g. `/2` in `1/2` or `//2` in `1//2`
+_FACE_VERTEX_SUFFIX_PATTERN = re.compile(rb'/[^ \t\r\n]*')
+
 
 class ObjFileReader:
+    """Reads vertices and faces of an OBJ file. All records of a type are parsed at once into typed arrays.
 
-    def __init__(self, obj_file_path: Path) -> None:
-        self._name = None
-        self._vertices = []
-        self._faces = []
-        with obj_file_path.open('rt') as input_file:
-            for line in input_file:
-                self.parse_line(line)
-
-    def parse_line(self, line: str | None) -> None:
-        tokens = line.rstrip('\n').split()
-        if len(tokens) == 0:
+    With `use_cache` the arrays are cached in an `.npz` file next to the OBJ file, which is used as long as
+    the OBJ file does not change (by its size and modification time, or by a hash of its content). The cache keeps
+    vertex coordinates in double precision, so that it serves loads of any `dtype`.
+    """
+
+    def __init__(
+            self,
+            obj_file_path: Path,
+            use_cache: bool = False,
+            content_hash: bool = False,
+            dtype: np.dtype = np.float64,
+    ) -> None:
+        """
+        :param obj_file_path: path to the OBJ file
+        :param use_cache: whether to load and save parsed arrays in a cache file
+        :param content_hash: whether to validate the cache by a hash of the content instead of file metadata
+        :param dtype: type of vertex coordinates
+        """
+        with profiling.timer('io.obj.load_cache'):
+            fingerprint = get_file_fingerprint(obj_file_path, content_hash) if use_cache else None
+            cached_arrays = load_cached_arrays(obj_file_path, fingerprint) if use_cache else None
+        if cached_arrays is not None:
+            self._name = str(cached_arrays['name']) or None
+            self._vertices = cached_arrays['vertices'].astype(dtype, copy=False)
+            self._faces = cached_arrays['faces']
             return
-        match tokens[0]:
-            case 'g':
-                if len(tokens) > 1:
-                    self._name = tokens[1]
-            case 'v':
-                self._vertices.append([float(x) for x in tokens[1:]])
-            case 'f':
-                self._faces.append([
-                    int(token.split('/')[0])-1  # 0-indexing
-                    for token in tokens[1:]
-                ])
+
+        self.parse(obj_file_path.read_bytes(), np.float64 if use_cache else dtype)
+        if use_cache:
+            try:
+                save_cached_arrays(
+                    obj_file_path,
+                    fingerprint,
+                    name=np.array(self._name or ''),
+                    vertices=self._vertices,
+                    faces=self._faces,
+                )
+            except OSError:
+                pass  # e.g. read-only directory, the cache is only an optimization
+            self._vertices = self._vertices.astype(dtype, copy=False)
+
+    def parse(self, content: bytes, dtype: np.dtype = np.float64) -> None:
+        with profiling.timer('io.obj.parse'):
+            groups = _GROUP_PATTERN.findall(content)
+            self._name = groups[-1].decode() if groups else None
+            self._vertices = _parse_records(_VERTEX_PATTERN.findall(content), dtype, 'vertices')
+            self._faces = _parse_records(
+                _FACE_PATTERN.findall(content), np.int32, 'faces', _FACE_VERTEX_SUFFIX_PATTERN
+            ) - 1  # 0-indexing
 
     @property
     def geometry(self) -> Geometry:
         return Geometry(self._name, self._vertices, faces=self._faces)
+
+
+def _parse_records(
+        records: list[bytes],
+        dtype: np.dtype,
+        records_name: str,
+        ignored_pattern: re.Pattern | None = None,
+) -> np.ndarray:
+    """Parses whitespace separated numbers of records with the same number of values into a matrix.
+
+    :param records: values of records, without the record type
+    :param dtype: type of values
+    :param records_name: name of records used in error messages
+    :param ignored_pattern: parts of values to remove before parsing
+    :return: a matrix with a row per record
+    """
+    if len(records) == 0:
+        return np.empty((0, 3), dtype=dtype)
+    text = b'\n'.join(records)
+    if ignored_pattern is not None:
+        text = ignored_pattern.sub(b'', text)
+    num_values = len(text[:text.find(b'\n')].split()) if len(records) > 1 else len(text.split())
+    values = np.array(text.split(), dtype=dtype)
+    if len(values) != num_values * len(records):
+        raise ValueError(f"Malformed {records_name}, {num_values} numbers per record expected")
+    return values.reshape(len(records), num_values)
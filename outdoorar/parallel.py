@@ -0,0 +1,95 @@
+import os
+from dataclasses import dataclass
+from multiprocessing import shared_memory, util
+from typing import Iterable
+
+import numpy as np
+
+# shared memory blocks attached by the current process, kept alive as long as the arrays are used
+_attached_blocks: dict[str, shared_memory.SharedMemory] = {}
+
+
+@dataclass(frozen=True)
+class SharedArrayDescriptor:
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class SharedArrays:
+    """Read-only arrays copied once to shared memory, so that worker processes of a pool can use them
+    without the arrays being pickled for every task. Workers get the small, picklable `descriptors` (e.g.
+    through the pool initializer) and call `attach_shared_arrays`."""
+
+    def __init__(self, **arrays: np.ndarray) -> None:
+        self._blocks = []
+        self._descriptors = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self._descriptors[key] = SharedArrayDescriptor(block.name, array.shape, array.dtype.str)
+
+    @property
+    def descriptors(self) -> dict[str, SharedArrayDescriptor]:
+        return self._descriptors
+
+    def close(self) -> None:
+        """Removes the blocks, after closing them also where the current process attached them."""
+        detach_shared_arrays(block.name for block in self._blocks)
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> 'SharedArrays':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def attach_shared_arrays(descriptors: dict[str, SharedArrayDescriptor]) -> dict[str, np.ndarray]:
+    arrays = {}
+    for key, descriptor in descriptors.items():
+        if descriptor.name not in _attached_blocks:
+            _attached_blocks[descriptor.name] = shared_memory.SharedMemory(name=descriptor.name)
+        array = np.ndarray(
+            descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=_attached_blocks[descriptor.name].buf
+        )
+        array.flags.writeable = False
+        arrays[key] = array
+    return arrays
+
+
+def detach_shared_arrays(names: Iterable[str] | None = None) -> None:
+    """Closes shared memory blocks attached by the current process. The arrays attached from the blocks must not
+    be referenced any more. The blocks are still removed by the `SharedArrays` that created them.
+
+    :param names: names of the blocks, all the attached blocks by default
+    """
+    for name in list(_attached_blocks) if names is None else list(names):
+        if name in _attached_blocks:
+            _attached_blocks[name].close()
+            del _attached_blocks[name]
+
+
+def release_at_worker_exit(worker_state: dict) -> None:
+    """Clears the state set by the initializer of a pool and detaches all shared arrays when the current worker
+    process exits. Unlike `atexit` handlers, it is also called in forked processes.
+
+    :param worker_state: state of the worker, which may hold attached arrays
+    """
+    def release() -> None:
+        worker_state.clear()
+        detach_shared_arrays()
+
+    util.Finalize(None, release, exitpriority=0)
+
+
+def get_workers_count(workers: int | None) -> int:
+    """Number of worker processes, all CPU cores when `workers` is `None` or not positive."""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
@@ -1,124 +1,138 @@
 from pathlib import Path
-from typing import Callable
 
+import numpy as np
+from numpy.lib import recfunctions
+
+from outdoorar import profiling
 from outdoorar.geometry import Geometry
 
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+_BYTE_ORDERS = {
+    'ascii': '=',
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+}
+
 
 class PlyFileReader:
+    """Reads elements of a PLY file, in ASCII or binary format, into structured arrays with a field per
+    property declared in the header. Only scalar properties are supported (no `property list`)."""
+
     def __init__(self, obj_file_path: Path):
         self._name = obj_file_path.stem
-        self._vertex_properties = []
-        self._vertex_types = []
-        self._vertices = []
-        self._edge_properties = []
-        self._edge_types = []
-        self._edges = []
-        self._vertex_properties_processing = False
-        self._face_properties_processing = False
-        self._num_vertices = 0
-        self._num_faces = 0
-        self._header_complete = False
-        with obj_file_path.open('rt') as input_file:
-            for line in input_file:
-                if not self._header_complete:
-                    self.parse_header(line)
-                elif len(self._vertices) < self._num_vertices:
-                    self.parse_vertex(line)
-                elif len(self._edges) < self._num_faces:
-                    self.parse_edge(line)
-                else:
-                    raise ValueError(f"Unexpected line {line}")
+        self._format = None
+        self._element_names = []
+        self._element_counts = {}
+        self._element_properties = {}
+        self._elements = {}
+
+        content = obj_file_path.read_bytes()
+        header_end = content.find(b'end_header')
+        if header_end < 0:
+            raise ValueError("Missing end_header")
+        body_start = content.find(b'\n', header_end) + 1 or len(content)
+        for line in content[:body_start].decode('ascii').splitlines():
+            self.parse_header(line)
+
+        if self._format is None:
+            raise ValueError("Missing format")
+        with profiling.timer('io.ply.parse'):
+            if self._format == 'ascii':
+                self.parse_ascii_body(content[body_start:])
+            else:
+                self.parse_binary_body(content, body_start)
 
     @property
-    def edges(self):
-        return self._edges
+    def edges(self) -> np.ndarray:
+        return self._elements.get('edge', np.empty(0, dtype=self._get_element_dtype('edge')))
 
     @property
-    def vertices(self):
-        return self._vertices
+    def vertices(self) -> np.ndarray:
+        return self._elements.get('vertex', np.empty(0, dtype=self._get_element_dtype('vertex')))
 
-    def parse_header(self, line: str | None) -> None:
-        tokens = line.rstrip('\n').split()
+    def parse_header(self, line: str) -> None:
+        tokens = line.split()
         if len(tokens) == 0:
             return
 
         match tokens[0]:
-            case 'ply':
-                return
-            case 'comment':
+            case 'ply' | 'comment' | 'obj_info' | 'end_header':
                 return
             case 'format':
-                if tokens[1] != 'ascii':
+                if tokens[1] not in _BYTE_ORDERS:
                     raise ValueError(f"Unknown file format {line}")
-                return
+                self._format = tokens[1]
             case 'element':
-                match tokens[1]:
-                    case 'vertex':
-                        self._vertex_properties_processing = True
-                        self._face_properties_processing = False
-                        self._num_vertices = int(tokens[2])
-                    case 'edge':
-                        self._vertex_properties_processing = False
-                        self._face_properties_processing = True
-                        self._num_faces = int(tokens[2])
-                    case _:
-                        self._vertex_properties_processing = False
-                        self._face_properties_processing = False
+                self._element_names.append(tokens[1])
+                self._element_counts[tokens[1]] = int(tokens[2])
+                self._element_properties[tokens[1]] = []
             case 'property':
-                if self._vertex_properties_processing:
-                    self._vertex_types.append(self._get_python_type(tokens[1]))
-                    self._vertex_properties.append(tokens[2])
-                elif self._face_properties_processing:
-                    self._edge_types.append(self._get_python_type(tokens[1]))
-                    self._edge_properties.append(tokens[2])
-            case 'end_header':
-                self._vertex_properties_processing = False
-                self._face_properties_processing = False
-                self._header_complete = True
+                if len(self._element_names) == 0:
+                    raise ValueError(f"Property outside of an element {line}")
+                if tokens[1] == 'list':
+                    raise ValueError(f"List properties are not supported {line}")
+                self._element_properties[self._element_names[-1]].append((tokens[2], self._get_type(tokens[1])))
             case _:
                 raise ValueError(f"Unexpected token {tokens[0]}")
 
     @classmethod
-    def _get_python_type(cls, ply_type: str) -> Callable:
-        match ply_type:
-            case 'uchar' | 'char' | 'ushort' | 'short' | 'uint' | 'int':
-                return int
-            case 'float' | 'double':
-                return float
-            case _:
-                raise ValueError('Unknown type')
+    def _get_type(cls, ply_type: str) -> str:
+        if ply_type not in _PLY_TYPES:
+            raise ValueError(f'Unknown type {ply_type}')
+        return _PLY_TYPES[ply_type]
 
-    def parse_vertex(self, line: str | None) -> None:
-        tokens = line.rstrip('\n').split()
-        if len(tokens) == 0:
-            return  # empty line, perhaps?
-
-        self._vertices.append(
-            dict(
-                zip(
-                    self._vertex_properties,
-                    [func(x) for x, func in zip(tokens, self._vertex_types)]
-                )
-            )
-        )
-
-    def parse_edge(self, line: str | None) -> None:
-        # self._faces.append([int(token.split('/')[0])-1 for token in tokens[1:]])
-        tokens = line.rstrip('\n').split()
-        if len(tokens) == 0:
-            return  # empty line, perhaps?
+    def _get_element_dtype(self, element_name: str, byte_order: str = '=', float_type: str | None = None) -> np.dtype:
+        return np.dtype([
+            (name, byte_order + (float_type if float_type and ply_type.startswith('f') else ply_type))
+            for name, ply_type in self._element_properties.get(element_name, [])
+        ])
+
+    def parse_binary_body(self, content: bytes, offset: int) -> None:
+        """Reads every element with a single `np.frombuffer` call, directly from the file content."""
+        for element_name in self._element_names:
+            dtype = self._get_element_dtype(element_name, _BYTE_ORDERS[self._format])
+            count = self._element_counts[element_name]
+            if offset + count * dtype.itemsize > len(content):
+                raise ValueError(f"Unexpected end of file in element {element_name}")
+            self._elements[element_name] = np.frombuffer(content, dtype=dtype, count=count, offset=offset)
+            offset += count * dtype.itemsize
+        if len(content[offset:].strip()) > 0:
+            raise ValueError("Unexpected data after the last element")
+
+    def parse_ascii_body(self, body: bytes) -> None:
+        """Parses all values at once and distributes them to the fields of the element arrays. Floating point
+        properties are kept in double precision, as in the text."""
+        values = np.array(body.split(), dtype=np.float64)
+        offset = 0
+        for element_name in self._element_names:
+            dtype = self._get_element_dtype(element_name, float_type='f8')
+            count = self._element_counts[element_name]
+            num_properties = len(dtype.names or ())
+            if offset + count * num_properties > len(values):
+                raise ValueError(f"Unexpected end of file in element {element_name}")
+            element_values = values[offset:offset + count * num_properties].reshape(count, num_properties)
+            self._elements[element_name] = recfunctions.unstructured_to_structured(element_values, dtype=dtype)
+            offset += count * num_properties
+        if offset != len(values):
+            raise ValueError(f"Unexpected values after the last element: {len(values) - offset}")
 
-        self._edges.append(
-            dict(
-                zip(
-                    self._edge_properties,
-                    [func(x) for x, func in zip(tokens, self._edge_types)]
-                )
-            )
-        )
+    def _get_columns(self, element_name: str, property_names: list[str], dtype: np.dtype) -> np.ndarray:
+        if element_name not in self._elements:
+            return np.empty((0, len(property_names)), dtype=dtype)
+        return recfunctions.structured_to_unstructured(self._elements[element_name][property_names], dtype=dtype)
 
     @property
     def geometry(self) -> Geometry:
-        vertices = [[x['x'], x['y'], x['z']] for x in self._vertices]
-        edges = [[x['vertex1'], x['vertex2']] for x in self._edges]
+        vertices = self._get_columns('vertex', ['x', 'y', 'z'], np.float64)
+        edges = self._get_columns('edge', ['vertex1', 'vertex2'], np.int64)
         return Geometry(self._name, vertices, edges=edges)
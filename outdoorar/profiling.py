@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# rates reported in the summary: a counter divided by the total wall time of stages
+_RAY_CASTING_STAGES = ('ray_casting.nearest_hit', 'ray_casting.any_hit')
+RATES = {
+    'ray_casting.rays_per_second': ('ray_casting.rays', _RAY_CASTING_STAGES),
+    'ray_casting.faces_per_second': ('ray_casting.faces_tested', _RAY_CASTING_STAGES),
+}
+
+# the timer of a disabled profiler, shared so that disabled instrumentation does not allocate
+_DISABLED_TIMER = nullcontext()
+
+
+class Profiler:
+    """Wall time of named stages and counters of a run, e.g. of the rays and faces tested by ray casting. The
+    instrumented code calls `timer` and `count`, which do nothing until a profiler is enabled by `enable` or, for
+    a block of code, by `profile`:
+
+        with profiling.profile(summary_path=Path('profile.json'), trace_path=Path('trace.json')):
+            calculate_visibility_from_full_geometry(model_file_path)
+
+    The time of a stage includes the time of the stages nested in it. The trace is in the Chrome trace event
+    format (viewed in `chrome://tracing` or Perfetto), with an event per timed call.
+    """
+
+    def __init__(self, trace: bool = False) -> None:
+        """
+        :param trace: whether to record every timed call for `export_trace`, not only the totals
+        """
+        self.stages: dict[str, list] = {}  # stage -> [calls, total seconds]
+        self.counters: dict[str, int] = {}
+        self.events: list[dict] | None = [] if trace else None
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            statistics = self.stages.setdefault(stage, [0, 0.])
+            statistics[0] += 1
+            statistics[1] += (end - start) * 1e-9
+            if self.events is not None:
+                self.events.append({
+                    'name': stage,
+                    'ph': 'X',
+                    # a monotonic clock shared by all processes, so that events of worker processes line up
+                    'ts': start / 1e3,
+                    'dur': (end - start) / 1e3,
+                    'pid': os.getpid(),
+                    'tid': os.getpid(),
+                })
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + int(value)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """Statistics recorded so far, e.g. to be sent from a worker process and merged by `merge`.
+
+        :param reset: whether to start over with empty statistics
+        """
+        snapshot = {
+            'stages': {stage: list(statistics) for stage, statistics in self.stages.items()},
+            'counters': dict(self.counters),
+            'events': list(self.events or []),
+        }
+        if reset:
+            self.stages.clear()
+            self.counters.clear()
+            if self.events is not None:
+                self.events.clear()
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        for stage, (calls, seconds) in snapshot['stages'].items():
+            statistics = self.stages.setdefault(stage, [0, 0.])
+            statistics[0] += calls
+            statistics[1] += seconds
+        for counter, value in snapshot['counters'].items():
+            self.count(counter, value)
+        if self.events is not None:
+            self.events.extend(snapshot['events'])
+
+    def summary(self) -> dict:
+        rates = {}
+        for rate, (counter, stages) in RATES.items():
+            seconds = sum(self.stages[stage][1] for stage in stages if stage in self.stages)
+            if counter in self.counters and seconds > 0:
+                rates[rate] = self.counters[counter] / seconds
+        return {
+            'stages': {
+                stage: {'calls': calls, 'seconds': seconds, 'mean_seconds': seconds / calls}
+                for stage, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1])
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'rates': rates,
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"{'stage':<40}{'calls':>10}{'total [s]':>12}{'mean [ms]':>12}"]
+        for stage, statistics in summary['stages'].items():
+            lines.append(
+                f"{stage:<40}{statistics['calls']:>10}{statistics['seconds']:>12.3f}"
+                f"{statistics['mean_seconds'] * 1e3:>12.3f}"
+            )
+        for name, value in [*summary['counters'].items(), *summary['rates'].items()]:
+            lines.append(f"{name:<40}{value:>22,.0f}")
+        return '\n'.join(lines)
+
+    def export_summary(self, path_to_file: Path) -> None:
+        path_to_file.parent.mkdir(parents=True, exist_ok=True)
+        path_to_file.write_text(json.dumps(self.summary(), indent=2))
+
+    def export_trace(self, path_to_file: Path) -> None:
+        if self.events is None:
+            raise ValueError("Trace events are not recorded, enable the profiler with trace=True")
+        path_to_file.parent.mkdir(parents=True, exist_ok=True)
+        path_to_file.write_text(json.dumps({'traceEvents': self.events, 'displayTimeUnit': 'ms'}))
+
+
+# the enabled profiler, if any
+_state: dict[str, Profiler | None] = {'profiler': None}
+
+
+def enable(trace: bool = False) -> Profiler:
+    """Starts recording with a new profiler.
+
+    :param trace: whether to record every timed call, see `Profiler.export_trace`
+    :return: the enabled profiler
+    """
+    _state['profiler'] = Profiler(trace)
+    return _state['profiler']
+
+
+def disable() -> Profiler | None:
+    """Stops recording.
+
+    :return: the profiler enabled until now, if any
+    """
+    profiler, _state['profiler'] = _state['profiler'], None
+    return profiler
+
+
+def get_profiler() -> Profiler | None:
+    return _state['profiler']
+
+
+def is_enabled() -> bool:
+    return _state['profiler'] is not None
+
+
+def timer(stage: str):
+    """Context manager measuring the wall time of a stage, when a profiler is enabled."""
+    profiler = _state['profiler']
+    return _DISABLED_TIMER if profiler is None else profiler.timer(stage)
+
+
+def count(counter: str, value: int = 1) -> None:
+    """Increments a counter, when a profiler is enabled."""
+    profiler = _state['profiler']
+    if profiler is not None:
+        profiler.count(counter, value)
+
+
+@contextmanager
+def profile(summary_path: Path | None = None, trace_path: Path | None = None):
+    """Profiles a block of code and exports the results at its end, also when it raises.
+
+    :param summary_path: path to the JSON summary, not exported when `None`
+    :param trace_path: path to the trace, not recorded when `None`
+    """
+    profiler = enable(trace=trace_path is not None)
+    try:
+        yield profiler
+    finally:
+        disable()
+        if summary_path is not None:
+            profiler.export_summary(summary_path)
+        if trace_path is not None:
+            profiler.export_trace(trace_path)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import numpy as np
+
+from outdoorar import profiling
+
+# size of depth maps relative to the images
+DEFAULT_DEPTH_MAP_SCALE = 0.25
+# a point is visible when its depth exceeds the depth of the surface in its pixel by at most this fraction
+DEFAULT_DEPTH_BIAS = 0.005
+# maximal number of pixels of face bounding boxes rasterized at once
+DEFAULT_CHUNK_SIZE = 2 ** 22
+# depth of the near plane the faces are clipped against, in scene units
+DEFAULT_NEAR = 0.01
+
+
+def get_depth_map_size(image_size: np.ndarray | tuple[int, int], scale: float) -> tuple[int, int]:
+    """Width and height of the depth map of an image."""
+    return int(np.ceil(image_size[0] * scale)), int(np.ceil(image_size[1] * scale))
+
+
+def render_depth_map(
+        vertices: np.ndarray,
+        faces: np.ndarray,
+        intrinsic: np.ndarray,
+        extrinsic: np.ndarray,
+        image_size: np.ndarray | tuple[int, int],
+        scale: float = DEFAULT_DEPTH_MAP_SCALE,
+        near: float = DEFAULT_NEAR,
+        cull_back_faces: bool = False,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """Renders the depth of the nearest surface in every pixel with a vectorized z-buffer. The pixels of the
+    bounding boxes of the projected faces are tested at once, in chunks of faces with boxes of similar size, and
+    the nearest depth of every pixel is kept. Depths are interpolated perspective-correctly, at the pixel centres.
+
+    Faces are clipped against the near plane, so that faces passing by the camera still occlude what is behind
+    them. Parts of faces outside the image are not clipped, the rasterized pixels are limited to the depth map.
+
+    :param vertices: an `n x 3` matrix of vertex coordinates
+    :param faces: an `m x 3` matrix of vertex indices
+    :param intrinsic: camera intrinsic matrix 3 x 4
+    :param extrinsic: camera extrinsic matrix 4 x 4
+    :param image_size: width and height of the image
+    :param scale: size of the depth map relative to the image
+    :param near: depth of the near plane, positive
+    :param cull_back_faces: whether to skip faces whose vertices are clockwise as seen from the camera, which hides
+        no surface of a closed mesh with counter-clockwise faces
+    :param chunk_size: maximal number of pixels of face bounding boxes rasterized at once
+    :return: a `height x width` depth map, `inf` where no face is visible
+    """
+    with profiling.timer('rasterization.render_depth_map'):
+        width, height = get_depth_map_size(image_size, scale)
+        depth_map = np.full(width * height, np.inf)
+
+        camera = np.matmul(intrinsic, extrinsic)
+        homogeneous = np.matmul(vertices[:, :3], camera[:, :3].T) + camera[:, 3]
+        corners = _clip_faces(homogeneous[np.asarray(faces).reshape(-1, 3)], near)
+        face_depths = corners[:, :, 2]
+        face_pixels = corners[:, :, :2] / face_depths[:, :, np.newaxis] * scale
+
+        if cull_back_faces:
+            # counter-clockwise in the image, whose y axis points down, is clockwise as seen from the camera
+            edges = face_pixels[:, 1:] - face_pixels[:, :1]
+            front = edges[:, 0, 0] * edges[:, 1, 1] - edges[:, 0, 1] * edges[:, 1, 0] < 0
+            face_pixels, face_depths = face_pixels[front], face_depths[front]
+
+        # pixels whose centres may lie in the faces
+        first = np.maximum(np.ceil(face_pixels.min(axis=1) - 0.5), 0).astype(np.int64)
+        last = np.minimum(np.floor(face_pixels.max(axis=1) - 0.5), [width - 1, height - 1]).astype(np.int64)
+        box_sizes = last - first + 1
+        covering = np.all(box_sizes > 0, axis=1)
+        first, box_sizes = first[covering], box_sizes[covering]
+        profiling.count('rasterization.faces', len(first))
+
+        # edge functions and 1 / depth of the faces as planes in image coordinates, `a * x + b * y + c`
+        planes = _get_face_planes(face_pixels[covering], face_depths[covering])
+
+        # faces are rasterized in groups of the same bounding box size, rounded up to powers of 2, so that the
+        # pixels of a group are a dense `faces x height x width` array
+        box_exponents = np.ceil(np.log2(box_sizes)).astype(np.int64)
+        groups = box_exponents[:, 0] * 64 + box_exponents[:, 1]
+        for group in np.unique(groups):
+            group_faces = np.flatnonzero(groups == group)
+            box_width, box_height = 2 ** (group // 64), 2 ** (group % 64)
+            step = max(1, chunk_size // (box_width * box_height))
+            for start in range(0, len(group_faces), step):
+                chunk = group_faces[start:start + step]
+                _rasterize(depth_map, width, height, planes[chunk], first[chunk], box_width, box_height)
+        return depth_map.reshape(height, width)
+
+
+def _clip_faces(corners: np.ndarray, near: float) -> np.ndarray:
+    """Clips faces against the near plane. The homogeneous image coordinates are linear along the edges, so the
+    corners on the near plane are interpolated between the corners in front of it and behind it. A face with a
+    single corner behind the plane becomes two faces, the order of corners keeps the orientation of the faces.
+
+    :param corners: an `m x 3 x 3` array of homogeneous image coordinates of the face vertices, depth last
+    :param near: depth of the near plane
+    :return: a `k x 3 x 3` array of homogeneous image coordinates of the faces in front of the near plane
+    """
+    behind = corners[:, :, 2] < near
+    behind_counts = np.count_nonzero(behind, axis=1)
+    clipped = [corners[behind_counts == 0]]
+    for count in (1, 2):
+        faces = np.flatnonzero(behind_counts == count)
+        # the corners in the order of the face, starting with the corner on the other side than the rest
+        first = np.argmax(behind[faces] if count == 1 else ~behind[faces], axis=1)
+        a, b, c = (corners[faces, (first + corner) % 3] for corner in range(3))
+        ab = a + (b - a) * ((near - a[:, 2]) / (b[:, 2] - a[:, 2]))[:, np.newaxis]
+        ac = a + (c - a) * ((near - a[:, 2]) / (c[:, 2] - a[:, 2]))[:, np.newaxis]
+        if count == 1:
+            clipped.extend((np.stack((ab, b, c), axis=1), np.stack((ab, c, ac), axis=1)))
+        else:
+            clipped.append(np.stack((a, ab, ac), axis=1))
+    return np.concatenate(clipped)
+
+
+def _get_face_planes(face_pixels: np.ndarray, face_depths: np.ndarray) -> np.ndarray:
+    """Coefficients `a, b, c` of the planes `a * x + b * y + c` of faces in image coordinates: three barycentric
+    coordinates, from the edge functions normalized by the face areas, and the inverse depth, which is linear in
+    image coordinates.
+
+    :param face_pixels: an `m x 3 x 2` array of image coordinates of the face vertices
+    :param face_depths: an `m x 3` matrix of depths of the face vertices
+    :return: an `m x 4 x 3` array of plane coefficients
+    """
+    x, y = face_pixels[:, :, 0], face_pixels[:, :, 1]
+    planes = np.empty((len(face_pixels), 4, 3))
+    for vertex, (b, c) in enumerate(((1, 2), (2, 0), (0, 1))):
+        planes[:, vertex, 0] = y[:, b] - y[:, c]
+        planes[:, vertex, 1] = x[:, c] - x[:, b]
+        planes[:, vertex, 2] = x[:, b] * y[:, c] - x[:, c] * y[:, b]
+    double_areas = planes[:, 0, 0] * x[:, 0] + planes[:, 0, 1] * y[:, 0] + planes[:, 0, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        planes[:, :3] /= double_areas[:, np.newaxis, np.newaxis]
+    planes[:, 3] = np.einsum('mvk,mv->mk', planes[:, :3], 1 / face_depths)
+    # degenerate faces cover no pixel
+    planes[double_areas == 0] = np.nan
+    return planes
+
+
+def _rasterize(
+        depth_map: np.ndarray,
+        width: int,
+        height: int,
+        planes: np.ndarray,
+        first: np.ndarray,
+        box_width: int,
+        box_height: int,
+) -> None:
+    """Rasterizes faces into a flat depth map, keeping the nearest depth of every pixel. The pixels of a face are
+    the `box_height x box_width` pixels from its `first` pixel on."""
+    profiling.count('rasterization.pixels_tested', len(planes) * box_width * box_height)
+    pixel_x = first[:, 0, np.newaxis] + np.arange(box_width)
+    pixel_y = first[:, 1, np.newaxis] + np.arange(box_height)
+    centre_x, centre_y = pixel_x + 0.5, pixel_y + 0.5
+    inside = (pixel_y < height)[:, :, np.newaxis] & (pixel_x < width)[:, np.newaxis, :]
+    for edge in range(3):
+        a, b, c = planes[:, edge, 0, np.newaxis], planes[:, edge, 1, np.newaxis], planes[:, edge, 2, np.newaxis]
+        inside &= (b * centre_y + c)[:, :, np.newaxis] + (a * centre_x)[:, np.newaxis, :] >= 0
+
+    pair_faces, rows, columns = np.nonzero(inside)
+    pair_x, pair_y = pixel_x[pair_faces, columns], pixel_y[pair_faces, rows]
+    depth_planes = planes[pair_faces, 3]
+    pair_depths = 1 / (depth_planes[:, 0] * (pair_x + 0.5) + depth_planes[:, 1] * (pair_y + 0.5) + depth_planes[:, 2])
+    pair_pixels = pair_y * width + pair_x
+
+    # the nearest depth of every pixel
+    order = np.argsort(pair_pixels, kind='stable')
+    pair_pixels, pair_depths = pair_pixels[order], pair_depths[order]
+    starts = np.flatnonzero(np.diff(pair_pixels, prepend=-1))
+    if len(starts) > 0:
+        pixels = pair_pixels[starts]
+        depth_map[pixels] = np.minimum(depth_map[pixels], np.minimum.reduceat(pair_depths, starts))
+
+
+def is_visible_in_depth_map(
+        depth_map: np.ndarray,
+        pixels: np.ndarray,
+        depths: np.ndarray,
+        in_frustum: np.ndarray,
+        scale: float = DEFAULT_DEPTH_MAP_SCALE,
+        depth_bias: float = DEFAULT_DEPTH_BIAS,
+) -> np.ndarray:
+    """Decides visibility of points by the depth map of a camera, a lookup per point.
+
+    :param depth_map: depth map rendered by `render_depth_map`
+    :param pixels: an `n x 2` matrix of image coordinates of the points, e.g. from `rendering.project_points`
+    :param depths: depths of the points
+    :param in_frustum: whether the points are inside the view frustum
+    :param scale: size of the depth map relative to the image
+    :param depth_bias: tolerance of the depth comparison, relative to the depth of the surface
+    :return: a boolean vector, `True` for the visible points
+    """
+    height, width = depth_map.shape
+    visible = np.array(in_frustum, dtype=bool)
+    map_pixels = np.floor(pixels[visible] * scale).astype(np.int64)
+    surface_depths = depth_map[
+        np.clip(map_pixels[:, 1], 0, height - 1), np.clip(map_pixels[:, 0], 0, width - 1)
+    ]
+    visible[visible] = depths[visible] <= surface_depths * (1 + depth_bias)
+    return visible
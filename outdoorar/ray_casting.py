@@ -1,8 +1,20 @@
+from __future__ import annotations
+
+from enum import Enum
 from typing import Sequence
 
 import numpy as np
 
+from outdoorar import profiling
+from outdoorar.geometry import Geometry
+
 delta = 0.000001
+# maximal number of ray-face pairs tested at once by `TriangleMesh`
+DEFAULT_CHUNK_SIZE = 2 ** 18
+# number of faces tested at once by `TriangleMesh.any_hit` before occluded rays are dropped
+ANY_HIT_FACES_STEP = 1024
+# segments are grouped into this many tiles of directions along each axis by `TriangleMesh.crop_to_segments`
+CROP_TILES = 4
 
 
 def normal_of_a_triangle(x, y, z):
@@ -88,6 +100,7 @@ class Triangle:
         self.dot01 = np.dot(self.yx, self.yz)
         self.dot11 = np.dot(self.yz, self.yz)
         self.barycentric_denom = self.dot00 * self.dot11 - self.dot01 * self.dot01
+        self._mesh = TriangleMesh(np.array([self.x, self.y, self.z]), np.array([[0, 1, 2]]))
 
     def barycentric_coordinates(self, p: Point | np.ndarray):
         p = np.array(p)
@@ -121,23 +134,7 @@ class Triangle:
         :param epsilon: extrusion factor in the direction given by triangle normal
         :return:
         """
-        squared_distances = np.ones(ray_vectors.shape[:-1]) * np.infty
-        extruded_point = point + epsilon * self.normal
-        intersecting_vector, does_intersect_plane = vector_plane_intersection(
-            self.x, self.normal, extruded_point, ray_vectors
-        )
-        u, v, w = self.barycentric_coordinates(extruded_point + intersecting_vector)
-        inside_triangle = does_intersect_plane & (u >= 0) & (v >= 0) & (w >= 0)
-        num_dimensions = len(inside_triangle.shape)
-        if num_dimensions == 0 and inside_triangle:
-            squared_distances = sum([vi ** 2 for vi in intersecting_vector])
-        elif num_dimensions == 1:
-            for i in np.where(inside_triangle)[0]:
-                squared_distances[i] = sum([vi ** 2 for vi in intersecting_vector[i]])
-        else:
-            for i, j in zip(*np.where(inside_triangle)):
-                squared_distances[i, j] = sum([vi ** 2 for vi in intersecting_vector[i, j]])
-        return inside_triangle, squared_distances
+        return self._mesh.does_ray_intersect(point, ray_vectors, epsilon)
 
     def angle_between(self, ray_vectors) -> float:
         # not used
@@ -168,3 +165,553 @@ class Triangle:
                 )
             case _:
                 raise ValueError(f"Ray vectors should be 1,2 or 3D vectors, but are {len(ray_vectors.shape)}")
+
+
+class TriangleMesh:
+    """All faces of a mesh stored as structure-of-arrays, so that rays are tested against many triangles
+    with array arithmetic instead of a Python loop over `Triangle` objects.
+
+    The intersection test is the same as in `Triangle.does_ray_intersect`: the ray is intersected with
+    the plane of a face and the intersection point is accepted when its barycentric coordinates are
+    non-negative. Differences of points are taken before dot products, as in `Triangle`, so that rays
+    starting exactly at a vertex or on an edge of a face are classified the same way.
+    """
+
+    def __init__(
+            self,
+            vertices: np.ndarray,
+            faces: np.ndarray,
+            face_ids: np.ndarray | None = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """
+        :param vertices: an `n x 3` matrix of vertex coordinates
+        :param faces: an `m x 3` matrix of vertex indices
+        :param face_ids: ids reported for the faces by the queries, by default row numbers of `faces`
+        :param chunk_size: maximal number of ray-face pairs tested at once
+        """
+        vertices = np.asarray(vertices, dtype=float)
+        faces = np.asarray(faces, dtype=int).reshape(-1, 3)
+        self.face_ids = np.arange(len(faces)) if face_ids is None else np.asarray(face_ids)
+        self.chunk_size = chunk_size
+
+        self.x = vertices[faces[:, 0]]
+        self.y = vertices[faces[:, 1]]
+        self.z = vertices[faces[:, 2]]
+        self.normal = np.cross(self.y - self.x, self.z - self.x)
+        self.yx = self.x - self.y
+        self.yz = self.z - self.y
+        self.dot00 = _dot(self.yx.T, self.yx.T)
+        self.dot01 = _dot(self.yx.T, self.yz.T)
+        self.dot11 = _dot(self.yz.T, self.yz.T)
+        self.barycentric_denom = self.dot00 * self.dot11 - self.dot01 * self.dot01
+        self.face_min = np.minimum(np.minimum(self.x, self.y), self.z)
+        self.face_max = np.maximum(np.maximum(self.x, self.y), self.z)
+        # coordinates first, so that the arithmetic of the intersection test runs on contiguous arrays
+        self._x, self._y, self._normal, self._yx, self._yz = (
+            np.ascontiguousarray(vectors.T) for vectors in (self.x, self.y, self.normal, self.yx, self.yz)
+        )
+
+    @classmethod
+    def from_geometry(cls, geometry: Geometry, chunk_size: int = DEFAULT_CHUNK_SIZE) -> TriangleMesh:
+        return cls(geometry.vertices, geometry.faces, chunk_size=chunk_size)
+
+    def __len__(self) -> int:
+        return len(self.face_ids)
+
+    def crop_to_segments(self, points: np.ndarray, ray_vectors: np.ndarray) -> TriangleMesh:
+        """Faces that the segments from the points to the ends of the ray vectors can intersect. The segments are
+        grouped into tiles by the azimuth and elevation of their directions, like pixels of an image, and the faces
+        overlapping the bounding box of the segments of any tile are kept. Any-hit queries of these segments give
+        the same results on the cropped mesh, faster.
+
+        :param points: segment origins of shape `3` or `... x 3`, broadcast against `ray_vectors`
+        :param ray_vectors: vectors from the origins to the ends of the segments
+        :return: a mesh of the overlapping faces, sharing the face ids of this mesh
+        """
+        points, ray_vectors, _ = _flatten_rays(points, ray_vectors)
+        if len(ray_vectors) == 0:
+            return self._subset(np.empty(0, dtype=int))
+        points = np.broadcast_to(points, ray_vectors.shape)
+        ends = points + ray_vectors
+        azimuth = np.arctan2(ray_vectors[:, 1], ray_vectors[:, 0])
+        elevation = np.arctan2(ray_vectors[:, 2], np.hypot(ray_vectors[:, 0], ray_vectors[:, 1]))
+        _, tiles = np.unique(_get_tiles(azimuth) * CROP_TILES + _get_tiles(elevation), return_inverse=True)
+
+        bounds_min = np.full((tiles.max() + 1, 3), np.inf)
+        bounds_max = np.full((tiles.max() + 1, 3), -np.inf)
+        for segment_points in (points, ends):
+            np.minimum.at(bounds_min, tiles, segment_points)
+            np.maximum.at(bounds_max, tiles, segment_points)
+        # intersections are accepted slightly behind the origins, see `delta`
+        padding = 2 * delta * np.linalg.norm(bounds_max - bounds_min, axis=1, keepdims=True)
+        bounds_min -= padding
+        bounds_max += padding
+
+        # faces outside the box around all segments are skipped before the tiles are tested
+        faces = np.flatnonzero(np.all(
+            (self.face_max >= bounds_min.min(axis=0)) & (self.face_min <= bounds_max.max(axis=0)), axis=1
+        ))
+        face_min, face_max = self.face_min[faces], self.face_max[faces]
+        overlaps = np.zeros(len(faces), dtype=bool)
+        for tile_min, tile_max in zip(bounds_min, bounds_max):
+            overlaps |= np.all((face_max >= tile_min) & (face_min <= tile_max), axis=1)
+        return self._subset(faces[overlaps])
+
+    def _subset(self, faces: np.ndarray) -> TriangleMesh:
+        """A mesh of some of the faces, sliced from the arrays of this mesh instead of being built again."""
+        mesh = object.__new__(TriangleMesh)
+        mesh.chunk_size = self.chunk_size
+        for name in (
+                'face_ids', 'x', 'y', 'z', 'normal', 'yx', 'yz', 'dot00', 'dot01', 'dot11', 'barycentric_denom',
+                'face_min', 'face_max',
+        ):
+            setattr(mesh, name, getattr(self, name)[faces])
+        for name in ('_x', '_y', '_normal', '_yx', '_yz'):
+            setattr(mesh, name, np.ascontiguousarray(getattr(self, name)[:, faces]))
+        return mesh
+
+    def does_ray_intersect(
+            self,
+            point: np.ndarray,
+            ray_vectors: np.ndarray,
+            epsilon: float = 0.0001,
+    ) -> tuple[bool | np.ndarray, float | np.ndarray]:
+        """Same as `Triangle.does_ray_intersect`, but for the whole mesh.
+
+        :param point: ray origin, either a single point or one point per ray vector
+        :param ray_vectors: directional vectors
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: whether the rays intersect any face and squared distances to the nearest intersections
+        """
+        squared_distances, hit_faces = self.nearest_hit(point, ray_vectors, epsilon)
+        return hit_faces >= 0, squared_distances
+
+    def nearest_hit(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            epsilon: float = 0.0,
+    ) -> tuple[np.ndarray | float, np.ndarray | int]:
+        """Finds the nearest intersection of every ray with the mesh.
+
+        :param points: ray origins of shape `3` or `... x 3`, broadcast against `ray_vectors`
+        :param ray_vectors: directional vectors of shape `... x 3`
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: squared distances to the nearest intersections (`inf` when a ray misses the mesh)
+        and ids of the intersected faces (`-1` when a ray misses the mesh)
+        """
+        with profiling.timer('ray_casting.nearest_hit'):
+            points, ray_vectors, shape = _flatten_rays(points, ray_vectors)
+            squared_distances = np.full(len(ray_vectors), np.inf)
+            hit_faces = np.full(len(ray_vectors), -1, dtype=int)
+
+            for rays, faces in self._chunks(len(ray_vectors)):
+                chunk_points = points if len(points) == 1 else points[rays]
+                chunk_distances = self._intersect(chunk_points, ray_vectors[rays], faces, epsilon)
+                nearest = np.argmin(chunk_distances, axis=1)
+                nearest_distances = chunk_distances[np.arange(len(nearest)), nearest]
+                closer = nearest_distances < squared_distances[rays]
+                squared_distances[rays] = np.where(closer, nearest_distances, squared_distances[rays])
+                hit_faces[rays] = np.where(closer, self.face_ids[faces][nearest], hit_faces[rays])
+
+            if profiling.is_enabled():
+                _count_rays(len(ray_vectors), len(ray_vectors) * len(self), np.count_nonzero(hit_faces >= 0))
+        return squared_distances.reshape(shape)[()], hit_faces.reshape(shape)[()]
+
+    def any_hit(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            max_squared_distances: np.ndarray | float,
+            epsilon: float = 0.0,
+    ) -> np.ndarray | bool:
+        """Checks whether the rays intersect the mesh not further than the given distances. Faces are tested
+        chunk by chunk and a ray is not tested any more once an intersection has been found.
+
+        :param points: ray origins of shape `3` or `... x 3`, broadcast against `ray_vectors`
+        :param ray_vectors: directional vectors of shape `... x 3`
+        :param max_squared_distances: squared distances up to which the intersections are searched for
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: whether the rays are occluded
+        """
+        with profiling.timer('ray_casting.any_hit'):
+            points, ray_vectors, shape = _flatten_rays(points, ray_vectors)
+            max_squared_distances = np.broadcast_to(max_squared_distances, shape).ravel()
+            occluded = np.zeros(len(ray_vectors), dtype=bool)
+            # small chunks of faces, so that occluded rays are dropped early
+            faces_step = max(1, min(len(self), self.chunk_size, ANY_HIT_FACES_STEP))
+            faces_tested = 0
+
+            for faces_start in range(0, len(self), faces_step):
+                active_rays = np.flatnonzero(~occluded)
+                if len(active_rays) == 0:
+                    break
+                faces = slice(faces_start, min(faces_start + faces_step, len(self)))
+                faces_tested += len(active_rays) * (faces.stop - faces.start)
+                rays_step = max(1, self.chunk_size // (faces.stop - faces.start))
+                for rays_start in range(0, len(active_rays), rays_step):
+                    rays = active_rays[rays_start:rays_start + rays_step]
+                    chunk_points = points if len(points) == 1 else points[rays]
+                    chunk_distances = self._intersect(chunk_points, ray_vectors[rays], faces, epsilon)
+                    occluded[rays] = np.any(chunk_distances <= max_squared_distances[rays, np.newaxis], axis=1)
+
+            if profiling.is_enabled():
+                _count_rays(len(ray_vectors), faces_tested, np.count_nonzero(occluded))
+        return occluded.reshape(shape)[()]
+
+    def _chunks(self, num_rays: int):
+        num_faces = len(self)
+        faces_step = max(1, min(num_faces, self.chunk_size))
+        rays_step = max(1, self.chunk_size // faces_step)
+        for rays_start in range(0, num_rays, rays_step):
+            rays = slice(rays_start, rays_start + rays_step)
+            for faces_start in range(0, num_faces, faces_step):
+                yield rays, slice(faces_start, faces_start + faces_step)
+
+    def _intersect(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            faces: slice | np.ndarray,
+            epsilon: float,
+    ) -> np.ndarray:
+        """Squared distances between ray origins and intersections with faces, `inf` for misses.
+
+        :param points: an `n x 3` matrix of ray origins (or `1 x 3`, shared by all rays)
+        :param ray_vectors: an `n x 3` matrix of directional vectors
+        :param faces: faces to test
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: an `n x m` matrix of squared distances, where `m` is the number of faces
+        """
+        return self._squared_distances(
+            points.T[:, :, np.newaxis], ray_vectors.T[:, :, np.newaxis], (slice(None), np.newaxis, faces), epsilon
+        )
+
+    def _intersect_pairs(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            faces: np.ndarray,
+            epsilon: float,
+    ) -> np.ndarray:
+        """Squared distances for pairs of rays and faces, `inf` for misses.
+
+        :param points: an `n x 3` matrix of ray origins (or `1 x 3`, shared by all rays)
+        :param ray_vectors: an `n x 3` matrix of directional vectors
+        :param faces: `n` faces, one per ray
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: a vector of `n` squared distances
+        """
+        return self._squared_distances(points.T, ray_vectors.T, (slice(None), faces), epsilon)
+
+    def _squared_distances(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            faces: tuple,
+            epsilon: float,
+    ) -> np.ndarray:
+        """The intersection test on arrays with coordinates along the first axis.
+
+        :param points: ray origins of shape `3 x ...`
+        :param ray_vectors: directional vectors of shape `3 x ...`
+        :param faces: index of the coordinates-first face arrays, broadcast against rays
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: squared distances of shape `...`
+        """
+        normal = self._normal[faces]
+        extruded_points = points + epsilon * normal if epsilon else points
+        face_index = faces[1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = _dot(self._x[faces] - extruded_points, normal) / _dot(ray_vectors, normal)
+            has_intersection = t >= -delta
+
+            intersecting_vectors = t * ray_vectors
+            yp = extruded_points + intersecting_vectors - self._y[faces]
+            dot02 = _dot(yp, self._yx[faces])
+            dot12 = _dot(yp, self._yz[faces])
+            denom = self.barycentric_denom[face_index]
+            u = (self.dot11[face_index] * dot02 - self.dot01[face_index] * dot12) / denom
+            v = (self.dot00[face_index] * dot12 - self.dot01[face_index] * dot02) / denom
+            w = 1.0 - u - v
+            inside_triangle = has_intersection & (u >= 0) & (v >= 0) & (w >= 0)
+
+        squared_distances = np.full(inside_triangle.shape, np.inf)
+        squared_distances[inside_triangle] = _squared_norm(intersecting_vectors[:, inside_triangle])
+        return squared_distances
+
+
+class BoundingVolumeHierarchy:
+    """Bounding volume hierarchy over the faces of a mesh.
+
+    The tree is built by splitting faces at the median of their centroids along the longest axis. Rays are
+    traversed in batches: all (ray, node) pairs of a level are tested against the node boxes at once, and
+    rays reaching a leaf are tested only against the faces of that leaf, so the cost of a query grows with
+    the number of faces near the rays instead of the number of faces in the mesh.
+    """
+
+    def __init__(
+            self,
+            vertices: np.ndarray,
+            faces: np.ndarray,
+            leaf_size: int = 8,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """
+        :param vertices: an `n x 3` matrix of vertex coordinates
+        :param faces: an `m x 3` matrix of vertex indices
+        :param leaf_size: maximal number of faces in a leaf
+        :param chunk_size: maximal number of (ray, node) pairs traversed at once
+        """
+        vertices = np.asarray(vertices, dtype=float)
+        faces = np.asarray(faces, dtype=int).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        self.chunk_size = chunk_size
+
+        triangles = vertices[faces]
+        face_min = triangles.min(axis=1)
+        face_max = triangles.max(axis=1)
+        order = self._build(triangles.mean(axis=1), face_min, face_max)
+        # faces are stored in the leaf order, so that every leaf is a contiguous range of faces
+        self.mesh = TriangleMesh(vertices, faces[order], face_ids=order)
+        self._max_normal_norm = np.sqrt(np.max(_squared_norm(self.mesh.normal.T), initial=0))
+
+    @classmethod
+    def from_geometry(
+            cls, geometry: Geometry, leaf_size: int = 8, chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> BoundingVolumeHierarchy:
+        return cls(geometry.vertices, geometry.faces, leaf_size=leaf_size, chunk_size=chunk_size)
+
+    def __len__(self) -> int:
+        return len(self.mesh)
+
+    def crop_to_segments(self, points: np.ndarray, ray_vectors: np.ndarray) -> BoundingVolumeHierarchy:
+        """Same as `TriangleMesh.crop_to_segments`. The traversal already skips the faces outside the boxes
+        around the rays, so the whole tree is kept."""
+        return self
+
+    def _build(self, centroids: np.ndarray, face_min: np.ndarray, face_max: np.ndarray) -> np.ndarray:
+        order = np.arange(len(centroids))
+        bounds_min, bounds_max, left, right, start, count = [], [], [], [], [], []
+
+        def add_node() -> int:
+            for node_list in (bounds_min, bounds_max, left, right, start, count):
+                node_list.append(None)
+            return len(left) - 1
+
+        stack = [(add_node(), 0, len(order))]
+        while stack:
+            node, first, last = stack.pop()
+            node_faces = order[first:last]
+            bounds_min[node] = face_min[node_faces].min(axis=0, initial=np.inf)
+            bounds_max[node] = face_max[node_faces].max(axis=0, initial=-np.inf)
+            if last - first <= self.leaf_size:
+                left[node], right[node], start[node], count[node] = -1, -1, first, last - first
+                continue
+
+            node_centroids = centroids[node_faces]
+            axis = np.argmax(node_centroids.max(axis=0) - node_centroids.min(axis=0))
+            middle = (last - first) // 2
+            order[first:last] = node_faces[np.argpartition(node_centroids[:, axis], middle)]
+            left[node], right[node], start[node], count[node] = add_node(), add_node(), first, 0
+            stack.append((right[node], first + middle, last))
+            stack.append((left[node], first, first + middle))
+
+        self.bounds_min = np.array(bounds_min)
+        self.bounds_max = np.array(bounds_max)
+        self.left = np.array(left)
+        self.right = np.array(right)
+        self.start = np.array(start)
+        self.count = np.array(count)
+        return order
+
+    def does_ray_intersect(
+            self,
+            point: np.ndarray,
+            ray_vectors: np.ndarray,
+            epsilon: float = 0.0001,
+    ) -> tuple[bool | np.ndarray, float | np.ndarray]:
+        """Same as `TriangleMesh.does_ray_intersect`."""
+        squared_distances, hit_faces = self.nearest_hit(point, ray_vectors, epsilon)
+        return hit_faces >= 0, squared_distances
+
+    def nearest_hit(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            epsilon: float = 0.0,
+    ) -> tuple[np.ndarray | float, np.ndarray | int]:
+        """Same as `TriangleMesh.nearest_hit`."""
+        with profiling.timer('ray_casting.nearest_hit'):
+            points, ray_vectors, shape = _flatten_rays(points, ray_vectors)
+            squared_distances = np.full(len(ray_vectors), np.inf)
+            hit_faces = np.full(len(ray_vectors), -1, dtype=int)
+            faces_tested = self._traverse(points, ray_vectors, squared_distances, hit_faces, epsilon)
+            if profiling.is_enabled():
+                _count_rays(len(ray_vectors), faces_tested, np.count_nonzero(hit_faces >= 0))
+        return squared_distances.reshape(shape)[()], hit_faces.reshape(shape)[()]
+
+    def any_hit(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            max_squared_distances: np.ndarray | float,
+            epsilon: float = 0.0,
+    ) -> np.ndarray | bool:
+        """Checks whether the rays intersect the mesh not further than the given distances. The traversal of
+        a ray stops at the first intersection found.
+
+        :param points: ray origins of shape `3` or `... x 3`, broadcast against `ray_vectors`
+        :param ray_vectors: directional vectors of shape `... x 3`
+        :param max_squared_distances: squared distances up to which the intersections are searched for
+        :param epsilon: extrusion factor in the direction given by triangle normal
+        :return: whether the rays are occluded
+        """
+        with profiling.timer('ray_casting.any_hit'):
+            points, ray_vectors, shape = _flatten_rays(points, ray_vectors)
+            max_squared_distances = np.broadcast_to(max_squared_distances, shape).ravel()
+            occluded = np.zeros(len(ray_vectors), dtype=bool)
+            faces_tested = self._traverse(
+                points, ray_vectors, max_squared_distances.astype(float), None, epsilon, occluded
+            )
+            if profiling.is_enabled():
+                _count_rays(len(ray_vectors), faces_tested, np.count_nonzero(occluded))
+        return occluded.reshape(shape)[()]
+
+    def _traverse(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            squared_distances: np.ndarray,
+            hit_faces: np.ndarray | None,
+            epsilon: float,
+            occluded: np.ndarray | None = None,
+    ) -> int:
+        """Traverses the tree level by level. For nearest-hit queries `squared_distances` and `hit_faces`
+        are updated in place, for any-hit queries `occluded` is. The `squared_distances` bound the search:
+        nodes further away than the current bound are skipped.
+
+        :return: number of ray-face pairs tested
+        """
+        faces_tested = 0
+        rays_step = max(1, self.chunk_size // (4 * self.leaf_size))
+        with np.errstate(divide='ignore'):
+            inverse_ray_vectors = 1.0 / ray_vectors
+        squared_norms = np.einsum('ij,ij->i', ray_vectors, ray_vectors)
+        # ray origins can be extruded along face normals, boxes are inflated to account for that
+        padding = 1e-9 * np.max(self.bounds_max[0] - self.bounds_min[0], initial=1) + \
+            abs(epsilon) * self._max_normal_norm
+        bounds_min = self.bounds_min - padding
+        bounds_max = self.bounds_max + padding
+
+        for rays_start in range(0, len(ray_vectors), rays_step):
+            rays = np.arange(rays_start, min(rays_start + rays_step, len(ray_vectors)))
+            nodes = np.zeros(len(rays), dtype=int)
+            while len(rays):
+                origins = points[0] if len(points) == 1 else points[rays]
+                with np.errstate(invalid='ignore'):
+                    t1 = (bounds_min[nodes] - origins) * inverse_ray_vectors[rays]
+                    t2 = (bounds_max[nodes] - origins) * inverse_ray_vectors[rays]
+                t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+                t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+                entry = np.maximum(t_near, 0)
+                hits_box = (t_far >= -delta) & (t_far >= t_near) & \
+                    (entry * entry * squared_norms[rays] <= squared_distances[rays])
+                if occluded is not None:
+                    hits_box &= ~occluded[rays]
+                rays, nodes = rays[hits_box], nodes[hits_box]
+
+                is_leaf = self.left[nodes] < 0
+                faces_tested += int(np.sum(self.count[nodes[is_leaf]]))
+                self._intersect_leaves(
+                    points, ray_vectors, rays[is_leaf], nodes[is_leaf], squared_distances, hit_faces,
+                    epsilon, occluded,
+                )
+                rays, nodes = rays[~is_leaf], nodes[~is_leaf]
+                rays = np.concatenate((rays, rays))
+                nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+        return faces_tested
+
+    def _intersect_leaves(
+            self,
+            points: np.ndarray,
+            ray_vectors: np.ndarray,
+            rays: np.ndarray,
+            nodes: np.ndarray,
+            squared_distances: np.ndarray,
+            hit_faces: np.ndarray | None,
+            epsilon: float,
+            occluded: np.ndarray | None,
+    ) -> None:
+        counts = self.count[nodes]
+        pair_rays = np.repeat(rays, counts)
+        # index of each face within its leaf
+        offsets = np.arange(len(pair_rays)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_faces = np.repeat(self.start[nodes], counts) + offsets
+
+        pair_points = points if len(points) == 1 else points[pair_rays]
+        pair_distances = self.mesh._intersect_pairs(
+            pair_points, ray_vectors[pair_rays], pair_faces, epsilon
+        )
+        if occluded is not None:
+            occluded[pair_rays[pair_distances <= squared_distances[pair_rays]]] = True
+            return
+
+        closer = pair_distances < squared_distances[pair_rays]
+        pair_rays, pair_faces, pair_distances = pair_rays[closer], pair_faces[closer], pair_distances[closer]
+        np.minimum.at(squared_distances, pair_rays, pair_distances)
+        nearest = pair_distances == squared_distances[pair_rays]
+        hit_faces[pair_rays[nearest]] = self.mesh.face_ids[pair_faces[nearest]]
+
+
+class RayCastingBackend(Enum):
+    BRUTE_FORCE = 1
+    BVH = 2
+
+
+def build_intersector(
+        geometry: Geometry, backend: RayCastingBackend = RayCastingBackend.BRUTE_FORCE,
+) -> TriangleMesh | BoundingVolumeHierarchy:
+    match backend:
+        case RayCastingBackend.BRUTE_FORCE:
+            return TriangleMesh.from_geometry(geometry)
+        case RayCastingBackend.BVH:
+            return BoundingVolumeHierarchy.from_geometry(geometry)
+
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Dot product of 3D vectors stored coordinates first, summed in a fixed order, so that the result
+    does not depend on the shapes of the arrays."""
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _squared_norm(a: np.ndarray) -> np.ndarray:
+    return a[0] ** 2 + a[1] ** 2 + a[2] ** 2
+
+
+def _count_rays(rays: int, faces_tested: int, hits: int) -> None:
+    profiling.count('ray_casting.rays', rays)
+    profiling.count('ray_casting.faces_tested', faces_tested)
+    profiling.count('ray_casting.hits', hits)
+
+
+def _get_tiles(angles: np.ndarray) -> np.ndarray:
+    """Indices of `CROP_TILES` equal intervals between the smallest and the largest of the angles."""
+    angle_range = angles.max() - angles.min()
+    if angle_range == 0:
+        return np.zeros(len(angles), dtype=int)
+    return np.minimum((angles - angles.min()) * (CROP_TILES / angle_range), CROP_TILES - 1).astype(int)
+
+
+def _flatten_rays(points: np.ndarray, ray_vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray, tuple]:
+    """Broadcasts ray origins against ray vectors and flattens both into `n x 3` matrices.
+
+    A single origin is kept as a `1 x 3` matrix, so that its projections are calculated only once.
+    """
+    points = np.asarray(points, dtype=float)
+    ray_vectors = np.asarray(ray_vectors, dtype=float)
+    if points.ndim == 1:
+        return points.reshape(1, 3), ray_vectors.reshape(-1, 3), ray_vectors.shape[:-1]
+    points, ray_vectors = np.broadcast_arrays(points, ray_vectors)
+    return points.reshape(-1, 3), ray_vectors.reshape(-1, 3), ray_vectors.shape[:-1]
@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 import numpy as np
 
 
@@ -33,3 +35,88 @@ def is_inside_image(curr_image_coords: np.ndarray, image_width: int, image_heigh
             curr_image_coords[1] <= image_height
         )
     )
+
+
+def get_depths(polyline: np.ndarray, extrinsic: np.ndarray) -> np.ndarray:
+    """Depths of points along the optical axis of a camera, negative for points behind the camera.
+
+    :param polyline: an `n x 3` matrix of points in world coordinates
+    :param extrinsic: camera extrinsic matrix 4 x 4
+    :return: a vector of `n` depths
+    """
+    return np.matmul(polyline[:, :3], extrinsic[2, :3]) + extrinsic[2, 3]
+
+
+def is_inside_frustum(
+        polyline: np.ndarray,
+        intrinsic: np.ndarray,
+        extrinsic: np.ndarray,
+        image_width: int,
+        image_height: int,
+        near: float = 0.,
+) -> np.ndarray:
+    """Checks whether points are in front of a camera and project into its image, see `project_points`.
+
+    :param polyline: an `n x 3` matrix of points in world coordinates
+    :param intrinsic: camera intrinsic matrix 3 x 4
+    :param extrinsic: camera extrinsic matrix 4 x 4
+    :param image_width: image width
+    :param image_height: image height
+    :param near: minimal depth of the points
+    :return: a boolean ndarray of size `n`
+    """
+    return project_points(
+        polyline, intrinsic, extrinsic[np.newaxis], np.array([[image_width, image_height]]), near
+    ).in_frustum[0]
+
+
+@dataclass
+class Projections:
+    """Points projected into the images of many cameras, as `cameras x points` arrays."""
+    pixels: np.ndarray  # image coordinates `x, y` with sub-pixel precision, `nan` for points behind the camera
+    depths: np.ndarray  # depths along the optical axes, negative for points behind the camera
+    in_frustum: np.ndarray  # whether the points are in front of the camera and inside the image
+
+
+def get_extrinsic_matrices(rotations: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Extrinsic matrices of many cameras at once.
+
+    :param rotations: a `p x 3 x 3` array of camera rotations, world to camera
+    :param centers: a `p x 3` matrix of camera centers in world coordinates
+    :return: a `p x 4 x 4` array of extrinsic matrices
+    """
+    extrinsics = np.zeros((len(rotations), 4, 4))
+    extrinsics[:, :3, :3] = rotations
+    extrinsics[:, :3, 3] = -np.einsum('pij,pj->pi', rotations, centers)
+    extrinsics[:, 3, 3] = 1
+    return extrinsics
+
+
+def project_points(
+        polyline: np.ndarray,
+        intrinsics: np.ndarray,
+        extrinsics: np.ndarray,
+        image_sizes: np.ndarray,
+        near: float = 0.,
+) -> Projections:
+    """Projects points into the images of many cameras with a single `einsum`. Unlike `get_image_coordinates`,
+    the image coordinates are not truncated, and points behind a camera are not mirrored into its image.
+
+    :param polyline: an `n x 3` matrix of points in world coordinates
+    :param intrinsics: intrinsic matrix 3 x 4 shared by the cameras, or a `p x 3 x 4` array
+    :param extrinsics: a `p x 4 x 4` array of extrinsic matrices
+    :param image_sizes: a `p x 2` matrix of image widths and heights, or a single width and height
+    :param near: minimal depth of points in the frustum
+    :return: projections of the points into the `p` images
+    """
+    image_sizes = np.broadcast_to(np.asarray(image_sizes, dtype=np.float64), (len(extrinsics), 2))
+    cameras = np.matmul(intrinsics, extrinsics)
+    homogeneous = np.einsum('pij,nj->pni', cameras[:, :, :3], polyline[:, :3]) + cameras[:, np.newaxis, :, 3]
+    depths = homogeneous[..., 2]
+    in_front = depths > near
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pixels = np.where(in_front[..., np.newaxis], homogeneous[..., :2] / depths[..., np.newaxis], np.nan)
+    in_frustum = in_front & np.all(
+        (pixels >= 0) & (pixels <= image_sizes[:, np.newaxis, :]), axis=-1
+    )
+    return Projections(pixels, depths, in_frustum)
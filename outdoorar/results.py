@@ -0,0 +1,151 @@
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+COLUMNS_FILE_NAME = 'columns.json'
+ROWS_FILE_NAME = 'rows.bin'
+# a row is the length of the image name, the name and the bit-packed visibility flags of the points
+_NAME_LENGTH_FORMAT = '<H'
+
+
+class VisibilityResultsWriter:
+    """Append-only storage of per-pose visibility results, a row of bit-packed flags per image. Every row is
+    written as soon as its pose is finished, so an interrupted run keeps all the finished poses, and a run can be
+    resumed by skipping the images in `completed`.
+
+    The results are a directory with the columns (polyline and vertex index of every point) in `columns.json`
+    and the rows in `rows.bin`. A row cut short by a crash is dropped when the results are opened again.
+    """
+
+    def __init__(
+            self,
+            results_path: Path,
+            columns: list[tuple[str, int]],
+            resume: bool = True,
+            sync: bool = False,
+    ) -> None:
+        """
+        :param results_path: directory of the results, created when it does not exist
+        :param columns: polyline and vertex index of every point
+        :param resume: whether to keep the stored rows, otherwise they are removed
+        :param sync: whether to flush every row to the disk, not only to the operating system
+        """
+        self._results_path = results_path
+        self._columns = [(polyline, int(vertex_idx)) for polyline, vertex_idx in columns]
+        self._row_size = (len(self._columns) + 7) // 8
+        self._sync = sync
+        results_path.mkdir(parents=True, exist_ok=True)
+
+        columns_path = results_path.joinpath(COLUMNS_FILE_NAME)
+        rows_path = results_path.joinpath(ROWS_FILE_NAME)
+        if not resume:
+            rows_path.unlink(missing_ok=True)
+            columns_path.unlink(missing_ok=True)
+        if columns_path.exists():
+            stored_columns = [tuple(column) for column in json.loads(columns_path.read_text())]
+            if stored_columns != self._columns:
+                raise ValueError(f"Results in {results_path} are for other annotations, remove them to start over")
+        else:
+            columns_path.write_text(json.dumps(self._columns))
+
+        names, _, valid_size = _read_rows(rows_path, self._row_size) if rows_path.exists() else ([], None, 0)
+        self._completed = set(names)
+        self._rows_file = rows_path.open('ab')
+        self._rows_file.truncate(valid_size)
+
+    @property
+    def completed(self) -> set[str]:
+        """Names of the images whose rows are stored."""
+        return self._completed
+
+    def append(self, img_name: str, visibility: np.ndarray) -> None:
+        if len(visibility) != len(self._columns):
+            raise ValueError(f"Visibility of {len(visibility)} points, {len(self._columns)} points expected")
+        name = img_name.encode()
+        self._rows_file.write(
+            struct.pack(_NAME_LENGTH_FORMAT, len(name))
+            + name
+            + np.packbits(np.asarray(visibility, dtype=bool)).tobytes()
+        )
+        self._rows_file.flush()
+        if self._sync:
+            os.fsync(self._rows_file.fileno())
+        self._completed.add(img_name)
+
+    def close(self) -> None:
+        self._rows_file.close()
+
+    def __enter__(self) -> 'VisibilityResultsWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def read_visibility_results(results_path: Path) -> tuple[list[str], list[tuple[str, int]], np.ndarray]:
+    """Reads results stored by `VisibilityResultsWriter`.
+
+    :param results_path: directory of the results
+    :return: image names, columns and an `images x points` matrix of visibility flags (`uint8`)
+    """
+    columns = [tuple(column) for column in json.loads(results_path.joinpath(COLUMNS_FILE_NAME).read_text())]
+    rows_path = results_path.joinpath(ROWS_FILE_NAME)
+    names, rows, _ = _read_rows(rows_path, (len(columns) + 7) // 8) if rows_path.exists() else ([], [], 0)
+    packed = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), -1)
+    return names, columns, np.unpackbits(packed, axis=1, count=len(columns))
+
+
+def export_csv(results_path: Path, csv_path: Path, images_index: Iterable[str] | None = None) -> None:
+    """Exports results in the CSV layout of the ground truth: a row per image and a column per point, with the
+    polyline and vertex index in the two header rows.
+
+    :param results_path: directory of the results
+    :param csv_path: path to the CSV file
+    :param images_index: order of the rows, images without results get empty rows; the stored order by default
+    """
+    names, columns, visibility = read_visibility_results(results_path)
+    results_df = pd.DataFrame(
+        data=visibility.astype(int), columns=pd.MultiIndex.from_tuples(columns), index=names, dtype=object
+    )
+    results_df.columns.names = ['Polyline', 'VertexIdx']
+    results_df = results_df[~results_df.index.duplicated(keep='last')]
+    if images_index is not None:
+        results_df = results_df.reindex(list(images_index))
+    results_df.to_csv(csv_path)
+
+
+def read_csv(csv_path: Path) -> tuple[list[str], list[tuple[str, int]], np.ndarray]:
+    """Reads a CSV file in the layout of `export_csv`, e.g. the ground truth.
+
+    :param csv_path: path to the CSV file
+    :return: image names, columns and an `images x points` matrix of visibility flags, `nan` in empty rows
+    """
+    results_df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
+    columns = [(polyline, int(vertex_idx)) for polyline, vertex_idx in results_df.columns]
+    return results_df.index.tolist(), columns, results_df.to_numpy(dtype=float)
+
+
+def _read_rows(rows_path: Path, row_size: int) -> tuple[list[str], list[bytes], int]:
+    """Reads the complete rows of a rows file.
+
+    :return: image names, bit-packed rows and the size of the complete rows in bytes
+    """
+    content = rows_path.read_bytes()
+    names, rows = [], []
+    offset = 0
+    header_size = struct.calcsize(_NAME_LENGTH_FORMAT)
+    while offset + header_size <= len(content):
+        name_length, = struct.unpack_from(_NAME_LENGTH_FORMAT, content, offset)
+        end = offset + header_size + name_length + row_size
+        if end > len(content):
+            break
+        names.append(content[offset + header_size:offset + header_size + name_length].decode())
+        rows.append(content[end - row_size:end])
+        offset = end
+    return names, rows, offset
+
@@ -1,33 +1,22 @@
 from enum import Enum
+from functools import lru_cache
+from typing import Iterator
 
 import numpy as np
 
+# maximum number of samples, or elements of a `cells x samples` cosine matrix, processed at once
+DEFAULT_CHUNK_SIZE = 2 ** 22
+
 
 class SamplingScheme(Enum):
     EQUAL_ANGLE = 1
     GOLDEN_SPIRAL = 2
 
 
-def get_golden_spiral_cartesian_coordinates(samples: int) -> np.ndarray:
+def get_golden_spiral_cartesian_coordinates(samples: int, dtype: np.dtype = np.float64) -> np.ndarray:
     if samples <= 0:
         raise ValueError("Number of spherical coordinates must be positive")
-    points = np.zeros((samples, 3))
-    phi = np.pi * (np.sqrt(5.) - 1.)  # golden angle in radians
-
-    for i in range(samples):
-        y = 1 - (i / float(samples - 1)) * 2  # y goes from 1 to -1
-        radius = np.sqrt(1 - y * y)  # radius at y
-
-        theta = phi * i  # golden angle increment
-
-        x = np.cos(theta) * radius
-        z = np.sin(theta) * radius
-
-        points[i, 0] = x
-        points[i, 1] = y
-        points[i, 2] = z
-
-    return points
+    return _get_golden_spiral_block(samples, 0, samples).astype(dtype, copy=False)
 
 
 def get_equal_angle_spherical_coordinates(samples: int) -> tuple:
@@ -44,6 +33,11 @@ def get_equal_angle_spherical_coordinates(samples: int) -> tuple:
     return u, v
 
 
+def get_equal_angle_cartesian_coordinates(samples: int, dtype: np.dtype = np.float64) -> np.ndarray:
+    """Equal angle samples in the order of `get_cartesian_coordinates`: the azimuth changes fastest."""
+    return _get_equal_angle_block(samples, 0, samples).astype(dtype, copy=False)
+
+
 def get_cartesian_coordinates_from_spherical(u, v, r=1) -> np.ndarray:
     x = r * np.outer(np.cos(u), np.sin(v))
     y = r * np.outer(np.sin(u), np.sin(v))
@@ -52,13 +46,230 @@ def get_cartesian_coordinates_from_spherical(u, v, r=1) -> np.ndarray:
 
 
 def get_cartesian_coordinates(
-        n: int, sampling_scheme: SamplingScheme = SamplingScheme.EQUAL_ANGLE,
+        n: int, sampling_scheme: SamplingScheme = SamplingScheme.EQUAL_ANGLE, dtype: np.dtype = np.float64,
 ) -> np.ndarray:
     match sampling_scheme:
         case SamplingScheme.EQUAL_ANGLE:
-            return get_cartesian_coordinates_from_spherical(
-                *get_equal_angle_spherical_coordinates(n)
-            ).reshape((n, 3), order='F')
+            return get_equal_angle_cartesian_coordinates(n, dtype)
         case SamplingScheme.GOLDEN_SPIRAL:
-            return get_golden_spiral_cartesian_coordinates(n)
+            return get_golden_spiral_cartesian_coordinates(n, dtype)
+
+
+def iter_cartesian_coordinates(
+        n: int,
+        sampling_scheme: SamplingScheme = SamplingScheme.EQUAL_ANGLE,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        dtype: np.dtype = np.float64,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Yields the samples of `get_cartesian_coordinates` in blocks, without allocating the whole table.
+
+    :param n: number of samples
+    :param sampling_scheme: sphere sampling scheme
+    :param chunk_size: maximum number of samples in a block
+    :param dtype: type of coordinates, they are always computed in double precision
+    :return: pairs of the index of the first sample of a block and a `block size x 3` matrix of samples
+    """
+    match sampling_scheme:
+        case SamplingScheme.EQUAL_ANGLE:
+            get_block = _get_equal_angle_block
+        case SamplingScheme.GOLDEN_SPIRAL:
+            get_block = _get_golden_spiral_block
+    if n <= 0:
+        raise ValueError("Number of spherical coordinates must be positive")
+    for start in range(0, n, chunk_size):
+        yield start, get_block(n, start, min(n, start + chunk_size)).astype(dtype, copy=False)
+
+
+def _get_golden_spiral_block(samples: int, start: int, stop: int) -> np.ndarray:
+    """Samples `start:stop` of the golden spiral, `y` goes from 1 to -1."""
+    i = np.arange(start, stop)
+    phi = np.pi * (np.sqrt(5.) - 1.)  # golden angle in radians
+    y = 1 - (i / float(samples - 1)) * 2 if samples > 1 else np.ones(len(i))
+    radius = np.sqrt(1 - y * y)  # radius at y
+    theta = phi * i  # golden angle increment
+
+    points = np.empty((len(i), 3))
+    points[:, 0] = np.cos(theta) * radius
+    points[:, 1] = y
+    points[:, 2] = np.sin(theta) * radius
+    return points
+
+
+def _get_equal_angle_block(samples: int, start: int, stop: int) -> np.ndarray:
+    """Samples `start:stop` of the equal angle scheme, sample `polar index * sqrt(samples) + azimuthal index`."""
+    u, v = get_equal_angle_spherical_coordinates(samples)
+    polar_idx, azimuthal_idx = np.divmod(np.arange(start, stop), len(u))
+    sin_v = np.sin(v)
+
+    points = np.empty((stop - start, 3))
+    points[:, 0] = np.cos(u)[azimuthal_idx] * sin_v[polar_idx]
+    points[:, 1] = np.sin(u)[azimuthal_idx] * sin_v[polar_idx]
+    points[:, 2] = np.cos(v)[polar_idx]
+    return points
+
+
+def get_golden_spiral_index(vectors: np.ndarray, samples: int) -> np.ndarray:
+    """Indices of the golden spiral samples nearest to vectors, in constant time per vector (inverse spherical
+    Fibonacci mapping, Keinert et al. 2015).
+
+    In the (azimuth, height) plane the spiral points `i` at height `1 - 2i / (samples - 1)` and azimuth `i` times
+    the golden angle form a lattice. Locally it is spanned by the index steps of two consecutive Fibonacci numbers,
+    chosen by the spacing of points at the height of the vector. The nearest sample is one of the four corners of
+    the lattice cell containing the vector.
+
+    :param vectors: an `n x 3` matrix of vectors (not necessarily unit vectors)
+    :param samples: number of samples of the spiral
+    :return: a vector of `n` indices of samples
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    if samples == 1:
+        return np.zeros(len(vectors), dtype=int)
+    golden_ratio = (1 + np.sqrt(5.)) / 2
+    height_step = 2. / (samples - 1)
+    y = np.clip(vectors[:, 1] / np.linalg.norm(vectors, axis=1), -1., 1.)
+    azimuth = np.arctan2(vectors[:, 2], vectors[:, 0])
+
+    k = np.maximum(2, np.floor(
+        np.log(np.maximum(samples * np.pi * np.sqrt(5.) * (1 - y * y), 1.)) / np.log(golden_ratio ** 2)
+    ))
+    fibonacci = np.stack([np.round(golden_ratio ** k / np.sqrt(5.)), np.round(golden_ratio ** (k + 1) / np.sqrt(5.))])
+    fraction = fibonacci / golden_ratio
+    # lattice basis: azimuth (wrapped to the nearest turn) and height steps of the Fibonacci index steps
+    azimuth_steps = 2 * np.pi * (fraction - np.round(fraction))
+    height_steps = -fibonacci * height_step
+    determinant = azimuth_steps[0] * height_steps[1] - azimuth_steps[1] * height_steps[0]
+    cell = np.floor(np.stack([
+        (height_steps[1] * azimuth - azimuth_steps[1] * (y - 1)) / determinant,
+        (azimuth_steps[0] * (y - 1) - height_steps[0] * azimuth) / determinant,
+    ]))
+
+    corners = np.array([[0, 0], [0, 1], [1, 0], [1, 1]])
+    candidates = (
+        (cell[0, :, np.newaxis] + corners[:, 0]) * fibonacci[0, :, np.newaxis]
+        + (cell[1, :, np.newaxis] + corners[:, 1]) * fibonacci[1, :, np.newaxis]
+    )
+    candidates = np.clip(candidates, 0, samples - 1).astype(int)
+    cosines = np.einsum(
+        'nkj,nj->nk', get_direction_table(samples, SamplingScheme.GOLDEN_SPIRAL)[candidates], vectors
+    )
+    return candidates[np.arange(len(vectors)), np.argmax(cosines, axis=1)]
+
+
+@lru_cache(maxsize=32)
+def get_direction_table(n: int, sampling_scheme: SamplingScheme = SamplingScheme.EQUAL_ANGLE) -> np.ndarray:
+    """Sampled directions of `get_cartesian_coordinates`, computed once per sample count and scheme. The table is
+    shared by all callers, so it is read-only."""
+    direction_vectors = get_cartesian_coordinates(n, sampling_scheme)
+    direction_vectors.flags.writeable = False
+    return direction_vectors
+
+
+class DirectionLookup:
+    """Finds the sampled direction nearest (by cosine distance) to given vectors without comparing them to all
+    the samples. The sphere is split into the cells of a cube map and every cell keeps the candidate samples that
+    can be nearest to some direction in the cell, so a query compares a vector only to a few candidates.
+
+    A cell with center direction `c` and angular radius `r` (the angle to its farthest corner) keeps the samples
+    within `a + 2r` of `c`, where `a` is the angle between `c` and its nearest sample. For a direction `d` in the
+    cell the nearest sample is within `a + r` of `d` and thus within `a + 2r` of `c`.
+    """
+
+    def __init__(
+            self,
+            direction_vectors: np.ndarray,
+            resolution: int | None = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """
+        :param direction_vectors: an `m x 3` matrix of unit vectors of the sampled directions
+        :param resolution: number of cells along an edge of a cube face, by default about four cells per sample
+        :param chunk_size: maximum number of elements of the `cells x samples` matrix computed at once
+        """
+        self._direction_vectors = np.asarray(direction_vectors, dtype=np.float64)
+        samples = len(self._direction_vectors)
+        self._resolution = resolution or max(1, int(np.ceil(2 * np.sqrt(samples / 6))))
+
+        # cell centers and corners on the cube faces, face `2 * axis + (negative side)`
+        r = self._resolution
+        edges = np.linspace(-1., 1., r + 1)
+        centers = (edges[:-1] + edges[1:]) / 2
+        cell_centers = np.concatenate([
+            _cube_face_to_vectors(face, *np.meshgrid(centers, centers, indexing='ij')).reshape(-1, 3)
+            for face in range(6)
+        ])
+        cell_corners = np.stack([
+            np.concatenate([
+                _cube_face_to_vectors(
+                    face, *np.meshgrid(edges[i:i + r], edges[j:j + r], indexing='ij')
+                ).reshape(-1, 3)
+                for face in range(6)
+            ])
+            for i in (0, 1) for j in (0, 1)
+        ])
+        cell_centers /= np.linalg.norm(cell_centers, axis=-1, keepdims=True)
+        cell_corners /= np.linalg.norm(cell_corners, axis=-1, keepdims=True)
+        cell_radii = np.arccos(np.clip(np.min(np.sum(cell_corners * cell_centers, axis=-1), axis=0), -1., 1.))
+
+        candidates = []
+        cells_per_chunk = max(1, chunk_size // samples)
+        for start in range(0, len(cell_centers), cells_per_chunk):
+            cosines = np.dot(cell_centers[start:start + cells_per_chunk], self._direction_vectors.transpose())
+            nearest_angles = np.arccos(np.clip(np.max(cosines, axis=1), -1., 1.))
+            # a small margin keeps samples on the boundary despite rounding
+            thresholds = np.cos(np.minimum(np.pi, nearest_angles + 2 * cell_radii[start:start + cells_per_chunk]))
+            candidates.extend(np.flatnonzero(row >= threshold - 1e-9) for row, threshold in zip(cosines, thresholds))
+
+        # candidates padded to the same count by repeating the last candidate of a cell
+        counts = np.array([len(cell_candidates) for cell_candidates in candidates])
+        positions = np.minimum(np.arange(counts.max()), counts[:, np.newaxis] - 1)
+        self._candidates = np.concatenate(candidates)[positions + (np.cumsum(counts) - counts)[:, np.newaxis]]
+
+    @property
+    def resolution(self) -> int:
+        return self._resolution
+
+    @property
+    def max_candidates(self) -> int:
+        return self._candidates.shape[1]
+
+    def get_cell_index(self, vectors: np.ndarray) -> np.ndarray:
+        """Indices of the cube map cells of vectors (not necessarily unit vectors)."""
+        absolute_vectors = np.abs(vectors)
+        axis = np.argmax(absolute_vectors, axis=1)
+        rows = np.arange(len(vectors))
+        major = vectors[rows, axis]
+        face = 2 * axis + (major < 0)
+        # coordinates on the face, in the order of the remaining axes
+        u = vectors[rows, (axis + 1) % 3] / absolute_vectors[rows, axis]
+        v = vectors[rows, (axis + 2) % 3] / absolute_vectors[rows, axis]
+        r = self._resolution
+        i = np.clip(((u + 1) / 2 * r).astype(int), 0, r - 1)
+        j = np.clip(((v + 1) / 2 * r).astype(int), 0, r - 1)
+        return (face * r + i) * r + j
+
+    def get_nearest(self, vectors: np.ndarray) -> np.ndarray:
+        """Indices of the sampled directions nearest to vectors.
+
+        :param vectors: an `n x 3` matrix of vectors (not necessarily unit vectors)
+        :return: a vector of `n` indices of sampled directions
+        """
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+        candidates = self._candidates[self.get_cell_index(vectors)]
+        cosines = np.einsum('nkj,nj->nk', self._direction_vectors[candidates], vectors)
+        return candidates[np.arange(len(vectors)), np.argmax(cosines, axis=1)]
+
+
+@lru_cache(maxsize=32)
+def get_direction_lookup(n: int, sampling_scheme: SamplingScheme = SamplingScheme.EQUAL_ANGLE) -> DirectionLookup:
+    """Lookup of the nearest sampled direction, built once per sample count and scheme."""
+    return DirectionLookup(get_direction_table(n, sampling_scheme))
+
 
+def _cube_face_to_vectors(face: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Points of a cube face `2 * axis + (negative side)` with coordinates `u`, `v` along the following axes."""
+    axis = face // 2
+    vectors = np.empty(np.shape(u) + (3,))
+    vectors[..., axis] = -1. if face % 2 else 1.
+    vectors[..., (axis + 1) % 3] = u
+    vectors[..., (axis + 2) % 3] = v
+    return vectors
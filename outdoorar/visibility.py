@@ -7,13 +7,25 @@ from typing import List
 import numpy as np
 from dacite import from_dict
 
-from outdoorar import sphere_sampling
+from outdoorar import profiling, sphere_sampling
 from outdoorar.sphere_sampling import SamplingScheme
 
+# maximum number of elements of the `vectors x samples` cosine matrix computed at once
+DEFAULT_CHUNK_SIZE = 2 ** 20
+
 
 class NearestNeighborSelector(Enum):
     EQUAL_SPACING = 1
     COSINE_DISTANCE = 2
+    FIBONACCI_LATTICE = 3  # golden spiral only
+    K_NEAREST = 4  # blends the k nearest directions
+    BILINEAR = 5  # blends the four neighboring directions, equal angle only
+
+
+# selectors blending the visibility of several sampled directions
+INTERPOLATING_SELECTORS = (NearestNeighborSelector.K_NEAREST, NearestNeighborSelector.BILINEAR)
+# default number of directions blended by the k nearest selector
+DEFAULT_NEIGHBORS = 4
 
 
 @dataclass
@@ -39,7 +51,8 @@ class Visibility:
 
 
 def from_json(path_to_file: Path) -> Visibility:
-    return from_dict(data_class=Visibility, data=json.load(path_to_file.open('r')))
+    with profiling.timer('io.visibility.from_json'):
+        return from_dict(data_class=Visibility, data=json.load(path_to_file.open('r')))
 
 
 def get_visibility_index(
@@ -49,6 +62,13 @@ def get_visibility_index(
     sampling_scheme: SamplingScheme,
     algorithm: NearestNeighborSelector,
 ) -> np.ndarray:
+    """Indices of the sampled directions nearest to the given directions.
+
+    :raises ValueError: for the selectors in `INTERPOLATING_SELECTORS`, which blend several directions, see
+        `VisibilityIndex.get_visibility_weights`
+    """
+    if algorithm in INTERPOLATING_SELECTORS:
+        raise ValueError(f"{algorithm} blends several directions, use VisibilityIndex.get_visibility_weights")
     match algorithm:
         case NearestNeighborSelector.EQUAL_SPACING:
             return get_visibility_index_equal_sampling(
@@ -62,17 +82,37 @@ def get_visibility_index(
                 samples,
                 sampling_scheme,
             )
+        case NearestNeighborSelector.FIBONACCI_LATTICE:
+            return get_visibility_index_golden_spiral(points_to_camera_vectors, samples, sampling_scheme)
 
 
 def get_visibility_index_by_cosine_distance(
     points_to_camera_vectors: np.ndarray,
     samples: int,
     sampling_scheme: SamplingScheme,
+    direction_vectors: np.ndarray | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
 ) -> np.ndarray:
-    direction_vectors = sphere_sampling.get_cartesian_coordinates(samples, sampling_scheme)
-    return np.argmax(
-        np.dot(points_to_camera_vectors, direction_vectors.transpose()), axis=1
-    )[:, np.newaxis]
+    if direction_vectors is None:
+        direction_vectors = sphere_sampling.get_direction_table(samples, sampling_scheme)
+    # the vectors are processed in blocks, so that the cosine matrix of a block has at most `chunk_size` elements
+    vectors_per_chunk = max(1, chunk_size // len(direction_vectors))
+    index = np.empty((len(points_to_camera_vectors), 1), dtype=np.intp)
+    for start in range(0, len(points_to_camera_vectors), vectors_per_chunk):
+        index[start:start + vectors_per_chunk, 0] = np.argmax(
+            np.dot(points_to_camera_vectors[start:start + vectors_per_chunk], direction_vectors.transpose()), axis=1
+        )
+    return index
+
+
+def get_visibility_index_golden_spiral(
+    points_to_camera_vectors: np.ndarray,
+    samples: int,
+    sampling_scheme: SamplingScheme = SamplingScheme.GOLDEN_SPIRAL,
+) -> np.ndarray:
+    if sampling_scheme != SamplingScheme.GOLDEN_SPIRAL:
+        raise ValueError(f"Fibonacci lattice lookup requires the golden spiral sampling scheme, not {sampling_scheme}")
+    return sphere_sampling.get_golden_spiral_index(points_to_camera_vectors, samples)[:, np.newaxis]
 
 
 def get_visibility_index_equal_sampling(
@@ -95,26 +135,281 @@ def get_visibility_index_equal_sampling(
     return poly_vis_idx.astype(int)
 
 
+def get_visibility_weights_k_nearest(
+    points_to_camera_vectors: np.ndarray,
+    samples: int,
+    sampling_scheme: SamplingScheme,
+    neighbors: int = DEFAULT_NEIGHBORS,
+    direction_vectors: np.ndarray | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """The k sampled directions nearest to the given directions, weighted by the inverse of their angles.
+
+    :return: `n x k` matrices of indices of sampled directions and of weights, which sum to 1 in a row
+    """
+    if direction_vectors is None:
+        direction_vectors = sphere_sampling.get_direction_table(samples, sampling_scheme)
+    neighbors = min(neighbors, len(direction_vectors))
+    vectors_per_chunk = max(1, chunk_size // len(direction_vectors))
+    index = np.empty((len(points_to_camera_vectors), neighbors), dtype=np.intp)
+    cosines = np.empty((len(points_to_camera_vectors), neighbors))
+    for start in range(0, len(points_to_camera_vectors), vectors_per_chunk):
+        chunk_cosines = np.dot(
+            points_to_camera_vectors[start:start + vectors_per_chunk], direction_vectors.transpose()
+        )
+        chunk_index = np.argpartition(-chunk_cosines, neighbors - 1, axis=1)[:, :neighbors]
+        index[start:start + vectors_per_chunk] = chunk_index
+        cosines[start:start + vectors_per_chunk] = np.take_along_axis(chunk_cosines, chunk_index, axis=1)
+
+    norms = np.linalg.norm(points_to_camera_vectors, axis=1, keepdims=True)
+    angles = np.arccos(np.clip(cosines / np.where(norms > 0, norms, 1.), -1., 1.))
+    weights = 1. / np.maximum(angles, 1e-12)
+    return index, weights / np.sum(weights, axis=1, keepdims=True)
+
+
+def get_visibility_weights_bilinear(
+    points_to_camera_vectors: np.ndarray,
+    points_to_camera_distances: np.ndarray,
+    samples: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """The four equal angle samples around the given directions, with bilinear weights in the azimuthal and
+    polar angles. The azimuth wraps around, the polar angle is clamped at the first and last rows of samples.
+
+    :return: `n x 4` matrices of indices of sampled directions and of weights, which sum to 1 in a row
+    """
+    sqrt_n = int(np.sqrt(samples))
+    polar_angle = np.arccos(np.clip(points_to_camera_vectors[:, 2] / points_to_camera_distances, -1., 1.))
+    azimuthal_angle = np.arctan2(points_to_camera_vectors[:, 1], points_to_camera_vectors[:, 0]) % (2 * np.pi)
+    # positions relative to the sample centers, which are in the middle of the equal spacing cells
+    azimuthal_position = azimuthal_angle / (2 * np.pi / sqrt_n) - 0.5
+    polar_position = polar_angle / (np.pi / sqrt_n) - 0.5
+    azimuthal_idx = np.floor(azimuthal_position)
+    polar_idx = np.floor(polar_position)
+    azimuthal_fraction = azimuthal_position - azimuthal_idx
+    polar_fraction = polar_position - polar_idx
+
+    azimuthal_neighbors = np.stack([azimuthal_idx, azimuthal_idx + 1], axis=1).astype(int) % sqrt_n
+    polar_neighbors = np.clip(np.stack([polar_idx, polar_idx + 1], axis=1).astype(int), 0, sqrt_n - 1)
+    index = (polar_neighbors[:, :, np.newaxis] * sqrt_n + azimuthal_neighbors[:, np.newaxis, :]).reshape(-1, 4)
+    weights = (
+        np.stack([1 - polar_fraction, polar_fraction], axis=1)[:, :, np.newaxis]
+        * np.stack([1 - azimuthal_fraction, azimuthal_fraction], axis=1)[:, np.newaxis, :]
+    ).reshape(-1, 4)
+    return index, weights
+
+
+class VisibilityIndex:
+    """Visibility maps of points prepared for repeated visibility queries, e.g. for every frame: the point
+    matrix, the visibility grid and the sampled directions are kept as arrays, and a query is a few vectorized
+    operations and a gather from the grid."""
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        visibility_grid: np.ndarray,
+        sampling_scheme: SamplingScheme,
+        algorithm: NearestNeighborSelector,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        direction_lookup: bool = True,
+        neighbors: int = DEFAULT_NEIGHBORS,
+    ) -> None:
+        """
+        :param points: an `n x 3` matrix of points
+        :param visibility_grid: an `n x samples` matrix of visibility maps of the points
+        :param sampling_scheme: sphere sampling scheme of the visibility maps
+        :param algorithm: selector of the sampled direction nearest to the direction to the eye
+        :param chunk_size: maximum number of elements of the cosine matrix computed at once
+        :param direction_lookup: whether the cosine distance selector uses a `sphere_sampling.DirectionLookup`
+            instead of comparing directions to all samples
+        :param neighbors: number of directions blended by the k nearest selector
+        """
+        self._points = np.asarray(points, dtype=np.float64)
+        self._visibility_grid = np.asarray(visibility_grid)
+        if self._visibility_grid.shape[0] != len(self._points):
+            raise ValueError(
+                f"Visibility grid of {self._visibility_grid.shape[0]} points, {len(self._points)} points expected"
+            )
+        self._sampling_scheme = sampling_scheme
+        self._algorithm = algorithm
+        self._chunk_size = chunk_size
+        self._neighbors = neighbors
+        self._point_indices = np.arange(len(self._points))
+        self._direction_vectors = None
+        self._direction_lookup = None
+        if algorithm == NearestNeighborSelector.FIBONACCI_LATTICE and sampling_scheme != SamplingScheme.GOLDEN_SPIRAL:
+            raise ValueError(
+                f"Fibonacci lattice lookup requires the golden spiral sampling scheme, not {sampling_scheme}"
+            )
+        if algorithm == NearestNeighborSelector.BILINEAR and sampling_scheme != SamplingScheme.EQUAL_ANGLE:
+            raise ValueError(f"Bilinear interpolation requires the equal angle sampling scheme, not {sampling_scheme}")
+        if algorithm == NearestNeighborSelector.K_NEAREST:
+            self._direction_vectors = sphere_sampling.get_direction_table(self.samples, sampling_scheme)
+        if algorithm == NearestNeighborSelector.COSINE_DISTANCE:
+            self._direction_vectors = sphere_sampling.get_direction_table(self.samples, sampling_scheme)
+            if direction_lookup:
+                self._direction_lookup = sphere_sampling.get_direction_lookup(self.samples, sampling_scheme)
+
+    @classmethod
+    def from_vertices(
+        cls,
+        vertices: list[Vertex],
+        sampling_scheme: SamplingScheme,
+        algorithm: NearestNeighborSelector,
+    ) -> 'VisibilityIndex':
+        return cls(
+            vertices_to_points(vertices),
+            np.array([vertex.visibility_grid for vertex in vertices]),
+            sampling_scheme,
+            algorithm,
+        )
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._points
+
+    @property
+    def visibility_grid(self) -> np.ndarray:
+        return self._visibility_grid
+
+    @property
+    def samples(self) -> int:
+        return self._visibility_grid.shape[1]
+
+    def get_visibility_index(
+        self,
+        points_to_camera_vectors: np.ndarray,
+        points_to_camera_distances: np.ndarray,
+    ) -> np.ndarray:
+        """Indices of the sampled directions nearest to the given directions, as a vector."""
+        match self._algorithm:
+            case NearestNeighborSelector.EQUAL_SPACING | NearestNeighborSelector.BILINEAR:
+                index = get_visibility_index_equal_sampling(
+                    points_to_camera_vectors, points_to_camera_distances, self.samples
+                )
+            case NearestNeighborSelector.COSINE_DISTANCE if self._direction_lookup is not None:
+                index = self._direction_lookup.get_nearest(points_to_camera_vectors)
+            case NearestNeighborSelector.COSINE_DISTANCE | NearestNeighborSelector.K_NEAREST:
+                index = get_visibility_index_by_cosine_distance(
+                    points_to_camera_vectors,
+                    self.samples,
+                    self._sampling_scheme,
+                    self._direction_vectors,
+                    self._chunk_size,
+                )
+            case NearestNeighborSelector.FIBONACCI_LATTICE:
+                index = get_visibility_index_golden_spiral(
+                    points_to_camera_vectors, self.samples, self._sampling_scheme
+                )
+        return index.ravel()
+
+    def get_visibility_weights(
+        self,
+        points_to_camera_vectors: np.ndarray,
+        points_to_camera_distances: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Sampled directions blended for the given directions and their weights, as `n x k` matrices. The
+        selectors of a single nearest direction give it the weight 1."""
+        match self._algorithm:
+            case NearestNeighborSelector.K_NEAREST:
+                return get_visibility_weights_k_nearest(
+                    points_to_camera_vectors,
+                    self.samples,
+                    self._sampling_scheme,
+                    self._neighbors,
+                    self._direction_vectors,
+                    self._chunk_size,
+                )
+            case NearestNeighborSelector.BILINEAR:
+                return get_visibility_weights_bilinear(
+                    points_to_camera_vectors, points_to_camera_distances, self.samples
+                )
+        index = self.get_visibility_index(points_to_camera_vectors, points_to_camera_distances)
+        return index[:, np.newaxis], np.ones((len(index), 1))
+
+    def calculate_visibility(self, eye: list[float] | np.ndarray) -> np.ndarray:
+        """Decides visibility of the points from an eye, or from each of a batch of eyes. The interpolating
+        selectors decide by the weighted vote of the blended directions, a point is visible with at least half
+        of the weight.
+
+        :param eye: camera location, or an `m x 3` matrix of camera locations
+        :return: a boolean vector of the points, or an `m x n` matrix for a batch of eyes, `True` when visible
+        """
+        with profiling.timer('visibility.calculate_visibility'):
+            eye = np.asarray(eye, dtype=np.float64)
+            points_to_camera_vectors = eye[..., np.newaxis, :] - self._points
+            points_to_camera_distances = np.sqrt(np.sum(np.square(points_to_camera_vectors), axis=-1))
+            profiling.count('visibility.queries', points_to_camera_distances.size)
+            if self._algorithm not in INTERPOLATING_SELECTORS:
+                poly_vis_idx = self.get_visibility_index(
+                    points_to_camera_vectors.reshape(-1, 3), points_to_camera_distances.ravel()
+                ).reshape(points_to_camera_distances.shape)
+                nn_visibility = self._visibility_grid[self._point_indices, poly_vis_idx]
+                return nn_visibility >= points_to_camera_distances
+
+            poly_vis_idx, weights = self.get_visibility_weights(
+                points_to_camera_vectors.reshape(-1, 3), points_to_camera_distances.ravel()
+            )
+            shape = points_to_camera_distances.shape + (poly_vis_idx.shape[1],)
+            neighbors_visibility = self._visibility_grid[
+                self._point_indices[:, np.newaxis], poly_vis_idx.reshape(shape)
+            ] >= points_to_camera_distances[..., np.newaxis]
+            return np.sum(weights.reshape(shape) * neighbors_visibility, axis=-1) >= 0.5
+
+
 def calculate_visibility(
     vertices: list[Vertex],
     eye: list[float],
     sampling_scheme: SamplingScheme,
     algorithm: NearestNeighborSelector,
 ) -> np.ndarray:
-    points = vertices_to_points(vertices)
-    points_to_camera_vectors = eye - points
-    points_to_camera_distances = np.sqrt(np.sum(np.square(points_to_camera_vectors), axis=1))
-    poly_vis_idx = get_visibility_index(
-        points_to_camera_vectors,
-        points_to_camera_distances,
-        len(vertices[0].visibility_grid),
+    return VisibilityIndex.from_vertices(vertices, sampling_scheme, algorithm).calculate_visibility(eye)
+
+
+def calculate_points_visibility(
+    points: np.ndarray,
+    visibility_grid: np.ndarray,
+    eye: list[float] | np.ndarray,
+    sampling_scheme: SamplingScheme,
+    algorithm: NearestNeighborSelector,
+) -> np.ndarray:
+    """Decides visibility of points from the eye by the visibility maps of the points, e.g. as loaded by
+    `visibility_io.load`. For repeated queries keep a `VisibilityIndex` instead.
+
+    :param points: an `n x 3` matrix of points
+    :param visibility_grid: an `n x samples` matrix of visibility maps of the points
+    :param eye: camera location
+    :param sampling_scheme: sphere sampling scheme of the visibility maps
+    :param algorithm: selector of the sampled direction nearest to the direction to the eye
+    :return: a boolean vector, `True` for visible points
+    """
+    return VisibilityIndex(points, visibility_grid, sampling_scheme, algorithm).calculate_visibility(eye)
+
+
+def calculate_visibility_batch(
+    vertices: list[Vertex],
+    eyes: np.ndarray,
+    sampling_scheme: SamplingScheme,
+    algorithm: NearestNeighborSelector,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """Decides visibility of the vertices from many cameras at once, e.g. all the poses of `cameras.sfm`.
+    The nearest sampled directions of all cameras are found in a single vectorized pass, in chunks.
+
+    :param vertices: vertices with visibility maps
+    :param eyes: an `m x 3` matrix of camera locations
+    :param sampling_scheme: sphere sampling scheme of the visibility maps
+    :param algorithm: selector of the sampled direction nearest to the direction to the eye
+    :param chunk_size: maximum number of elements of the cosine matrix computed at once
+    :return: an `m x n` boolean matrix, `True` where a vertex is visible from a camera
+    """
+    visibility_index = VisibilityIndex(
+        vertices_to_points(vertices),
+        np.array([vertex.visibility_grid for vertex in vertices]),
         sampling_scheme,
         algorithm,
+        chunk_size,
     )
-    nn_visibility = [
-        vertex.visibility_grid[vis_idx] for vis_idx, vertex in zip(poly_vis_idx.ravel(), vertices)
-    ]
-    return nn_visibility >= points_to_camera_distances
+    return visibility_index.calculate_visibility(np.asarray(eyes, dtype=np.float64).reshape(-1, 3))
 
 
 def vertices_to_points(vertices: list[Vertex]) -> np.ndarray:
@@ -0,0 +1,145 @@
+import json
+import struct
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+
+import numpy as np
+
+from outdoorar.visibility import Visibility
+
+VISIBILITY_MAPS_SUFFIX = '.vis'
+VISIBILITY_MAPS_MAGIC = b'OARVIS\x00\x00'
+# bumped whenever the layout of the file changes, older versions are still readable if listed here
+VISIBILITY_MAPS_VERSION = 2
+SUPPORTED_VISIBILITY_MAPS_VERSIONS = (1, 2)
+# array buffers start at multiples of the alignment, so that memory-mapped arrays are aligned
+_ALIGNMENT = 64
+_HEADER_SIZE_FORMAT = '<Q'
+
+
+class VisibilityMapsFormat(Enum):
+    JSON = 1
+    BINARY = 2
+
+
+@dataclass
+class VisibilityMaps:
+    """Visibility maps of a polyline in array form: the points, the edges between them and a
+    `points x samples` grid of squared distances to the nearest face in the sampled directions. Optionally the
+    ids of the nearest faces (`-1` for no face) and metadata, e.g. fingerprints of the inputs (since version 2)."""
+    name: str
+    points: np.ndarray
+    edges: np.ndarray
+    visibility_grid: np.ndarray
+    hit_faces: np.ndarray | None = None
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def samples(self) -> int:
+        return self.visibility_grid.shape[1]
+
+    @classmethod
+    def from_visibility(cls, visibility: Visibility) -> 'VisibilityMaps':
+        return cls(
+            name=visibility.name,
+            points=np.array([[v.x, v.y, v.z] for v in visibility.vertices], dtype=np.float64).reshape(-1, 3),
+            edges=np.array([[e.vertex1, e.vertex2] for e in visibility.edges], dtype=np.int32).reshape(-1, 2),
+            visibility_grid=np.array([v.visibility_grid for v in visibility.vertices], dtype=np.float32),
+        )
+
+    @classmethod
+    def from_json(cls, path_to_file: Path) -> 'VisibilityMaps':
+        """Reads visibility maps saved as JSON, without creating the intermediate dataclasses."""
+        data = json.load(path_to_file.open('r'))
+        vertices = sorted(data['vertices'], key=lambda vertex: vertex['id'])
+        return cls(
+            name=data['name'],
+            points=np.array([[v['x'], v['y'], v['z']] for v in vertices], dtype=np.float64).reshape(-1, 3),
+            edges=np.array([[e['vertex1'], e['vertex2']] for e in data['edges']], dtype=np.int32).reshape(-1, 2),
+            visibility_grid=np.array([v['visibility_grid'] for v in vertices], dtype=np.float32),
+        )
+
+
+def save(path_to_file: Path, visibility_maps: VisibilityMaps) -> None:
+    """Saves visibility maps in the binary format: a magic number, the size of a JSON header describing the
+    arrays, the header and the raw, aligned array buffers.
+
+    :param path_to_file: path to the output file
+    :param visibility_maps: visibility maps of a polyline
+    """
+    arrays = {
+        'points': np.ascontiguousarray(visibility_maps.points, dtype='<f8'),
+        'edges': np.ascontiguousarray(visibility_maps.edges, dtype='<i4'),
+        'visibility_grid': np.ascontiguousarray(visibility_maps.visibility_grid, dtype='<f4'),
+    }
+    if visibility_maps.hit_faces is not None:
+        arrays['hit_faces'] = np.ascontiguousarray(visibility_maps.hit_faces, dtype='<i4')
+    descriptions = {}
+    offset = 0
+    for key, array in arrays.items():
+        descriptions[key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(
+        {
+            'version': VISIBILITY_MAPS_VERSION,
+            'name': visibility_maps.name,
+            'arrays': descriptions,
+            'metadata': visibility_maps.metadata,
+        }
+    ).encode()
+    data_start = _align(len(VISIBILITY_MAPS_MAGIC) + struct.calcsize(_HEADER_SIZE_FORMAT) + len(header))
+    header += b' ' * (data_start - len(VISIBILITY_MAPS_MAGIC) - struct.calcsize(_HEADER_SIZE_FORMAT) - len(header))
+
+    with path_to_file.open('wb') as output_file:
+        output_file.write(VISIBILITY_MAPS_MAGIC)
+        output_file.write(struct.pack(_HEADER_SIZE_FORMAT, len(header)))
+        output_file.write(header)
+        for key, array in arrays.items():
+            output_file.seek(data_start + descriptions[key]['offset'])
+            output_file.write(array.tobytes())
+
+
+def load(path_to_file: Path, mmap: bool = True) -> VisibilityMaps:
+    """Loads visibility maps saved by `save`.
+
+    :param path_to_file: path to the file
+    :param mmap: whether to memory-map the arrays (read-only) instead of reading them into memory
+    :return: visibility maps of a polyline
+    """
+    with path_to_file.open('rb') as input_file:
+        if input_file.read(len(VISIBILITY_MAPS_MAGIC)) != VISIBILITY_MAPS_MAGIC:
+            raise ValueError(f"Not a visibility maps file {path_to_file}")
+        size_bytes = input_file.read(struct.calcsize(_HEADER_SIZE_FORMAT))
+        header = json.loads(input_file.read(struct.unpack(_HEADER_SIZE_FORMAT, size_bytes)[0]))
+        data_start = input_file.tell()
+    if header['version'] not in SUPPORTED_VISIBILITY_MAPS_VERSIONS:
+        raise ValueError(f"Unsupported version {header['version']} of visibility maps file {path_to_file}")
+
+    arrays = {}
+    for key, description in header['arrays'].items():
+        dtype = np.dtype(description['dtype'])
+        shape = tuple(description['shape'])
+        offset = data_start + description['offset']
+        if mmap and np.prod(shape) > 0:
+            arrays[key] = np.memmap(path_to_file, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            with path_to_file.open('rb') as input_file:
+                input_file.seek(offset)
+                arrays[key] = np.fromfile(input_file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return VisibilityMaps(name=header['name'], metadata=header.get('metadata', {}), **arrays)
+
+
+def convert_json(path_to_file: Path) -> Path:
+    """Converts visibility maps saved as JSON into the binary format, next to the JSON file.
+
+    :param path_to_file: path to the JSON file
+    :return: path to the binary file
+    """
+    output_path = path_to_file.with_suffix(VISIBILITY_MAPS_SUFFIX)
+    save(output_path, VisibilityMaps.from_json(path_to_file))
+    return output_path
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
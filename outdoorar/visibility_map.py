@@ -0,0 +1,471 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
+from outdoorar import sphere_sampling, visibility_io
+from outdoorar.checkpoint import JobManifest, get_parameters_fingerprint
+from outdoorar.constants import get_visibility_dir
+from outdoorar.geometry import Geometry
+from outdoorar.parallel import SharedArrays, attach_shared_arrays, get_workers_count, release_at_worker_exit
+from outdoorar.ply_reader import PlyFileReader
+from outdoorar.ray_casting import BoundingVolumeHierarchy, RayCastingBackend, TriangleMesh, build_intersector
+from outdoorar.sphere_sampling import SamplingScheme
+from outdoorar.visibility import Edge, Vertex, Visibility
+from outdoorar.visibility_io import VisibilityMaps, VisibilityMapsFormat
+
+# hashes of the faces of the mesh the binary maps of a visibility directory were last built from
+MESH_FACE_HASHES_FILE_NAME = 'mesh_face_hashes.npy'
+
+
+@dataclass
+class VisibilityMapJob:
+    """A block of points of a polyline, for which visibility maps of the given sample counts are calculated."""
+    polyline: str
+    first_point: int
+    points: np.ndarray
+    sample_counts: tuple[int, ...]
+
+    @property
+    def job_id(self) -> str:
+        return f'{self.polyline}-{self.first_point}-' + '-'.join(map(str, self.sample_counts))
+
+
+def calculate_visibility_maps(
+        points: np.ndarray,
+        model_mesh: TriangleMesh | BoundingVolumeHierarchy,
+        direction_vectors: np.ndarray,
+) -> np.ndarray:
+    """Calculates visibility maps, i.e. squared distances to the nearest face in every sampled direction.
+
+    :param points: an `n x 3` matrix of points
+    :param model_mesh: scene geometry
+    :param direction_vectors: an `m x 3` matrix of sampled directions
+    :return: an `n x m` matrix of squared distances, `inf` where nothing occludes the point
+    """
+    visibility_maps, _ = model_mesh.nearest_hit(
+        points[:, np.newaxis, :], direction_vectors[np.newaxis, :, :], 0
+    )
+    return visibility_maps
+
+
+@dataclass
+class VisibilityMapsUpdate:
+    """Work done by an incremental update of the visibility maps of a polyline."""
+    name: str
+    samples: int
+    rebuilt: bool = False
+    recomputed_points: int = 0
+    recomputed_rays: int = 0
+    patched_rays: int = 0
+
+
+def calculate_visibility_maps_for_sample_counts(
+        points: np.ndarray,
+        model_mesh: TriangleMesh | BoundingVolumeHierarchy,
+        sample_counts: Sequence[int],
+        sampling_scheme: SamplingScheme,
+) -> dict[int, np.ndarray]:
+    """Calculates visibility maps of several resolutions in a single pass over the mesh: the direction
+    vectors of all the sample counts are cast together and the result is split afterwards."""
+    direction_vectors = [
+        sphere_sampling.get_direction_table(samples, sampling_scheme) for samples in sample_counts
+    ]
+    visibility_maps = calculate_visibility_maps(points, model_mesh, np.concatenate(direction_vectors))
+    splits = np.cumsum([len(vectors) for vectors in direction_vectors])[:-1]
+    return dict(zip(sample_counts, np.split(visibility_maps, splits, axis=1)))
+
+
+def calculate_visibility_map_job(
+        job: VisibilityMapJob,
+        model_mesh: TriangleMesh | BoundingVolumeHierarchy,
+        sampling_scheme: SamplingScheme,
+) -> tuple[VisibilityMapJob, dict[int, np.ndarray]]:
+    return job, calculate_visibility_maps_for_sample_counts(
+        job.points, model_mesh, job.sample_counts, sampling_scheme
+    )
+
+
+def create_visibility_map_jobs(
+        annotations: dict[str, Geometry],
+        sample_counts: Sequence[int],
+        points_per_job: int = 16,
+        single_pass: bool = True,
+) -> list[VisibilityMapJob]:
+    """Splits the work into jobs of at most `points_per_job` points of a polyline. With `single_pass` a job
+    covers all the sample counts, otherwise there is a separate job for every sample count."""
+    sample_counts_per_job = [tuple(sample_counts)] if single_pass else [(samples,) for samples in sample_counts]
+    return [
+        VisibilityMapJob(name, first_point, geometry.vertices[first_point:first_point + points_per_job], samples)
+        for name, geometry in annotations.items()
+        for first_point in range(0, len(geometry.vertices), points_per_job)
+        for samples in sample_counts_per_job
+    ]
+
+
+# state of a worker process of the visibility map pool, set once by `_init_visibility_map_worker`
+_visibility_map_worker_state = {}
+
+
+def _init_visibility_map_worker(descriptors, backend, sampling_scheme) -> None:
+    arrays = attach_shared_arrays(descriptors)
+    _visibility_map_worker_state['model_mesh'] = build_intersector(
+        Geometry('', arrays['vertices'], faces=arrays['faces']), backend
+    )
+    _visibility_map_worker_state['sampling_scheme'] = sampling_scheme
+    release_at_worker_exit(_visibility_map_worker_state)
+
+
+def _calculate_visibility_map_job_in_worker(job: VisibilityMapJob) -> tuple[VisibilityMapJob, dict[int, np.ndarray]]:
+    return calculate_visibility_map_job(
+        job, _visibility_map_worker_state['model_mesh'], _visibility_map_worker_state['sampling_scheme']
+    )
+
+
+def build_visibility_maps(
+        model_geometry: Geometry,
+        annotations: dict[str, Geometry],
+        sample_counts: Sequence[int],
+        sampling_scheme: SamplingScheme,
+        backend: RayCastingBackend = RayCastingBackend.BVH,
+        workers: int | None = 1,
+        points_per_job: int = 16,
+        single_pass: bool = True,
+        checkpoint_dir: Path | None = None,
+) -> dict[int, dict[str, np.ndarray]]:
+    """Calculates visibility maps of all annotated points for all the sample counts.
+
+    :param model_geometry: scene geometry
+    :param annotations: polylines by name
+    :param sample_counts: numbers of sampled directions
+    :param sampling_scheme: sphere sampling scheme
+    :param backend: ray casting backend
+    :param workers: number of processes the jobs are distributed to, all CPU cores when `None`
+    :param points_per_job: number of points in a job
+    :param single_pass: whether to calculate all the sample counts of a point in a single pass over the mesh
+    :param checkpoint_dir: directory where every finished job is saved, a rerun with the same arguments loads the
+        finished jobs and continues with the rest; no checkpoints when `None`
+    :return: `n x m` matrices of squared distances by sample count and polyline name
+    """
+    jobs = create_visibility_map_jobs(annotations, sample_counts, points_per_job, single_pass)
+    visibility_maps = {
+        samples: {name: np.full((len(geometry.vertices), samples), np.inf) for name, geometry in annotations.items()}
+        for samples in sample_counts
+    }
+
+    def store(job: VisibilityMapJob, job_maps: dict[int, np.ndarray]) -> None:
+        for samples, maps in job_maps.items():
+            visibility_maps[samples][job.polyline][job.first_point:job.first_point + len(maps)] = maps
+
+    manifest = None
+    if checkpoint_dir is not None:
+        manifest = JobManifest(checkpoint_dir, get_parameters_fingerprint(
+            vertices=model_geometry.vertices,
+            faces=model_geometry.faces,
+            annotations={name: geometry.vertices for name, geometry in annotations.items()},
+            sample_counts=list(sample_counts),
+            sampling_scheme=sampling_scheme.name,
+            points_per_job=points_per_job,
+            single_pass=single_pass,
+        ))
+        completed = manifest.completed
+        for job in jobs:
+            if job.job_id in completed:
+                store(job, {int(key[2:]): maps for key, maps in manifest.load_job(job.job_id).items()})
+        jobs = [job for job in jobs if job.job_id not in completed]
+
+    def collect(results: Iterable[tuple[VisibilityMapJob, dict[int, np.ndarray]]]) -> None:
+        for job, job_maps in tqdm(results, total=len(jobs)):
+            store(job, job_maps)
+            if manifest is not None:
+                manifest.save_job(job.job_id, **{f'n_{samples}': maps for samples, maps in job_maps.items()})
+
+    workers = get_workers_count(workers)
+    if len(jobs) == 0:
+        pass
+    elif workers == 1:
+        model_mesh = build_intersector(model_geometry, backend)
+        collect(calculate_visibility_map_job(job, model_mesh, sampling_scheme) for job in jobs)
+    else:
+        with SharedArrays(
+            vertices=model_geometry.vertices, faces=model_geometry.faces,
+        ) as shared_arrays, ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_visibility_map_worker,
+            initargs=(shared_arrays.descriptors, backend, sampling_scheme),
+        ) as executor:
+            collect(executor.map(_calculate_visibility_map_job_in_worker, jobs))
+
+    return visibility_maps
+
+
+def read_annotations(annotations_file_paths: Iterable[Path]) -> dict[str, Geometry]:
+    geometries = (PlyFileReader(file_path).geometry for file_path in annotations_file_paths)
+    return {geometry.name: geometry for geometry in geometries}
+
+
+def create_visibility(annotations_geometry: Geometry, visibility_maps: np.ndarray) -> Visibility:
+    visibility = Visibility(
+        name=annotations_geometry.name,
+        edges=[Edge(*row.tolist()) for row in annotations_geometry.edges],
+    )
+    for point_idx, point in enumerate(annotations_geometry.vertices):
+        point_list = point.tolist()
+        visibility.vertices.append(
+            Vertex(
+                id=point_idx,
+                x=point_list[0],
+                y=point_list[1],
+                z=point_list[2],
+                visibility_grid=visibility_maps[point_idx].tolist()
+            )
+        )
+    return visibility
+
+
+def save_visibility_maps(
+        annotations: dict[str, Geometry],
+        visibility_maps: dict[int, dict[str, np.ndarray]],
+        sampling_scheme: SamplingScheme,
+        file_format: VisibilityMapsFormat = VisibilityMapsFormat.JSON,
+) -> None:
+    """Saves visibility maps, a file per polyline, in the visibility directory of the sampling scheme and
+    sample count."""
+    for samples, polylines_maps in visibility_maps.items():
+        visibility_directory_path = get_visibility_dir(sampling_scheme).joinpath(f'n_{samples}')
+        visibility_directory_path.mkdir(exist_ok=True, parents=True)
+        for name, maps in polylines_maps.items():
+            match file_format:
+                case VisibilityMapsFormat.JSON:
+                    json.dump(
+                        asdict(create_visibility(annotations[name], maps)),
+                        visibility_directory_path.joinpath(name + ".json").open('w'),
+                        indent=2,
+                    )
+                case VisibilityMapsFormat.BINARY:
+                    visibility_io.save(
+                        visibility_directory_path.joinpath(name + visibility_io.VISIBILITY_MAPS_SUFFIX),
+                        VisibilityMaps(name, annotations[name].vertices, annotations[name].edges, maps),
+                    )
+
+
+def get_face_hashes(geometry: Geometry) -> np.ndarray:
+    """64-bit hashes of the vertex coordinates of every face. They identify faces across edits of a mesh, which
+    may renumber vertices and faces."""
+    coordinates = np.ascontiguousarray(
+        geometry.vertices[geometry.faces].reshape(len(geometry.faces), -1), dtype=np.float64
+    ).view(np.uint64)
+    hashes = np.full(len(coordinates), 0xCBF29CE484222325, dtype=np.uint64)
+    for column in coordinates.T:
+        hashes = _mix_bits(hashes ^ column)
+    return hashes
+
+
+def _mix_bits(values: np.ndarray) -> np.ndarray:
+    """The splitmix64 finalizer, multiplications wrap around modulo 2^64."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def get_fingerprint(*arrays: np.ndarray) -> str:
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def update_visibility_maps(
+        model_geometry: Geometry,
+        annotations: dict[str, Geometry],
+        sample_counts: Sequence[int],
+        sampling_scheme: SamplingScheme,
+        backend: RayCastingBackend = RayCastingBackend.BVH,
+        visibility_dir: Path | None = None,
+) -> list[VisibilityMapsUpdate]:
+    """Updates binary visibility maps, with the ids of the nearest faces, after the mesh or the annotations
+    changed. Every map file keeps fingerprints of its inputs (mesh faces, annotation points, sampling scheme and
+    sample count) and only what they invalidate is recomputed:
+
+    - a changed polyline reuses the rows of the points that did not move,
+    - after a mesh edit, faces are matched by their coordinates; rays whose nearest face was removed are cast
+      again and the other rays are only tested against the added faces, patching the maps where those are nearer.
+
+    Maps without stored face ids, or built for other samples, are rebuilt. Patched distances agree with a full
+    rebuild up to the single precision of the stored grid.
+
+    :param model_geometry: scene geometry
+    :param annotations: polylines by name
+    :param sample_counts: numbers of sampled directions
+    :param sampling_scheme: sphere sampling scheme
+    :param backend: ray casting backend
+    :param visibility_dir: directory of the maps of the sampling scheme, by default in the resources
+    :return: work done for every polyline and sample count
+    """
+    face_hashes = get_face_hashes(model_geometry)
+    intersectors = {}
+
+    def get_model_mesh() -> TriangleMesh | BoundingVolumeHierarchy:
+        if 'model' not in intersectors:
+            intersectors['model'] = build_intersector(model_geometry, backend)
+        return intersectors['model']
+
+    updates = []
+    for samples in sample_counts:
+        visibility_directory_path = (visibility_dir or get_visibility_dir(sampling_scheme)).joinpath(f'n_{samples}')
+        visibility_directory_path.mkdir(exist_ok=True, parents=True)
+        face_hashes_path = visibility_directory_path.joinpath(MESH_FACE_HASHES_FILE_NAME)
+        old_face_hashes = np.load(face_hashes_path) if face_hashes_path.exists() else None
+        direction_vectors = sphere_sampling.get_direction_table(samples, sampling_scheme)
+        mesh_edit = _MeshEdit(model_geometry, face_hashes, old_face_hashes, backend)
+
+        for name, geometry in annotations.items():
+            updates.append(_update_polyline_visibility_maps(
+                visibility_directory_path.joinpath(name + visibility_io.VISIBILITY_MAPS_SUFFIX),
+                geometry,
+                direction_vectors,
+                sampling_scheme,
+                mesh_edit,
+                get_model_mesh,
+            ))
+        np.save(face_hashes_path, face_hashes)
+    return updates
+
+
+class _MeshEdit:
+    """Differences between the mesh the maps were built from and the current mesh, by face hashes."""
+
+    def __init__(
+            self,
+            model_geometry: Geometry,
+            face_hashes: np.ndarray,
+            old_face_hashes: np.ndarray | None,
+            backend: RayCastingBackend,
+    ) -> None:
+        self.fingerprint = get_fingerprint(face_hashes)
+        self.old_fingerprint = None if old_face_hashes is None else get_fingerprint(old_face_hashes)
+        self.old_to_new = None
+        self.added_faces_mesh = None
+        if old_face_hashes is None or self.old_fingerprint == self.fingerprint:
+            return
+
+        # ids of old faces in the current mesh, -1 for removed faces
+        order = np.argsort(face_hashes)
+        positions = np.searchsorted(face_hashes[order], old_face_hashes)
+        found = positions < len(order)
+        found[found] = face_hashes[order[positions[found]]] == old_face_hashes[found]
+        self.old_to_new = np.full(len(old_face_hashes), -1)
+        self.old_to_new[found] = order[positions[found]]
+
+        self.added_faces = np.flatnonzero(~np.isin(face_hashes, old_face_hashes))
+        if len(self.added_faces) > 0:
+            self.added_faces_mesh = build_intersector(
+                Geometry('', model_geometry.vertices, faces=model_geometry.faces[self.added_faces]), backend
+            )
+
+
+def _update_polyline_visibility_maps(
+        file_path: Path,
+        geometry: Geometry,
+        direction_vectors: np.ndarray,
+        sampling_scheme: SamplingScheme,
+        mesh_edit: _MeshEdit,
+        get_model_mesh,
+) -> VisibilityMapsUpdate:
+    samples = len(direction_vectors)
+    update = VisibilityMapsUpdate(geometry.name, samples)
+    points = np.asarray(geometry.vertices, dtype=np.float64)
+    metadata = {
+        'mesh': mesh_edit.fingerprint,
+        'annotation': get_fingerprint(points, geometry.edges),
+        'sampling_scheme': sampling_scheme.name,
+        'samples': samples,
+    }
+    old_maps = visibility_io.load(file_path, mmap=False) if file_path.exists() else None
+    if old_maps is not None and old_maps.metadata == metadata:
+        return update
+
+    if (
+            old_maps is None
+            or old_maps.hit_faces is None
+            or old_maps.metadata.get('sampling_scheme') != sampling_scheme.name
+            or old_maps.metadata.get('samples') != samples
+            or old_maps.metadata.get('mesh') not in (mesh_edit.fingerprint, mesh_edit.old_fingerprint)
+    ):
+        visibility_grid, hit_faces = get_model_mesh().nearest_hit(
+            points[:, np.newaxis, :], direction_vectors[np.newaxis, :, :], 0
+        )
+        update.rebuilt = True
+        update.recomputed_points = len(points)
+        update.recomputed_rays = visibility_grid.size
+    else:
+        visibility_grid, hit_faces, reused = _reuse_rows(points, old_maps)
+        if not np.all(reused):
+            new_rows = np.flatnonzero(~reused)
+            visibility_grid[new_rows], hit_faces[new_rows] = get_model_mesh().nearest_hit(
+                points[new_rows, np.newaxis, :], direction_vectors[np.newaxis, :, :], 0
+            )
+            update.recomputed_points = len(new_rows)
+            update.recomputed_rays = len(new_rows) * samples
+        if old_maps.metadata['mesh'] != mesh_edit.fingerprint and np.any(reused):
+            _patch_mesh_edit(
+                points, direction_vectors, visibility_grid, hit_faces, np.flatnonzero(reused), mesh_edit,
+                get_model_mesh, update,
+            )
+
+    visibility_io.save(file_path, VisibilityMaps(
+        geometry.name, points, geometry.edges, visibility_grid, hit_faces, metadata
+    ))
+    return update
+
+
+def _reuse_rows(points: np.ndarray, old_maps: VisibilityMaps) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rows of the old maps for the points at the same coordinates, `inf` and `-1` rows for the other points."""
+    old_rows = {tuple(point): row for row, point in enumerate(np.asarray(old_maps.points).tolist())}
+    rows = np.array([old_rows.get(tuple(point), -1) for point in points.tolist()], dtype=int)
+    reused = rows >= 0
+    visibility_grid = np.full((len(points), old_maps.samples), np.inf)
+    hit_faces = np.full((len(points), old_maps.samples), -1, dtype=int)
+    visibility_grid[reused] = old_maps.visibility_grid[rows[reused]]
+    hit_faces[reused] = old_maps.hit_faces[rows[reused]]
+    return visibility_grid, hit_faces, reused
+
+
+def _patch_mesh_edit(
+        points: np.ndarray,
+        direction_vectors: np.ndarray,
+        visibility_grid: np.ndarray,
+        hit_faces: np.ndarray,
+        rows: np.ndarray,
+        mesh_edit: _MeshEdit,
+        get_model_mesh,
+        update: VisibilityMapsUpdate,
+) -> None:
+    """Patches rows of the maps built from the old mesh in place."""
+    row_hit_faces = hit_faces[rows]
+    new_hit_faces = np.where(row_hit_faces >= 0, mesh_edit.old_to_new[row_hit_faces], -1)
+    hit_faces[rows] = new_hit_faces
+
+    # rays whose nearest face was removed are cast again against the whole mesh
+    lost_rows, lost_directions = np.nonzero((row_hit_faces >= 0) & (new_hit_faces < 0))
+    if len(lost_rows) > 0:
+        lost_rows = rows[lost_rows]
+        visibility_grid[lost_rows, lost_directions], hit_faces[lost_rows, lost_directions] = get_model_mesh(
+        ).nearest_hit(points[lost_rows], direction_vectors[lost_directions], 0)
+        update.recomputed_rays += len(lost_rows)
+
+    # the other rays can only get nearer, by hitting an added face
+    if mesh_edit.added_faces_mesh is not None:
+        added_distances, added_hit_faces = mesh_edit.added_faces_mesh.nearest_hit(
+            points[rows, np.newaxis, :], direction_vectors[np.newaxis, :, :], 0
+        )
+        nearer = added_distances < visibility_grid[rows]
+        patched_rows, patched_directions = np.nonzero(nearer)
+        visibility_grid[rows[patched_rows], patched_directions] = added_distances[nearer]
+        hit_faces[rows[patched_rows], patched_directions] = mesh_edit.added_faces[added_hit_faces[nearer]]
+        update.patched_rays += len(patched_rows)
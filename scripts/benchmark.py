@@ -0,0 +1,112 @@
+"""Benchmarks of the hot paths: ray casting, depth maps, visibility lookup and file loading.
+
+Results are saved as JSON; with `--baseline` they are compared to the results of an earlier run, and the script
+exits with status 1 when a benchmark is slower than the baseline by more than the tolerance, e.g.
+
+    python scripts/benchmark.py --output output/benchmarks/baseline.json
+    python scripts/benchmark.py --baseline output/benchmarks/baseline.json
+"""
+import argparse
+import sys
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from outdoorar import benchmark, rasterization, sphere_sampling, visibility
+from outdoorar.benchmark import BenchmarkResult
+from outdoorar.cameras import DEFAULT_CAMERAS_FILE, load_camera_rig
+from outdoorar.constants import ANNOTATIONS_DIR, MODELS_DIR, OUTPUT_DIR, get_visibility_dir
+from outdoorar.ground_truth import calculate_z_buffer, get_annotations, get_cameras
+from outdoorar.obj_reader import ObjFileReader
+from outdoorar.ply_reader import PlyFileReader
+from outdoorar.ray_casting import RayCastingBackend, Triangle, build_intersector
+from outdoorar.sphere_sampling import SamplingScheme
+from outdoorar.visibility import NearestNeighborSelector
+from outdoorar.visibility_io import VisibilityMaps
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--output', type=str, default=str(OUTPUT_DIR.joinpath('benchmarks', 'latest.json')))
+parser.add_argument('--baseline', type=str, default=None, help='results of an earlier run to compare with')
+parser.add_argument('--tolerance', type=float, default=benchmark.DEFAULT_TOLERANCE)
+parser.add_argument('--repeats', type=int, default=5)
+parser.add_argument('--filter', type=str, default='', help='only benchmarks whose names contain this text')
+args = parser.parse_args()
+
+mesh_names = {
+    'cube': 'cube.obj',
+    '1024': 'decimatedMesh_closedHoles_1024.obj',
+    '2048': 'decimatedMesh_closedHoles_2048.obj',
+    '4096': 'decimatedMesh_closedHoles_4096.obj',
+}
+n = 32  # visibility maps of n * n samples
+polyline_name = 'YellowPolyline'
+
+camera_rig = load_camera_rig()
+camera_location = camera_rig.centers[0]
+annotations, _ = get_annotations()
+annotation_rays = annotations - camera_location
+
+benchmarks = {}
+
+# ray casting of a single triangle, for a single ray and for matrices and tensors of rays
+triangle = Triangle([0., 0., 0.], [1., 0., 0.], [0., 1., 0.])
+ray_vectors = sphere_sampling.get_cartesian_coordinates(n * n, SamplingScheme.GOLDEN_SPIRAL)
+ray_origin = np.array([0.2, 0.2, 1.])
+for dimensions, rays in [(1, ray_vectors[0]), (2, ray_vectors), (3, ray_vectors.reshape(n, n, 3))]:
+    benchmarks[f'ray_casting.triangle.{dimensions}d'] = partial(triangle.does_ray_intersect, ray_origin, rays)
+
+# z-buffer of the rays from a camera to all annotated points
+for mesh_name, mesh_file_name in mesh_names.items():
+    model_geometry = ObjFileReader(MODELS_DIR.joinpath(mesh_file_name)).geometry
+    for backend in RayCastingBackend:
+        model_mesh = build_intersector(model_geometry, backend)
+        benchmarks[f'ray_casting.z_buffer.{mesh_name}.{backend.name.lower()}'] = partial(
+            calculate_z_buffer, annotation_rays, model_mesh, camera_location
+        )
+    # depth map of the same camera, the alternative to ray casting of every annotated point
+    benchmarks[f'rasterization.depth_map.{mesh_name}'] = partial(
+        rasterization.render_depth_map, model_geometry.vertices, model_geometry.faces,
+        camera_rig.camera_intrinsics[0], camera_rig.extrinsics[0], camera_rig.image_sizes[0], cull_back_faces=True,
+    )
+
+# visibility lookup from the precomputed visibility maps
+for sampling_scheme in SamplingScheme:
+    vertices = visibility.from_json(
+        get_visibility_dir(sampling_scheme).joinpath(f'n_{n}', f'{polyline_name}.json')
+    ).vertices
+    for algorithm in [NearestNeighborSelector.EQUAL_SPACING, NearestNeighborSelector.COSINE_DISTANCE]:
+        benchmarks[f'visibility.{sampling_scheme.name.lower()}.{algorithm.name.lower()}'] = partial(
+            visibility.calculate_visibility, vertices, camera_location, sampling_scheme, algorithm
+        )
+
+# loading of models, annotations and visibility maps
+for mesh_name, mesh_file_name in mesh_names.items():
+    benchmarks[f'io.obj.{mesh_name}'] = partial(ObjFileReader, MODELS_DIR.joinpath(mesh_file_name))
+benchmarks['io.obj.full'] = partial(ObjFileReader, MODELS_DIR.joinpath('decimatedMesh_closedHoles.obj'))
+for annotations_file_path in sorted(ANNOTATIONS_DIR.glob('*.ply')):
+    benchmarks[f'io.ply.{annotations_file_path.stem}'] = partial(PlyFileReader, annotations_file_path)
+visibility_file_path = get_visibility_dir(SamplingScheme.GOLDEN_SPIRAL).joinpath(f'n_{n}', f'{polyline_name}.json')
+benchmarks['io.cameras.json'] = partial(get_cameras, DEFAULT_CAMERAS_FILE)
+benchmarks['io.cameras.camera_rig'] = partial(load_camera_rig, DEFAULT_CAMERAS_FILE)
+benchmarks['io.cameras.camera_rig_cached'] = partial(load_camera_rig, DEFAULT_CAMERAS_FILE, use_cache=True)
+benchmarks['io.visibility.from_json'] = partial(visibility.from_json, visibility_file_path)
+benchmarks['io.visibility.maps_from_json'] = partial(VisibilityMaps.from_json, visibility_file_path)
+
+benchmarks = {name: function for name, function in benchmarks.items() if args.filter in name}
+
+
+def print_result(result: BenchmarkResult) -> None:
+    print(f"{result.name:<48}{result.median * 1e3:>12.3f} ms (best {result.best * 1e3:.3f} ms)")
+
+
+results = benchmark.run_benchmarks(benchmarks, args.repeats, progress=print_result)
+output_path = Path(args.output)
+benchmark.save_results(output_path, results)
+print(f"Results saved to {output_path}")
+
+if args.baseline is not None:
+    comparisons = benchmark.compare_with_baseline(results, benchmark.load_results(Path(args.baseline)))
+    print(benchmark.format_comparisons(comparisons, args.tolerance))
+    if any(comparison.is_regression(args.tolerance) for comparison in comparisons):
+        sys.exit(1)
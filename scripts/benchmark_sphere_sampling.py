@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+
+from outdoorar import sphere_sampling
+from outdoorar.sphere_sampling import SamplingScheme
+
+
+def get_golden_spiral_cartesian_coordinates_loop(samples: int) -> np.ndarray:
+    """The former, scalar implementation of `sphere_sampling.get_golden_spiral_cartesian_coordinates`."""
+    points = np.zeros((samples, 3))
+    phi = np.pi * (np.sqrt(5.) - 1.)
+    for i in range(samples):
+        y = 1 - (i / float(samples - 1)) * 2
+        radius = np.sqrt(1 - y * y)
+        theta = phi * i
+        points[i] = np.cos(theta) * radius, y, np.sin(theta) * radius
+    return points
+
+
+def get_equal_angle_cartesian_coordinates_outer(samples: int) -> np.ndarray:
+    """The former implementation of equal angle samples, through `np.outer` and `np.dstack`."""
+    return sphere_sampling.get_cartesian_coordinates_from_spherical(
+        *sphere_sampling.get_equal_angle_spherical_coordinates(samples)
+    ).reshape((samples, 3), order='F')
+
+
+def measure(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def consume_blocks(samples: int, sampling_scheme: SamplingScheme) -> None:
+    for _ in sphere_sampling.iter_cartesian_coordinates(samples, sampling_scheme, 2 ** 16, np.float32):
+        pass
+
+
+legacy_implementations = {
+    SamplingScheme.EQUAL_ANGLE: get_equal_angle_cartesian_coordinates_outer,
+    SamplingScheme.GOLDEN_SPIRAL: get_golden_spiral_cartesian_coordinates_loop,
+}
+
+print(f"{'scheme':<14}{'samples':>10}{'legacy [s]':>12}{'float64 [s]':>13}{'float32 [s]':>13}{'blocks [s]':>12}")
+for sampling_scheme in SamplingScheme:
+    for n in [32, 128, 512, 1024]:
+        samples = n * n
+        legacy = legacy_implementations[sampling_scheme]
+        # the scalar loop takes more than 10 s for a million samples
+        skip_legacy = sampling_scheme == SamplingScheme.GOLDEN_SPIRAL and samples > 2 ** 18
+        legacy_time = float('nan') if skip_legacy else measure(legacy, samples)
+        print(
+            f"{sampling_scheme.name:<14}{samples:>10}{legacy_time:>12.4f}"
+            f"{measure(sphere_sampling.get_cartesian_coordinates, samples, sampling_scheme):>13.4f}"
+            f"{measure(sphere_sampling.get_cartesian_coordinates, samples, sampling_scheme, np.float32):>13.4f}"
+            f"{measure(consume_blocks, samples, sampling_scheme):>12.4f}"
+        )
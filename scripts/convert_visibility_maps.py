@@ -0,0 +1,6 @@
+from outdoorar import visibility_io
+from outdoorar.constants import VISIBILITY_DIR
+
+for json_file_path in sorted(VISIBILITY_DIR.rglob('*.json')):
+    output_path = visibility_io.convert_json(json_file_path)
+    print(f'{json_file_path.relative_to(VISIBILITY_DIR)} -> {output_path.name}')
@@ -0,0 +1,79 @@
+"""Sweep of mesh decimation levels: the model is decimated to every target face count, and for every level the
+visibility of all annotations in all images is calculated and compared with the ground truth. The fastest level
+whose agreement meets `--min-agreement` is recommended, e.g.
+
+    python scripts/decimation_sweep.py --faces 8192 4096 2048 1024 512 --min-agreement 0.95
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from outdoorar import results
+from outdoorar.cameras import load_camera_rig
+from outdoorar.constants import MODELS_DIR, OUTPUT_DIR, RESOURCES_DIR
+from outdoorar.decimation import decimate
+from outdoorar.ground_truth import calculate_visibility_matrix, get_annotations
+from outdoorar.obj_reader import ObjFileReader
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--model', type=str, default=str(MODELS_DIR.joinpath('decimatedMesh_closedHoles.obj')))
+parser.add_argument('--faces', type=int, nargs='+', default=[8192, 4096, 2048, 1024, 512])
+parser.add_argument('--ground-truth', type=str, default=str(RESOURCES_DIR.joinpath('ground_truth.csv')))
+parser.add_argument('--min-agreement', type=float, default=0.95, help='fraction of cells equal to the ground truth')
+parser.add_argument('--output', type=str, default=str(OUTPUT_DIR.joinpath('decimation', 'sweep.json')))
+args = parser.parse_args()
+
+model_geometry = ObjFileReader(Path(args.model), use_cache=True).geometry
+camera_rig = load_camera_rig()
+annotations, annotations_info = get_annotations()
+
+# the ground truth in the order of the views and annotations
+image_names, columns, ground_truth = results.read_csv(Path(args.ground_truth))
+view_rows = {name: row for row, name in enumerate(camera_rig.names)}
+column_indices = {column: index for index, column in enumerate(annotations_info)}
+rows = np.array([view_rows[name] for name in image_names])
+points = np.array([column_indices[(polyline, vertex_idx)] for polyline, vertex_idx in columns])
+known = ~np.isnan(ground_truth)
+
+levels = []
+for target_faces in [None, *sorted(args.faces, reverse=True)]:
+    start = time.perf_counter()
+    geometry = model_geometry if target_faces is None else decimate(model_geometry, target_faces)
+    decimation_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    visibility = calculate_visibility_matrix(geometry, camera_rig, annotations)
+    visibility_seconds = time.perf_counter() - start
+
+    visible = visibility[rows][:, points] == 1
+    levels.append({
+        'target_faces': target_faces,
+        'faces': len(geometry.faces),
+        'decimation_seconds': decimation_seconds,
+        'visibility_seconds': visibility_seconds,
+        'agreement': float(np.mean(visible[known] == (ground_truth[known] == 1))),
+        'false_visible': int(np.count_nonzero(visible & known & (ground_truth == 0))),
+        'false_occluded': int(np.count_nonzero(~visible & known & (ground_truth == 1))),
+    })
+    level = levels[-1]
+    print(
+        f"{'full' if target_faces is None else target_faces:>8}{level['faces']:>10} faces"
+        f"{level['decimation_seconds']:>10.2f} s decimation{level['visibility_seconds']:>10.2f} s visibility"
+        f"{level['agreement']:>10.4f} agreement{level['false_visible']:>6} false visible"
+        f"{level['false_occluded']:>6} false occluded"
+    )
+
+output_path = Path(args.output)
+output_path.parent.mkdir(parents=True, exist_ok=True)
+output_path.write_text(json.dumps({'model': args.model, 'levels': levels}, indent=2))
+print(f"Results saved to {output_path}")
+
+accurate_levels = [level for level in levels if level['agreement'] >= args.min_agreement]
+if accurate_levels:
+    fastest = min(accurate_levels, key=lambda level: level['visibility_seconds'])
+    print(f"Fastest level with agreement of at least {args.min_agreement}: {fastest['faces']} faces")
+else:
+    print(f"No level reaches agreement of {args.min_agreement}")
@@ -1,5 +1,14 @@
-from outdoorar.constants import MODELS_DIR
+from outdoorar import profiling
+from outdoorar.constants import MODELS_DIR, OUTPUT_DIR
 from outdoorar.ground_truth import calculate_visibility_from_full_geometry
+from outdoorar.ray_casting import RayCastingBackend
 
 model_file_path = MODELS_DIR.joinpath('decimatedMesh_closedHoles.obj')
-calculate_visibility_from_full_geometry(model_file_path, "ground_truth.csv")
+profiles_dir = OUTPUT_DIR.joinpath('profiles')
+with profiling.profile(
+        profiles_dir.joinpath('ground_truth.json'), profiles_dir.joinpath('ground_truth.trace.json')
+) as profiler:
+    calculate_visibility_from_full_geometry(
+        model_file_path, "ground_truth.csv", backend=RayCastingBackend.BVH, workers=None,
+    )
+print(profiler.format_summary())
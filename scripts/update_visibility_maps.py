@@ -0,0 +1,26 @@
+from outdoorar.constants import ANNOTATIONS_DIR, MODELS_DIR
+from outdoorar.obj_reader import ObjFileReader
+from outdoorar.ray_casting import RayCastingBackend
+from outdoorar.sphere_sampling import SamplingScheme
+from outdoorar.visibility_map import read_annotations, update_visibility_maps
+
+model_file_path = MODELS_DIR.joinpath('decimatedMesh_closedHoles.obj')
+model_geometry = ObjFileReader(model_file_path, use_cache=True).geometry
+
+n_range = [2, 4, 8, 16, 32]
+sampling_scheme = SamplingScheme.GOLDEN_SPIRAL
+annotations = read_annotations(
+    annotations_file_path
+    for annotations_file_path in ANNOTATIONS_DIR.iterdir()
+    if annotations_file_path.suffix == '.ply'
+)
+
+updates = update_visibility_maps(
+    model_geometry,
+    annotations,
+    [n * n for n in n_range],
+    sampling_scheme,
+    backend=RayCastingBackend.BVH,
+)
+for update in updates:
+    print(update)
@@ -0,0 +1,31 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from outdoorar import benchmark
+from outdoorar.benchmark import BenchmarkResult
+
+
+class TestBenchmark(TestCase):
+
+    def test_run_benchmarks(self):
+        calls = []
+        results = benchmark.run_benchmarks({'append': lambda: calls.append(1)}, repeats=3, warmup=2)
+        self.assertEqual(5, len(calls))
+        self.assertEqual('append', results[0].name)
+        self.assertEqual(3, len(results[0].times))
+
+    def test_compare_with_baseline(self):
+        results = [BenchmarkResult('fast', [1., 2., 3.]), BenchmarkResult('slow', [3., 3., 3.]),
+                   BenchmarkResult('new', [1.])]
+        baseline = [BenchmarkResult('fast', [2.]), BenchmarkResult('slow', [2.])]
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            results_path = Path(temporary_dir).joinpath('baseline.json')
+            benchmark.save_results(results_path, baseline)
+            comparisons = benchmark.compare_with_baseline(results, benchmark.load_results(results_path))
+
+        self.assertListEqual(['fast', 'slow'], [comparison.name for comparison in comparisons])
+        self.assertAlmostEqual(1.5, comparisons[1].ratio)
+        self.assertFalse(comparisons[0].is_regression())
+        self.assertTrue(comparisons[1].is_regression())
+        self.assertFalse(comparisons[1].is_regression(tolerance=0.5))
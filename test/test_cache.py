@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import ground_truth, profiling, results
+from outdoorar.cache import ResultCache, get_content_key
+from outdoorar.cameras import DEFAULT_CAMERAS_FILE, CameraRig
+from outdoorar.constants import MODELS_DIR
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self) -> None:
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temporary_dir.name)
+
+    def tearDown(self) -> None:
+        self.temporary_dir.cleanup()
+
+    def test_get_content_key(self):
+        key = get_content_key('scene', np.arange(3))
+        self.assertEqual(key, get_content_key('scene', np.arange(3)))
+        self.assertNotEqual(key, get_content_key('scene', np.arange(4)))
+        self.assertNotEqual(get_content_key('ab', 'c'), get_content_key('a', 'bc'))
+
+    def test_put_and_get(self):
+        result_cache = ResultCache(self.directory)
+        self.assertIsNone(result_cache.get('key'))
+        result_cache.put('key', np.array([1, 0, 1], dtype=np.uint8))
+        np.testing.assert_array_equal([1, 0, 1], result_cache.get('key'))
+        self.assertEqual(1, len(ResultCache(self.directory)))
+
+    def test_prune__least_recently_used(self):
+        result_cache = ResultCache(self.directory)
+        for entry, key in enumerate(['a', 'b', 'c']):
+            result_cache.put(key, np.zeros(10))
+            os.utime(self.directory.joinpath(f'{key}.npy'), ns=(entry, entry))
+        entry_size = self.directory.joinpath('a.npy').stat().st_size
+        self.assertIsNotNone(result_cache.get('a'))
+
+        # 'b' is the least recently used entry since 'a' was read
+        self.assertEqual(1, result_cache.prune(2 * entry_size))
+        self.assertIsNone(result_cache.get('b'))
+        self.assertIsNotNone(result_cache.get('a'))
+
+    def test_put__size_bound(self):
+        result_cache = ResultCache(self.directory, max_bytes=1000)
+        for key in range(20):
+            result_cache.put(str(key), np.zeros(100, dtype=np.uint8))
+        self.assertLessEqual(sum(path.stat().st_size for path in self.directory.glob('*.npy')), 1000)
+        self.assertGreater(len(result_cache), 0)
+
+    def test_get_pose_cache_keys__other_cameras(self):
+        cameras = ground_truth.get_cameras(DEFAULT_CAMERAS_FILE)
+        camera_rig = CameraRig.from_sfm(cameras)
+        some_camera_rig = CameraRig.from_sfm(dict(cameras, views=cameras['views'][:3]))
+        keys = ground_truth.get_pose_cache_keys({'mesh': 'hash'}, camera_rig, [0, 1, 2, 3])
+        self.assertListEqual(keys[:3], ground_truth.get_pose_cache_keys({'mesh': 'hash'}, some_camera_rig, [0, 1, 2]))
+        self.assertEqual(4, len(set(keys)))
+        self.assertNotEqual(keys[0], ground_truth.get_pose_cache_keys({'mesh': 'other'}, camera_rig, [0])[0])
+
+    def test_calculate_visibility_from_full_geometry__cameras_added(self):
+        model_file_path = self.directory.joinpath('cube.obj')
+        shutil.copy(MODELS_DIR.joinpath('cube.obj'), model_file_path)
+        cameras = ground_truth.get_cameras(DEFAULT_CAMERAS_FILE)
+        cameras_sfm = self.directory.joinpath('cameras.sfm')
+        arguments = dict(
+            output_file_name=self.directory.joinpath('cube.csv'),
+            results_path=self.directory.joinpath('results'),
+            cameras_sfm=cameras_sfm,
+            cache_path=self.directory.joinpath('cache'),
+        )
+
+        for views_count in (3, 5):
+            cameras_sfm.write_text(json.dumps(dict(cameras, views=cameras['views'][:views_count])))
+            with profiling.profile() as profiler:
+                ground_truth.calculate_visibility_from_full_geometry(model_file_path, **arguments)
+        # the results of the first run are replaced, but its poses are not calculated again
+        self.assertEqual(3, profiler.counters['ground_truth.cache_hits'])
+        self.assertEqual(5, len(results.read_csv(arguments['output_file_name'])[0]))
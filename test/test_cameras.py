@@ -0,0 +1,71 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import ground_truth
+from outdoorar.cache import get_cache_path
+from outdoorar.cameras import DEFAULT_CAMERAS_FILE, CameraRig, load_camera_rig
+
+
+class TestCameras(TestCase):
+
+    def setUp(self) -> None:
+        self.cameras = ground_truth.get_cameras(DEFAULT_CAMERAS_FILE)
+
+    def test_from_sfm(self):
+        camera_rig = CameraRig.from_sfm(self.cameras)
+        views = ground_truth.get_views(self.cameras)
+        self.assertEqual(len(self.cameras['views']), len(camera_rig))
+        self.assertTrue(np.all(camera_rig.posed))
+        self.assertListEqual([view['imgName'] for view in views.values()], list(camera_rig.names))
+
+        for pose_obj in ground_truth.get_poses(self.cameras)[:5]:
+            view = list(camera_rig.pose_ids).index(ground_truth.get_pose_id(pose_obj))
+            pose = ground_truth.get_pose(pose_obj)
+            camera_location = ground_truth.get_camera_location(pose)
+            np.testing.assert_array_equal(camera_location, camera_rig.centers[view])
+            np.testing.assert_allclose(
+                ground_truth.get_extrinsic_matrix(pose, camera_location), camera_rig.extrinsics[view], atol=1e-14
+            )
+            np.testing.assert_array_equal(
+                ground_truth.get_intrinsic_matrix(self.cameras), camera_rig.camera_intrinsics[view]
+            )
+            np.testing.assert_array_equal(
+                [views[pose_obj['poseId']]['width'], views[pose_obj['poseId']]['height']],
+                camera_rig.image_sizes[view],
+            )
+
+    def test_from_sfm__multiple_intrinsics_and_views_without_pose(self):
+        second_intrinsic = dict(self.cameras['intrinsics'][0], intrinsicId='2', pxFocalLength='1000')
+        cameras = dict(self.cameras, intrinsics=self.cameras['intrinsics'] + [second_intrinsic])
+        cameras['views'] = [dict(cameras['views'][0], intrinsicId='2')] + cameras['views'][1:]
+        cameras['poses'] = cameras['poses'][:-1]
+        camera_rig = CameraRig.from_sfm(cameras)
+
+        self.assertListEqual([1, 0], list(camera_rig.intrinsics_index[:2]))
+        self.assertEqual(1000, camera_rig.camera_intrinsics[0, 0, 0])
+        unposed = [view['poseId'] == self.cameras['poses'][-1]['poseId'] for view in cameras['views']]
+        np.testing.assert_array_equal(np.logical_not(unposed), camera_rig.posed)
+        self.assertFalse(np.any(camera_rig.project(np.zeros((1, 3))).in_frustum[unposed]))
+
+    def test_load_camera_rig__cache(self):
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            cameras_sfm = Path(temporary_dir).joinpath('cameras.sfm')
+            shutil.copy(DEFAULT_CAMERAS_FILE, cameras_sfm)
+            load_camera_rig(cameras_sfm)
+            self.assertFalse(get_cache_path(cameras_sfm).exists())
+            camera_rig = load_camera_rig(cameras_sfm, use_cache=True)
+            self.assertTrue(get_cache_path(cameras_sfm).exists())
+            cached_camera_rig = load_camera_rig(cameras_sfm, use_cache=True)
+            for name, array in camera_rig.to_arrays().items():
+                np.testing.assert_array_equal(array, getattr(cached_camera_rig, name))
+
+            # a changed file invalidates the cache
+            cameras = json.loads(cameras_sfm.read_text())
+            cameras['views'] = cameras['views'][:3]
+            cameras_sfm.write_text(json.dumps(cameras))
+            self.assertEqual(3, len(load_camera_rig(cameras_sfm, use_cache=True)))
@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar.decimation import decimate
+from outdoorar.geometry import Geometry
+
+
+def get_icosphere(subdivisions: int) -> Geometry:
+    """A closed mesh of a unit sphere, faces counter-clockwise as seen from outside."""
+    t = (1 + 5 ** 0.5) / 2
+    vertices = [
+        [-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t],
+        [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1],
+    ]
+    faces = [
+        [0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6],
+        [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10],
+        [8, 6, 7], [9, 8, 1],
+    ]
+    vertices = [np.array(vertex) / np.linalg.norm(vertex) for vertex in vertices]
+    for _ in range(subdivisions):
+        midpoints = {}
+        subdivided_faces = []
+        for face in faces:
+            middle = []
+            for a, b in zip(face, face[1:] + face[:1]):
+                if (b, a) not in midpoints:
+                    midpoint = vertices[a] + vertices[b]
+                    vertices.append(midpoint / np.linalg.norm(midpoint))
+                    midpoints[(a, b)] = len(vertices) - 1
+                middle.append(midpoints.get((a, b), midpoints.get((b, a))))
+            subdivided_faces.extend([
+                [face[0], middle[0], middle[2]],
+                [face[1], middle[1], middle[0]],
+                [face[2], middle[2], middle[1]],
+                middle,
+            ])
+        faces = subdivided_faces
+    return Geometry('icosphere', np.array(vertices), faces=np.array(faces, dtype=np.int32))
+
+
+def get_edge_valences(faces: np.ndarray) -> np.ndarray:
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    return np.unique(edges, axis=0, return_counts=True)[1]
+
+
+class TestDecimation(TestCase):
+
+    def test_decimate__closed_mesh(self):
+        sphere = get_icosphere(2)
+        decimated = decimate(sphere, 100)
+
+        self.assertLessEqual(len(decimated.faces), 100)
+        self.assertGreaterEqual(len(decimated.faces), 96)
+        self.assertEqual(np.int32, decimated.faces.dtype)
+        # still closed and manifold, with every vertex used and close to the sphere
+        self.assertTrue(np.all(get_edge_valences(decimated.faces) == 2))
+        self.assertEqual(len(decimated.vertices), len(np.unique(decimated.faces)))
+        np.testing.assert_allclose(1, np.linalg.norm(decimated.vertices, axis=1), atol=0.1)
+        # faces stay oriented outwards
+        corners = decimated.vertices[decimated.faces]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.assertTrue(np.all(np.einsum('ij,ij->i', normals, corners.mean(axis=1)) > 0))
+
+    def test_decimate__open_mesh_with_duplicate_vertices(self):
+        # a flat 6 x 6 grid of squares, every face with its own vertices
+        x, y = np.meshgrid(np.arange(7.), np.arange(7.))
+        grid = np.stack((x.ravel(), y.ravel(), np.zeros(49)), axis=1)
+        corners = (np.arange(6)[:, np.newaxis] + 7 * np.arange(6)).ravel()
+        faces = np.concatenate((
+            np.stack((corners, corners + 1, corners + 8), axis=1), np.stack((corners, corners + 8, corners + 7), axis=1)
+        ))
+        vertices = grid[faces.ravel()]
+        decimated = decimate(Geometry('grid', vertices, faces=np.arange(len(vertices)).reshape(-1, 3)), 10)
+
+        self.assertLessEqual(len(decimated.faces), 10)
+        np.testing.assert_array_equal(0, decimated.vertices[:, 2])
+        # the boundary keeps its corners, so the faces still cover the square
+        for corner in [[0, 0, 0], [6, 0, 0], [0, 6, 0], [6, 6, 0]]:
+            self.assertTrue(np.any(np.all(decimated.vertices == corner, axis=1)))
+        corners = decimated.vertices[decimated.faces]
+        areas = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1) / 2
+        self.assertAlmostEqual(36, np.sum(areas))
@@ -1,5 +1,11 @@
+import shutil
+import tempfile
+from pathlib import Path
 from unittest import TestCase
 
+import numpy as np
+
+from outdoorar import cache
 from outdoorar.constants import MODELS_DIR
 from outdoorar.obj_reader import ObjFileReader
 
@@ -15,3 +21,42 @@ class TestObjReader(TestCase):
         self.assertEqual("cube", geometry.name)
         self.assertEqual(12, len(geometry.faces))
         self.assertListEqual([4, 6, 7], geometry.faces[6].tolist())
+
+    def test_obj_file_reader__with_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory).joinpath('cube.obj')
+            shutil.copy(self.file_path, file_path)
+
+            geometry = ObjFileReader(file_path, use_cache=True).geometry
+            self.assertTrue(cache.get_cache_path(file_path).exists())
+            cached_geometry = ObjFileReader(file_path, use_cache=True).geometry
+            self.assertEqual("cube", cached_geometry.name)
+            np.testing.assert_array_equal(geometry.vertices, cached_geometry.vertices)
+            np.testing.assert_array_equal(geometry.faces, cached_geometry.faces)
+
+            # the cache is rebuilt when the file changes
+            file_path.write_text(file_path.read_text() + 'v  2.0  2.0  2.0\n')
+            self.assertEqual(9, len(ObjFileReader(file_path, use_cache=True).geometry.vertices))
+            self.assertEqual(9, len(ObjFileReader(file_path, use_cache=True, content_hash=True).geometry.vertices))
+
+    def test_obj_file_reader__with_cache_and_dtype(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory).joinpath('triangle.obj')
+            file_path.write_text('v 0.1 0.2 0.3\nv 1.1 0.2 0.3\nv 0.1 1.2 0.3\nf 1 2 3\n')
+
+            vertices = ObjFileReader(file_path, use_cache=True, dtype=np.float32).geometry.vertices
+            self.assertEqual(np.float32, vertices.dtype)
+            self.assertEqual(np.float32(0.1), vertices[0, 0])
+            # the cache made by the single precision load keeps the coordinates in double precision
+            vertices = ObjFileReader(file_path, use_cache=True).geometry.vertices
+            self.assertEqual(np.float64, vertices.dtype)
+            self.assertEqual(0.1, vertices[0, 0])
+            vertices = ObjFileReader(file_path, use_cache=True, dtype=np.float32).geometry.vertices
+            self.assertEqual(np.float32, vertices.dtype)
+
+    def test_obj_file_reader__with_malformed_vertices(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory).joinpath('malformed.obj')
+            file_path.write_text('v 0 0 0\nv 0 1\nv 1 0 0\nf 1 2 3\n')
+            with self.assertRaises(ValueError):
+                ObjFileReader(file_path)
@@ -0,0 +1,68 @@
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import util
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import parallel
+from outdoorar.parallel import SharedArrays
+
+
+def _sum_rows(descriptors, rows):
+    arrays = parallel.attach_shared_arrays(descriptors)
+    return arrays['values'][rows].sum(axis=1).tolist()
+
+
+_worker_state = {}
+
+
+def _init_worker(descriptors, attached_blocks_path):
+    _worker_state['values'] = parallel.attach_shared_arrays(descriptors)['values']
+    parallel.release_at_worker_exit(_worker_state)
+    # runs after the release, which has a higher exit priority
+    util.Finalize(None, partial(_save_attached_blocks, attached_blocks_path), exitpriority=-1)
+
+
+def _save_attached_blocks(attached_blocks_path):
+    Path(attached_blocks_path).write_text(f'{len(_worker_state)} {len(parallel._attached_blocks)}')
+
+
+def _get_first_value():
+    return float(_worker_state['values'][0])
+
+
+class TestParallel(TestCase):
+
+    def test_shared_arrays(self):
+        values = np.arange(12, dtype=np.float32).reshape(4, 3)
+        with SharedArrays(values=values) as shared_arrays, ProcessPoolExecutor(max_workers=2) as executor:
+            descriptor = shared_arrays.descriptors['values']
+            self.assertEqual((4, 3), descriptor.shape)
+            sums = list(executor.map(_sum_rows, [shared_arrays.descriptors] * 2, [[0, 1], [2, 3]]))
+        self.assertListEqual([[3, 12], [21, 30]], sums)
+
+    def test_attached_arrays_are_read_only(self):
+        with SharedArrays(values=np.ones(3)) as shared_arrays:
+            values = parallel.attach_shared_arrays(shared_arrays.descriptors)['values']
+            np.testing.assert_array_equal(np.ones(3), values)
+            self.assertFalse(values.flags.writeable)
+            del values
+        # the block attached by this process is closed together with the shared arrays
+        self.assertDictEqual({}, parallel._attached_blocks)
+
+    def test_release_at_worker_exit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            attached_blocks_path = Path(directory).joinpath('attached_blocks.txt')
+            with SharedArrays(values=np.ones(3)) as shared_arrays, ProcessPoolExecutor(
+                    max_workers=1, initializer=_init_worker, initargs=(shared_arrays.descriptors, attached_blocks_path),
+            ) as executor:
+                self.assertEqual(1., executor.submit(_get_first_value).result())
+            # the worker state is cleared and the block is closed when the worker exits
+            self.assertEqual('0 0', attached_blocks_path.read_text())
+
+    def test_get_workers_count(self):
+        self.assertEqual(3, parallel.get_workers_count(3))
+        self.assertLessEqual(1, parallel.get_workers_count(None))
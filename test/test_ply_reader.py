@@ -1,3 +1,5 @@
+import tempfile
+from pathlib import Path
 from unittest import TestCase
 
 import numpy as np
@@ -34,3 +36,29 @@ class TestPlyFileReader(TestCase):
         numpy.testing.assert_array_almost_equal(expected_vertices, geometry.vertices)
         numpy.testing.assert_array_almost_equal(expected_edges, geometry.edges)
         numpy.testing.assert_array_almost_equal(expected_faces, geometry.faces)
+
+    def test_ply_file_reader__binary(self) -> None:
+        ascii_geometry = PlyFileReader(self.file_path).geometry
+        header = self.file_path.read_text().split('end_header\n')[0] + 'end_header\n'
+        vertex_dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+        edge_dtype = [('vertex1', 'i4'), ('vertex2', 'i4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+
+        for file_format, byte_order in [('binary_little_endian', '<'), ('binary_big_endian', '>')]:
+            vertices = np.zeros(4, dtype=[(name, byte_order + t) for name, t in vertex_dtype])
+            vertices['x'], vertices['y'], vertices['z'] = ascii_geometry.vertices.T
+            edges = np.zeros(4, dtype=[(name, byte_order + t) for name, t in edge_dtype])
+            edges['vertex1'], edges['vertex2'] = ascii_geometry.edges.T
+
+            with tempfile.TemporaryDirectory() as directory:
+                file_path = Path(directory).joinpath('BluePolyline.ply')
+                file_path.write_bytes(
+                    header.replace('format ascii', f'format {file_format}').encode()
+                    + vertices.tobytes() + edges.tobytes()
+                )
+                reader = PlyFileReader(file_path)
+                geometry = reader.geometry
+
+            self.assertEqual(4, len(reader.vertices))
+            self.assertEqual("BluePolyline", geometry.name)
+            numpy.testing.assert_array_almost_equal(ascii_geometry.vertices, geometry.vertices, decimal=6)
+            numpy.testing.assert_array_equal(ascii_geometry.edges, geometry.edges)
@@ -0,0 +1,57 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import profiling
+from outdoorar.ray_casting import TriangleMesh
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.mesh = TriangleMesh(np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.]]), np.array([[0, 1, 2]]))
+        self.rays = np.array([[0., 0., -1.], [0., 0., 1.], [1., 1., -1.]])
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled(self):
+        with profiling.timer('stage'):
+            profiling.count('counter')
+        self.assertIsNone(profiling.get_profiler())
+
+    def test_ray_casting_statistics(self):
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            summary_path = Path(temporary_dir).joinpath('profile.json')
+            trace_path = Path(temporary_dir).joinpath('trace.json')
+            with profiling.profile(summary_path, trace_path):
+                self.mesh.nearest_hit(np.array([0.2, 0.2, 1.]), self.rays)
+                self.mesh.any_hit(np.array([0.2, 0.2, 1.]), self.rays, 4.)
+            summary = json.loads(summary_path.read_text())
+            trace = json.loads(trace_path.read_text())
+
+        self.assertFalse(profiling.is_enabled())
+        self.assertEqual(1, summary['stages']['ray_casting.nearest_hit']['calls'])
+        self.assertDictEqual(
+            {'ray_casting.rays': 6, 'ray_casting.faces_tested': 6, 'ray_casting.hits': 2}, summary['counters']
+        )
+        self.assertIn('ray_casting.rays_per_second', summary['rates'])
+        self.assertListEqual(
+            ['ray_casting.nearest_hit', 'ray_casting.any_hit'], [event['name'] for event in trace['traceEvents']]
+        )
+
+    def test_merge(self):
+        worker_profiler = profiling.Profiler()
+        with worker_profiler.timer('stage'):
+            worker_profiler.count('counter', 2)
+        snapshot = worker_profiler.snapshot(reset=True)
+        self.assertDictEqual({}, worker_profiler.counters)
+
+        profiler = profiling.Profiler()
+        profiler.count('counter')
+        profiler.merge(snapshot)
+        self.assertEqual(3, profiler.counters['counter'])
+        self.assertEqual(1, profiler.stages['stage'][0])
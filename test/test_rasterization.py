@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import ground_truth, rasterization, rendering
+from outdoorar.ray_casting import TriangleMesh
+
+
+class TestRasterization(TestCase):
+
+    def setUp(self) -> None:
+        self.intrinsic = np.array([[100., 0., 50., 0.], [0., 100., 40., 0.], [0., 0., 1., 0.]])
+        self.extrinsic = np.eye(4)
+        self.image_size = (100, 80)
+        # a triangle facing the camera, tilted so that its depth grows to the right, `z = 2 + x`
+        self.vertices = np.array([[-1., -1., 1.], [-1., 3., 1.], [3., -1., 5.]])
+        self.faces = np.array([[0, 1, 2]])
+
+    def test_render_depth_map(self):
+        depth_map = rasterization.render_depth_map(
+            self.vertices, self.faces, self.intrinsic, self.extrinsic, self.image_size, scale=0.1
+        )
+        self.assertEqual((8, 10), depth_map.shape)
+
+        # the rays through the pixel centres hit the plane of the triangle at depth `2 / (1 - x)`
+        columns, rows = np.meshgrid(np.arange(10), np.arange(8))
+        ray_x = ((columns + 0.5) / 0.1 - 50) / 100
+        ray_y = ((rows + 0.5) / 0.1 - 40) / 100
+        depths = 2 / (1 - ray_x)
+        # the triangle is `x >= -1, y >= -1, x + y <= 2` in its plane
+        margins = np.min([depths * ray_x + 1, depths * ray_y + 1, 2 - depths * (ray_x + ray_y)], axis=0)
+        covered, uncovered = margins > 1e-9, margins < -1e-9
+        self.assertTrue(np.any(covered) and np.any(uncovered))
+        np.testing.assert_allclose(depths[covered], depth_map[covered])
+        self.assertTrue(np.all(np.isinf(depth_map[uncovered])))
+
+    def test_render_depth_map__cull_back_faces(self):
+        for faces, culled in ((self.faces, False), (self.faces[:, ::-1], True)):
+            depth_map = rasterization.render_depth_map(
+                self.vertices, faces, self.intrinsic, self.extrinsic, self.image_size, scale=0.1,
+                cull_back_faces=True,
+            )
+            self.assertEqual(culled, np.all(np.isinf(depth_map)))
+
+    def test_is_visible_in_depth_map(self):
+        # a square at depth 2 in front of the left half of the image
+        vertices = np.array([[-2., -2., 2.], [-2., 2., 2.], [0., 2., 2.], [0., -2., 2.]])
+        faces = np.array([[0, 1, 2], [0, 2, 3]])
+        depth_map = rasterization.render_depth_map(vertices, faces, self.intrinsic, self.extrinsic, self.image_size)
+
+        points = np.array([
+            [-0.3, 0., 3.],  # behind the square
+            [0.3, 0., 3.],  # next to the square
+            [-0.5, 0.1, 2.],  # on the square
+            [-0.5, 0.1, 1.9999],  # on the square, in front of the surface in the pixel
+            [0.3, 0., -3.],  # behind the camera
+        ])
+        projections = rendering.project_points(
+            points, self.intrinsic, self.extrinsic[np.newaxis], np.array([self.image_size])
+        )
+        visible = rasterization.is_visible_in_depth_map(
+            depth_map, projections.pixels[0], projections.depths[0], projections.in_frustum[0]
+        )
+        np.testing.assert_array_equal([False, True, True, True, False], visible)
+
+    def test_is_visible_in_depth_map__face_crossing_near_plane(self):
+        points = np.array([
+            [0., 0.35, 1.],  # below the ground
+            [0., 0.6, 2.],  # below the ground
+            [0., 0.45, 2.],  # above the ground
+            [0.5, 0.5, 3.],  # above the ground
+        ])
+        projections = rendering.project_points(
+            points, self.intrinsic, self.extrinsic[np.newaxis], np.array([self.image_size])
+        )
+        # the ground `y = 0.1 + 0.2 * z` below the camera, from behind the camera to the distance, as a face with
+        # two and with one vertex behind the camera
+        for vertices in (
+                np.array([[-20., -0.9, -5.], [20., -0.9, -5.], [0., 4.1, 20.]]),
+                np.array([[0., -0.9, -5.], [20., 4.1, 20.], [-20., 4.1, 20.]]),
+        ):
+            depth_map = rasterization.render_depth_map(
+                vertices, self.faces, self.intrinsic, self.extrinsic, self.image_size
+            )
+            visible = rasterization.is_visible_in_depth_map(
+                depth_map, projections.pixels[0], projections.depths[0], projections.in_frustum[0]
+            )
+            ray_casting_visible = ground_truth.calculate_camera_visibility(
+                np.zeros(3), points, TriangleMesh(vertices, self.faces), projections.in_frustum[0]
+            )
+            np.testing.assert_array_equal([0, 0, 1, 1], ray_casting_visible)
+            np.testing.assert_array_equal(ray_casting_visible, visible)
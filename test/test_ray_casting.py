@@ -5,7 +5,7 @@ import numpy as np
 from outdoorar import ray_casting, sphere_sampling
 from outdoorar.constants import MODELS_DIR
 from outdoorar.obj_reader import ObjFileReader
-from outdoorar.ray_casting import Triangle
+from outdoorar.ray_casting import BoundingVolumeHierarchy, Triangle, TriangleMesh
 
 
 class TestRayCasting(TestCase):
@@ -226,5 +226,91 @@ class TestRayCasting(TestCase):
         self.assertEqual(4, np.sum(inside_triangle))
         self.assertEqual(12, np.sum(np.isinf(squared_distances.ravel())))
 
+    def test_triangle_mesh_nearest_hit(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('cube.obj')).geometry
+        points = np.array([[1 / 2, 0, 1 / 2], [1 / 2, 1 / 2, 1 / 2], [-1, 1 / 2, 2]])
+        direction_vectors = sphere_sampling.get_cartesian_coordinates(8**2)
+
+        expected_distances = np.ones((len(points), len(direction_vectors))) * np.inf
+        for face in geometry.faces:
+            triangle = Triangle(*[geometry.vertices[vertex_idx] for vertex_idx in face])
+            for point_idx, point in enumerate(points):
+                _, distance = triangle.does_ray_intersect(point, direction_vectors, 0)
+                expected_distances[point_idx] = np.minimum(expected_distances[point_idx], distance)
+
+        mesh = TriangleMesh.from_geometry(geometry, chunk_size=7)
+        squared_distances, hit_faces = mesh.nearest_hit(
+            points[:, np.newaxis, :], direction_vectors[np.newaxis, :, :]
+        )
+        self.assertEqual((len(points), len(direction_vectors)), squared_distances.shape)
+        np.testing.assert_allclose(expected_distances, squared_distances)
+        np.testing.assert_array_equal(np.isinf(squared_distances), hit_faces == -1)
+
+    def test_triangle_mesh_nearest_hit__for_single_point(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('cube.obj')).geometry
+        mesh = TriangleMesh.from_geometry(geometry)
+        squared_distances, hit_faces = mesh.nearest_hit(
+            np.array([1 / 2, 1 / 2, 3]), np.array([[0, 0, -1], [0, 0, 1]])
+        )
+        np.testing.assert_allclose([4, np.inf], squared_distances)
+        self.assertIn(geometry.faces[hit_faces[0]].tolist(), [[1, 5, 7], [1, 7, 3]])
+        self.assertEqual(-1, hit_faces[1])
+
+    def test_bounding_volume_hierarchy_nearest_hit(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('decimatedMesh_closedHoles_1024.obj')).geometry
+        rng = np.random.default_rng(0)
+        points = geometry.vertices[rng.choice(len(geometry.vertices), 5)] + rng.normal(0, 0.05, (5, 3))
+        direction_vectors = sphere_sampling.get_cartesian_coordinates(
+            16**2, sphere_sampling.SamplingScheme.GOLDEN_SPIRAL
+        )
 
-        
\ No newline at end of file
+        expected_distances, _ = TriangleMesh.from_geometry(geometry).nearest_hit(
+            points[:, np.newaxis, :], direction_vectors[np.newaxis, :, :]
+        )
+        bvh = BoundingVolumeHierarchy.from_geometry(geometry, leaf_size=4, chunk_size=1000)
+        squared_distances, hit_faces = bvh.nearest_hit(
+            points[:, np.newaxis, :], direction_vectors[np.newaxis, :, :]
+        )
+        self.assertEqual(len(geometry.faces), len(bvh))
+        np.testing.assert_array_equal(expected_distances, squared_distances)
+        np.testing.assert_array_equal(np.isinf(squared_distances), hit_faces == -1)
+
+    def test_bounding_volume_hierarchy_any_hit(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('cube.obj')).geometry
+        bvh = BoundingVolumeHierarchy.from_geometry(geometry)
+        point = np.array([1 / 2, 1 / 2, 3])
+        ray_vectors = np.array([[0, 0, -1], [0, 0, -1], [0, 0, 1], [3, 0, 0]])
+        occluded = bvh.any_hit(point, ray_vectors, np.array([5, 3, 100, 100]))
+        np.testing.assert_array_equal([True, False, False, False], occluded)
+
+    def test_triangle_mesh_any_hit(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('decimatedMesh_closedHoles_1024.obj')).geometry
+        mesh = TriangleMesh(geometry.vertices, geometry.faces, chunk_size=500)
+        camera_location = np.array([6.08202209269405, 1.4887606714272859, 1.124454019938587])
+        direction_vectors = geometry.vertices[::7] - camera_location
+        distances = np.sum(np.square(direction_vectors), axis=1)
+
+        z_buffer, _ = mesh.nearest_hit(camera_location, direction_vectors)
+        occluded = mesh.any_hit(camera_location, direction_vectors, distances * 0.99)
+        np.testing.assert_array_equal(z_buffer <= distances * 0.99, occluded)
+        self.assertTrue(np.any(occluded))
+        self.assertFalse(np.all(occluded))
+
+    def test_triangle_mesh_crop_to_segments(self):
+        geometry = ObjFileReader(MODELS_DIR.joinpath('decimatedMesh_closedHoles_1024.obj')).geometry
+        mesh = TriangleMesh.from_geometry(geometry)
+        camera_location = np.array([6.08202209269405, 1.4887606714272859, 1.124454019938587])
+        direction_vectors = geometry.vertices[:40] - camera_location
+        distances = np.sum(np.square(direction_vectors), axis=1)
+
+        cropped_mesh = mesh.crop_to_segments(camera_location, direction_vectors)
+        # the tiles of segments are bounded more tightly than all segments by one box
+        segment_ends = np.vstack([camera_location, geometry.vertices[:40]])
+        in_box = (mesh.face_max >= segment_ends.min(axis=0)) & (mesh.face_min <= segment_ends.max(axis=0))
+        self.assertLess(len(cropped_mesh), np.count_nonzero(np.all(in_box, axis=1)))
+        np.testing.assert_array_equal(
+            mesh.any_hit(camera_location, direction_vectors, distances * 0.99),
+            cropped_mesh.any_hit(camera_location, direction_vectors, distances * 0.99),
+        )
+        _, hit_faces = cropped_mesh.nearest_hit(camera_location, direction_vectors)
+        self.assertTrue(np.all(np.isin(hit_faces[hit_faces >= 0], cropped_mesh.face_ids)))
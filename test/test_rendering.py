@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+import numpy as np
+
+from outdoorar import rendering
+
+
+class TestRendering(TestCase):
+
+    def setUp(self) -> None:
+        self.intrinsic = np.array([[100., 0., 50., 0.], [0., 100., 40., 0.], [0., 0., 1., 0.]])
+        self.extrinsic = np.eye(4)
+
+    def test_get_depths(self):
+        extrinsic = np.eye(4)
+        extrinsic[2, 3] = -1.
+        depths = rendering.get_depths(np.array([[0., 0., 3.], [1., 1., -2.]]), extrinsic)
+        np.testing.assert_array_equal([2., -3.], depths)
+
+    def test_is_inside_frustum(self):
+        points = np.array([
+            [0., 0., 2.],  # in front of the camera, in the image centre
+            [10., 0., 2.],  # outside the image
+            [0., 0., -2.],  # behind the camera
+            [-0.2, -0.2, -1.],  # behind the camera, mirrored into the image by the projection
+        ])
+        inside = rendering.is_inside_frustum(points, self.intrinsic, self.extrinsic, 100, 80)
+        np.testing.assert_array_equal([True, False, False, False], inside)
+        self.assertTrue(rendering.is_inside_image(
+            rendering.get_image_coordinates(points[3:], self.intrinsic, self.extrinsic), 100, 80
+        )[0])
+
+    def test_project_points(self):
+        points = np.array([[0.1, -0.1, 2.], [0.6, 0.6, 1.], [0., 0., -2.]])
+        rotations = np.array([np.eye(3), [[0., -1., 0.], [1., 0., 0.], [0., 0., 1.]]])
+        centers = np.array([[0., 0., 0.], [0., 0., -1.]])
+        extrinsics = rendering.get_extrinsic_matrices(rotations, centers)
+
+        projections = rendering.project_points(points, self.intrinsic, extrinsics, np.array([[100, 80], [60, 80]]))
+        self.assertEqual((2, 3, 2), projections.pixels.shape)
+        for camera, extrinsic in enumerate(extrinsics):
+            expected = np.matmul(self.intrinsic, np.matmul(extrinsic, np.hstack((points, np.ones((3, 1)))).T))
+            np.testing.assert_allclose(expected[:2, :2] / expected[2, :2], projections.pixels[camera, :2].T)
+            np.testing.assert_allclose(expected[2], projections.depths[camera])
+        self.assertTrue(np.all(np.isnan(projections.pixels[:, 2])))
+        np.testing.assert_array_equal([[True, False, False], [True, True, False]], projections.in_frustum)
+        self.assertAlmostEqual(55., projections.pixels[0, 0, 0])
@@ -0,0 +1,66 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+
+from outdoorar import results
+from outdoorar.results import VisibilityResultsWriter
+
+
+class TestVisibilityResults(TestCase):
+
+    def setUp(self) -> None:
+        self.columns = [('BluePolyline', i) for i in range(4)] + [('RedPolyline', i) for i in range(7)]
+        self.rows = {
+            'IMG_1.JPG': np.array([1, 0, 0, 1, 1, 1, 0, 0, 0, 1, 1]),
+            'IMG_2.JPG': np.array([0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]),
+            'IMG_3.JPG': np.array([1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]),
+        }
+
+    def test_append_and_resume(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            results_path = Path(directory).joinpath('results')
+            with VisibilityResultsWriter(results_path, self.columns) as writer:
+                for img_name in ['IMG_1.JPG', 'IMG_2.JPG']:
+                    writer.append(img_name, self.rows[img_name])
+            # a row cut short by a crash
+            rows_path = results_path.joinpath(results.ROWS_FILE_NAME)
+            rows_path.write_bytes(rows_path.read_bytes() + b'\x09\x00IMG_')
+
+            with VisibilityResultsWriter(results_path, self.columns) as writer:
+                self.assertEqual({'IMG_1.JPG', 'IMG_2.JPG'}, writer.completed)
+                writer.append('IMG_3.JPG', self.rows['IMG_3.JPG'])
+
+            names, columns, visibility = results.read_visibility_results(results_path)
+            self.assertEqual(['IMG_1.JPG', 'IMG_2.JPG', 'IMG_3.JPG'], names)
+            self.assertEqual(self.columns, columns)
+            npt.assert_array_equal(np.array([self.rows[name] for name in names]), visibility)
+
+            with self.assertRaises(ValueError):
+                VisibilityResultsWriter(results_path, self.columns[:-1])
+            with VisibilityResultsWriter(results_path, self.columns, resume=False) as writer:
+                self.assertEqual(set(), writer.completed)
+
+    def test_export_csv(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            results_path = Path(directory).joinpath('results')
+            with VisibilityResultsWriter(results_path, self.columns) as writer:
+                for img_name in ['IMG_2.JPG', 'IMG_1.JPG']:
+                    writer.append(img_name, self.rows[img_name])
+            csv_path = Path(directory).joinpath('results.csv')
+            results.export_csv(results_path, csv_path, ['IMG_1.JPG', 'IMG_2.JPG', 'IMG_3.JPG'])
+
+            results_df = pd.read_csv(csv_path, header=[0, 1], index_col=0)
+            self.assertEqual(['IMG_1.JPG', 'IMG_2.JPG', 'IMG_3.JPG'], results_df.index.tolist())
+            self.assertEqual(self.columns, [(polyline, int(idx)) for polyline, idx in results_df.columns])
+            npt.assert_array_equal(self.rows['IMG_1.JPG'], results_df.loc['IMG_1.JPG'].to_numpy())
+            self.assertTrue(results_df.loc['IMG_3.JPG'].isna().all())
+
+            names, columns, visibility = results.read_csv(csv_path)
+            self.assertEqual(['IMG_1.JPG', 'IMG_2.JPG', 'IMG_3.JPG'], names)
+            self.assertEqual(self.columns, columns)
+            npt.assert_array_equal(self.rows['IMG_2.JPG'], visibility[1])
+            self.assertTrue(np.all(np.isnan(visibility[2])))
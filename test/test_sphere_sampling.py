@@ -30,3 +30,47 @@ class TestVisibilityMap(TestCase):
     def test_get_goldern_spiral_cartesian_coordinates(self):
         coords = sphere_sampling.get_golden_spiral_cartesian_coordinates(25)
         self.assertEqual((25, 3), coords.shape)
+
+    def test_get_direction_table(self):
+        table = sphere_sampling.get_direction_table(64, sphere_sampling.SamplingScheme.GOLDEN_SPIRAL)
+        self.assertIs(table, sphere_sampling.get_direction_table(64, sphere_sampling.SamplingScheme.GOLDEN_SPIRAL))
+        self.assertFalse(table.flags.writeable)
+        np.testing.assert_array_equal(
+            sphere_sampling.get_cartesian_coordinates(64, sphere_sampling.SamplingScheme.GOLDEN_SPIRAL), table
+        )
+
+    def test_direction_lookup(self):
+        vectors = np.random.default_rng(0).normal(size=(10000, 3))
+        for sampling_scheme in sphere_sampling.SamplingScheme:
+            for samples in [4, 64, 1024]:
+                direction_vectors = sphere_sampling.get_direction_table(samples, sampling_scheme)
+                direction_lookup = sphere_sampling.DirectionLookup(direction_vectors)
+                np.testing.assert_array_equal(
+                    np.argmax(np.dot(vectors, direction_vectors.T), axis=1), direction_lookup.get_nearest(vectors)
+                )
+                np.testing.assert_array_equal(np.arange(samples), direction_lookup.get_nearest(direction_vectors))
+
+    def test_get_golden_spiral_index(self):
+        vectors = np.random.default_rng(0).normal(size=(10000, 3))
+        # directions near the poles, where the lattice is the most distorted
+        vectors = np.concatenate([vectors, [[0., 1., 0.], [0., -1., 0.], [1e-3, 1., 0.], [0., -1., -1e-3]]])
+        for samples in [2, 3, 25, 100, 1024, 4096]:
+            direction_vectors = sphere_sampling.get_golden_spiral_cartesian_coordinates(samples)
+            np.testing.assert_array_equal(
+                np.argmax(np.dot(vectors, direction_vectors.T), axis=1),
+                sphere_sampling.get_golden_spiral_index(vectors, samples),
+            )
+            np.testing.assert_array_equal(
+                np.arange(samples), sphere_sampling.get_golden_spiral_index(direction_vectors, samples)
+            )
+
+    def test_iter_cartesian_coordinates(self):
+        for sampling_scheme in sphere_sampling.SamplingScheme:
+            coords = sphere_sampling.get_cartesian_coordinates(100, sampling_scheme)
+            blocks = list(sphere_sampling.iter_cartesian_coordinates(100, sampling_scheme, 30, np.float32))
+            self.assertEqual([0, 30, 60, 90], [start for start, _ in blocks])
+            self.assertTrue(all(block.dtype == np.float32 for _, block in blocks))
+            np.testing.assert_array_equal(
+                coords.astype(np.float32), np.concatenate([block for _, block in blocks])
+            )
+            np.testing.assert_allclose(1., np.linalg.norm(coords, axis=1))
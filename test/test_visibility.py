@@ -3,7 +3,7 @@ from unittest import TestCase
 import numpy as np
 import numpy.testing as npt
 
-from outdoorar import visibility
+from outdoorar import sphere_sampling, visibility
 from outdoorar.sphere_sampling import SamplingScheme
 from outdoorar.visibility import Vertex
 
@@ -32,6 +32,9 @@ class TestVisibilityCalculation(TestCase):
         self.eye = [6.08202209269405, 1.4887606714272859, 1.124454019938587]
         self.points = visibility.vertices_to_points(self.vertices)
         self.samples = 4
+        self.equal_angle_algorithms = [
+            visibility.NearestNeighborSelector.EQUAL_SPACING, visibility.NearestNeighborSelector.COSINE_DISTANCE
+        ]
 
     def test_calculate_visibility_index(self):
         points_to_camera_vectors = self.eye - self.points
@@ -45,6 +48,28 @@ class TestVisibilityCalculation(TestCase):
         )
         npt.assert_array_almost_equal(visibility1, visibility2)
 
+    def test_get_visibility_index(self):
+        points_to_camera_vectors = self.eye - self.points
+        points_to_camera_distances = np.sqrt(np.sum(np.square(points_to_camera_vectors), axis=1))
+        for algorithm in self.equal_angle_algorithms:
+            index = visibility.get_visibility_index(
+                points_to_camera_vectors, points_to_camera_distances, self.samples, SamplingScheme.EQUAL_ANGLE,
+                algorithm,
+            )
+            npt.assert_array_equal(
+                visibility.get_visibility_index_equal_sampling(
+                    points_to_camera_vectors, points_to_camera_distances, self.samples
+                ).ravel(),
+                index.ravel(),
+            )
+        # the interpolating selectors have no single nearest direction
+        for algorithm in visibility.INTERPOLATING_SELECTORS:
+            with self.assertRaises(ValueError):
+                visibility.get_visibility_index(
+                    points_to_camera_vectors, points_to_camera_distances, self.samples, SamplingScheme.EQUAL_ANGLE,
+                    algorithm,
+                )
+
     def test_calculate_visibility(self):
         visibility1 = visibility.calculate_visibility(
             self.vertices,
@@ -59,3 +84,113 @@ class TestVisibilityCalculation(TestCase):
             visibility.NearestNeighborSelector.COSINE_DISTANCE,
         )
         npt.assert_array_almost_equal(visibility1, visibility2)
+
+    def test_calculate_points_visibility(self):
+        visibility1 = visibility.calculate_visibility(
+            self.vertices,
+            self.eye,
+            SamplingScheme.EQUAL_ANGLE,
+            visibility.NearestNeighborSelector.COSINE_DISTANCE,
+        )
+        visibility2 = visibility.calculate_points_visibility(
+            self.points,
+            np.array([vertex.visibility_grid for vertex in self.vertices], dtype=np.float32),
+            self.eye,
+            SamplingScheme.EQUAL_ANGLE,
+            visibility.NearestNeighborSelector.COSINE_DISTANCE,
+        )
+        npt.assert_array_equal(visibility1, visibility2)
+
+    def test_visibility_index(self):
+        eyes = np.array([self.eye, [-4., 2., 3.], [1., -5., 0.5]])
+        for algorithm in self.equal_angle_algorithms:
+            visibility_index = visibility.VisibilityIndex.from_vertices(
+                self.vertices, SamplingScheme.EQUAL_ANGLE, algorithm
+            )
+            batch_visibility = visibility_index.calculate_visibility(eyes)
+            self.assertEqual((3, len(self.vertices)), batch_visibility.shape)
+            for eye, eye_visibility in zip(eyes, batch_visibility):
+                npt.assert_array_equal(
+                    visibility.calculate_visibility(self.vertices, eye, SamplingScheme.EQUAL_ANGLE, algorithm),
+                    eye_visibility,
+                )
+                npt.assert_array_equal(visibility_index.calculate_visibility(eye), eye_visibility)
+
+    def test_calculate_visibility_batch(self):
+        eyes = np.random.default_rng(0).normal(scale=5., size=(50, 3))
+        for algorithm in self.equal_angle_algorithms:
+            expected = np.array([
+                visibility.calculate_visibility(self.vertices, eye, SamplingScheme.EQUAL_ANGLE, algorithm)
+                for eye in eyes
+            ])
+            # a small chunk size splits the cosine matrix into many blocks
+            for chunk_size in [1, 7, visibility.DEFAULT_CHUNK_SIZE]:
+                npt.assert_array_equal(
+                    expected,
+                    visibility.calculate_visibility_batch(
+                        self.vertices, eyes, SamplingScheme.EQUAL_ANGLE, algorithm, chunk_size
+                    ),
+                )
+
+    def test_calculate_visibility__fibonacci_lattice(self):
+        eyes = np.random.default_rng(0).normal(scale=5., size=(50, 3))
+        grid = np.random.default_rng(1).uniform(0., 50., size=(len(self.points), 64))
+        npt.assert_array_equal(
+            visibility.VisibilityIndex(
+                self.points, grid, SamplingScheme.GOLDEN_SPIRAL, visibility.NearestNeighborSelector.COSINE_DISTANCE
+            ).calculate_visibility(eyes),
+            visibility.VisibilityIndex(
+                self.points, grid, SamplingScheme.GOLDEN_SPIRAL, visibility.NearestNeighborSelector.FIBONACCI_LATTICE
+            ).calculate_visibility(eyes),
+        )
+        with self.assertRaises(ValueError):
+            visibility.VisibilityIndex(
+                self.points, grid, SamplingScheme.EQUAL_ANGLE, visibility.NearestNeighborSelector.FIBONACCI_LATTICE
+            )
+
+    def test_get_visibility_weights_bilinear(self):
+        samples = 16
+        direction_vectors = sphere_sampling.get_cartesian_coordinates(samples, SamplingScheme.EQUAL_ANGLE)
+        index, weights = visibility.get_visibility_weights_bilinear(
+            direction_vectors, np.ones(samples), samples
+        )
+        # directions of samples get all the weight
+        npt.assert_array_equal(np.arange(samples), index[np.arange(samples), np.argmax(weights, axis=1)])
+        npt.assert_array_almost_equal(np.ones(samples), np.max(weights, axis=1))
+
+        vectors = np.random.default_rng(0).normal(size=(100, 3))
+        index, weights = visibility.get_visibility_weights_bilinear(
+            vectors, np.linalg.norm(vectors, axis=1), samples
+        )
+        npt.assert_array_almost_equal(np.ones(100), np.sum(weights, axis=1))
+        self.assertTrue(np.all((0 <= index) & (index < samples)))
+
+    def test_calculate_visibility__interpolated(self):
+        eyes = np.random.default_rng(0).normal(scale=5., size=(50, 3))
+        nearest = visibility.VisibilityIndex(
+            self.points, self.grid_of(np.inf), SamplingScheme.EQUAL_ANGLE,
+            visibility.NearestNeighborSelector.COSINE_DISTANCE,
+        ).calculate_visibility(eyes)
+        for algorithm in visibility.INTERPOLATING_SELECTORS:
+            # uniform maps give the same visibility however the directions are blended
+            for value in [0., np.inf]:
+                npt.assert_array_equal(
+                    np.full(nearest.shape, value == np.inf),
+                    visibility.VisibilityIndex(
+                        self.points, self.grid_of(value), SamplingScheme.EQUAL_ANGLE, algorithm
+                    ).calculate_visibility(eyes),
+                )
+        # a single nearest neighbor is the cosine distance selector
+        grid = np.random.default_rng(1).uniform(0., 10., size=(len(self.points), 64))
+        npt.assert_array_equal(
+            visibility.VisibilityIndex(
+                self.points, grid, SamplingScheme.GOLDEN_SPIRAL, visibility.NearestNeighborSelector.COSINE_DISTANCE
+            ).calculate_visibility(eyes),
+            visibility.VisibilityIndex(
+                self.points, grid, SamplingScheme.GOLDEN_SPIRAL, visibility.NearestNeighborSelector.K_NEAREST,
+                neighbors=1,
+            ).calculate_visibility(eyes),
+        )
+
+    def grid_of(self, value: float) -> np.ndarray:
+        return np.full((len(self.points), 64), value)
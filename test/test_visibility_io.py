@@ -0,0 +1,54 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import numpy.testing as npt
+
+from outdoorar import visibility, visibility_io
+from outdoorar.constants import get_visibility_dir
+from outdoorar.sphere_sampling import SamplingScheme
+from outdoorar.visibility_io import VisibilityMaps
+
+
+class TestVisibilityIO(TestCase):
+
+    def setUp(self) -> None:
+        self.json_file_path = get_visibility_dir(SamplingScheme.GOLDEN_SPIRAL).joinpath('n_2', 'BluePolyline.json')
+
+    def test_save_and_load(self) -> None:
+        visibility_maps = VisibilityMaps(
+            name='Points',
+            points=np.array([[0., 1., 2.], [3., 4., 5.]]),
+            edges=np.array([[0, 1]]),
+            visibility_grid=np.array([[np.inf, 1., 2.], [0.5, np.inf, 0.]]),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory).joinpath('Points.vis')
+            visibility_io.save(file_path, visibility_maps)
+            for mmap in [True, False]:
+                loaded = visibility_io.load(file_path, mmap=mmap)
+                self.assertEqual('Points', loaded.name)
+                self.assertEqual(3, loaded.samples)
+                self.assertEqual(np.float32, loaded.visibility_grid.dtype)
+                npt.assert_array_equal(visibility_maps.points, loaded.points)
+                npt.assert_array_equal(visibility_maps.edges, loaded.edges)
+                npt.assert_array_equal(visibility_maps.visibility_grid, loaded.visibility_grid)
+                del loaded  # release the memory map before the directory is removed
+
+    def test_load__not_a_visibility_maps_file(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory).joinpath('Points.vis')
+            file_path.write_bytes(b'{"name": "Points"}')
+            with self.assertRaises(ValueError):
+                visibility_io.load(file_path)
+
+    def test_from_json(self) -> None:
+        expected = VisibilityMaps.from_visibility(visibility.from_json(self.json_file_path))
+        visibility_maps = VisibilityMaps.from_json(self.json_file_path)
+
+        self.assertEqual('BluePolyline', visibility_maps.name)
+        self.assertEqual(4, visibility_maps.samples)
+        npt.assert_array_equal(expected.points, visibility_maps.points)
+        npt.assert_array_equal(expected.edges, visibility_maps.edges)
+        npt.assert_array_equal(expected.visibility_grid, visibility_maps.visibility_grid)
@@ -3,15 +3,19 @@
 # Point B: centre of the cube's face
 # Calculate visibility maps for these two points.
 
-from unittest import TestCase
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
 
 import numpy as np
 import numpy.testing as npt
 
-from outdoorar import sphere_sampling
+from outdoorar import sphere_sampling, visibility_io, visibility_map
 from outdoorar.constants import MODELS_DIR
+from outdoorar.geometry import Geometry
 from outdoorar.obj_reader import ObjFileReader
-from outdoorar.ray_casting import Triangle
+from outdoorar.ray_casting import Triangle, TriangleMesh
+from outdoorar.sphere_sampling import SamplingScheme
 
 
 class TestVisibilityMap(TestCase):
@@ -49,3 +53,99 @@ class TestVisibilityMap(TestCase):
         visibility_maps2 = visibility_maps2.reshape(visibility_maps2.shape[:-2]+(-1,), order='F')
 
         npt.assert_array_almost_equal(visibility_maps, visibility_maps2)
+
+    def test_calculate_visibility_maps_for_sample_counts(self):
+        mesh = TriangleMesh.from_geometry(self.geometry)
+        sample_counts = [4**2, self.N**2]
+        visibility_maps = visibility_map.calculate_visibility_maps_for_sample_counts(
+            self.points, mesh, sample_counts, SamplingScheme.EQUAL_ANGLE
+        )
+        for samples in sample_counts:
+            direction_vectors = sphere_sampling.get_cartesian_coordinates(samples)
+            npt.assert_array_equal(
+                visibility_map.calculate_visibility_maps(self.points, mesh, direction_vectors),
+                visibility_maps[samples],
+            )
+
+    def test_build_visibility_maps(self):
+        annotations = {'Points': Geometry('Points', self.points)}
+        sample_counts = [4**2, self.N**2]
+        expected_maps = visibility_map.calculate_visibility_maps_for_sample_counts(
+            self.points, TriangleMesh.from_geometry(self.geometry), sample_counts, SamplingScheme.GOLDEN_SPIRAL
+        )
+        for single_pass in (True, False):
+            visibility_maps = visibility_map.build_visibility_maps(
+                self.geometry,
+                annotations,
+                sample_counts,
+                SamplingScheme.GOLDEN_SPIRAL,
+                points_per_job=3,
+                single_pass=single_pass,
+            )
+            for samples in sample_counts:
+                npt.assert_array_equal(expected_maps[samples], visibility_maps[samples]['Points'])
+
+    def test_build_visibility_maps__checkpoints(self):
+        annotations = {'Points': Geometry('Points', self.points)}
+        sample_counts = [4**2, self.N**2]
+        expected_maps = visibility_map.build_visibility_maps(
+            self.geometry, annotations, sample_counts, SamplingScheme.GOLDEN_SPIRAL
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_dir = Path(directory).joinpath('checkpoints')
+            visibility_map.build_visibility_maps(
+                self.geometry, annotations, sample_counts, SamplingScheme.GOLDEN_SPIRAL, points_per_job=1,
+                checkpoint_dir=checkpoint_dir,
+            )
+            # an interrupted run, which finished only the jobs of the first two points
+            for job in visibility_map.create_visibility_map_jobs(annotations, sample_counts, points_per_job=1)[2:]:
+                checkpoint_dir.joinpath(job.job_id + '.npz').unlink()
+            with mock.patch.object(
+                    visibility_map, 'calculate_visibility_map_job', wraps=visibility_map.calculate_visibility_map_job
+            ) as calculate_job:
+                visibility_maps = visibility_map.build_visibility_maps(
+                    self.geometry, annotations, sample_counts, SamplingScheme.GOLDEN_SPIRAL, points_per_job=1,
+                    checkpoint_dir=checkpoint_dir,
+                )
+            self.assertEqual(2, calculate_job.call_count)
+            for samples in sample_counts:
+                npt.assert_array_equal(expected_maps[samples]['Points'], visibility_maps[samples]['Points'])
+
+            with self.assertRaises(ValueError):
+                visibility_map.build_visibility_maps(
+                    self.geometry, annotations, sample_counts, SamplingScheme.EQUAL_ANGLE, points_per_job=1,
+                    checkpoint_dir=checkpoint_dir,
+                )
+
+    def test_update_visibility_maps(self):
+        annotations = {'Points': Geometry('Points', self.points, edges=[[0, 1], [1, 2], [2, 3]])}
+        # the cube without its first two faces, then with them added back and the third face removed
+        geometries = [
+            Geometry('', self.geometry.vertices, faces=self.geometry.faces[2:]),
+            Geometry(
+                '', self.geometry.vertices, faces=np.concatenate([self.geometry.faces[3:], self.geometry.faces[:2]])
+            ),
+        ]
+        moved_annotations = {'Points': Geometry('Points', self.points + [[0, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 1]])}
+
+        with tempfile.TemporaryDirectory() as directory:
+            def update(geometry, annotations_geometries, visibility_dir=Path(directory)):
+                updates = visibility_map.update_visibility_maps(
+                    geometry, annotations_geometries, [self.N ** 2], SamplingScheme.EQUAL_ANGLE,
+                    visibility_dir=visibility_dir,
+                )
+                maps = visibility_io.load(visibility_dir.joinpath(f'n_{self.N ** 2}', 'Points.vis'), mmap=False)
+                return updates[0], maps
+
+            first_update, _ = update(geometries[0], annotations)
+            self.assertTrue(first_update.rebuilt)
+            self.assertEqual(0, update(geometries[0], annotations)[0].recomputed_rays)
+
+            for geometry, annotations_geometries in [(geometries[1], annotations), (geometries[1], moved_annotations)]:
+                incremental_update, maps = update(geometry, annotations_geometries)
+                self.assertFalse(incremental_update.rebuilt)
+                with tempfile.TemporaryDirectory() as rebuild_directory:
+                    _, expected_maps = update(geometry, annotations_geometries, Path(rebuild_directory))
+                npt.assert_array_equal(expected_maps.visibility_grid, maps.visibility_grid)
+            # only the moved point is cast again
+            self.assertEqual(1, incremental_update.recomputed_points)